@@ -1,9 +1,8 @@
 import os
 import sys
-from datetime import datetime, timedelta
+import argparse
 import pandas as pd
 import logging
-import json
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -11,166 +10,279 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Add the src directory to the Python path
 sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
 
-from data_fetcher import load_config, get_weather_data, get_energy_data, save_to_csv
-from data_processor import process_data
+from data_fetcher import load_config, EIA_ROWS_PER_DAY
+from raw_store import upsert_records, coverage
+from fetch_scheduler import FetchScheduler, FetchJob
+from fetch_planner import SOURCE_KEYS
+from data_processor import process_data_chunked, process_data_hourly, DEFAULT_MEMORY_LIMIT_MB
+from hourly import HOURLY_DATASET_FILE, hourly_mode_enabled, save_hourly_dataset
 from quality_checks import perform_quality_checks
 from analysis import analyze_data
+from pipeline import QUALITY_DATASET_FILE
+import catalog
+import metrics
+from retry_queue import RetryQueue, format_items
 
-FAILED_FETCHES_FILE = os.path.join(os.path.dirname(__file__), 'data', 'raw_responses', 'failed_fetches.json')
-
-def load_failed_fetches():
-    if os.path.exists(FAILED_FETCHES_FILE):
-        with open(FAILED_FETCHES_FILE, 'r') as f:
-            # Convert list of lists back to set of tuples
-            return set(tuple(item) for item in json.load(f))
-    return set()
-
-def save_failed_fetches(failed_fetches):
-    # Ensure the directory exists
-    os.makedirs(os.path.dirname(FAILED_FETCHES_FILE), exist_ok=True)
-    with open(FAILED_FETCHES_FILE, 'w') as f:
-        # Convert set of tuples to list of lists for JSON serialization
-        json.dump(list(failed_fetches), f)
-
-def clear_failed_fetches():
-    if os.path.exists(FAILED_FETCHES_FILE):
-        os.remove(FAILED_FETCHES_FILE)
-        logging.info(f"Cleared failed fetches file: {FAILED_FETCHES_FILE}")
-
-def backfill_historical_data():
-    """Fetches the last 90 days of historical data, processes it, performs quality checks, and statistical analysis."""
+# Default window when no start date is given; overridden by backfill.days in config.yaml
+BACKFILL_DAYS = 90
+# Rows a (city, date) cell needs before it counts as stored; EIA returns one demand row per hour
+COMPLETE_ROWS_PER_DAY = {"weather": 1, "energy": EIA_ROWS_PER_DAY}
+# Missing dates this close together are fetched in one request, re-fetching the stored days between them
+MAX_GAP_DAYS = 7
+# Longest range per fetch job. Each job is written to the raw store as soon as it completes,
+# so an interrupted backfill only loses the jobs in flight.
+MAX_JOB_DAYS = 90
+# Retry-queue items a drain worker leases at a time
+DRAIN_BATCH_SIZE = 100
+
+def open_retry_queue(config):
+    """Opens the retry queue, importing the skip list of older versions the first time."""
+    retry_queue = RetryQueue.from_config(config)
+    retry_queue.import_legacy_failed_fetches()
+    return retry_queue
+
+def get_backfill_dates(start_date=None, end_date=None, days=BACKFILL_DAYS):
+    """Returns the dates from start_date to end_date (YYYY-MM-DD, inclusive), oldest first.
+
+    end_date defaults to today and start_date to `days` days before end_date.
+    """
+    end = pd.Timestamp(end_date) if end_date else pd.Timestamp.now().normalize()
+    start = pd.Timestamp(start_date) if start_date else end - pd.Timedelta(days=days - 1)
+    if start > end:
+        raise ValueError(f"Backfill start date {start.date()} is after end date {end.date()}.")
+    return list(pd.date_range(start, end, freq='D').strftime('%Y-%m-%d'))
+
+def stored_cells(data_type, dates, city_names):
+    """Returns the (city, date) cells of the window that the raw store already holds in full."""
+    index = coverage(data_type, dates[0], dates[-1], city_names)
+    complete = index[index['rows'] >= COMPLETE_ROWS_PER_DAY[data_type]]
+    return set(zip(complete['city'], complete['date'].dt.strftime('%Y-%m-%d')))
+
+def date_runs(dates, max_gap_days=MAX_GAP_DAYS, max_days=MAX_JOB_DAYS):
+    """Groups YYYY-MM-DD dates into (start, end) ranges of at most max_days days.
+
+    Dates separated by at most max_gap_days share a range, trading a few re-fetched days
+    for fewer requests.
+    """
+    runs = []
+    for day in pd.to_datetime(sorted(dates)):
+        if runs and (day - runs[-1][1]).days <= max_gap_days and (day - runs[-1][0]).days < max_days:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return [(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')) for start, end in runs]
+
+def fetch_pending(config, pending_by_job, api_keys, retry_queue):
+    """Fetches the pending dates of each (city name, data type) and records the outcome in the retry queue.
+
+    Pending dates are grouped into date_runs per NOAA station or EIA region rather than per
+    city, so cities sharing one get identical windows that the FetchScheduler fetches once.
+    The requests run concurrently and every page is written to the raw store as it arrives.
+    Once all jobs are done, dates fetched in full leave the queue. Dates a failed request
+    didn't reach, that the API returned nothing for, or returned fewer rows than
+    COMPLETE_ROWS_PER_DAY for, are recorded as failed attempts, so they back off instead
+    of being requested again on every run.
+    """
+    cities = {city['name']: city for city in config["cities"]}
+    dates_by_source = {}
+    for (city_name, data_type), dates in pending_by_job.items():
+        source = (data_type, cities[city_name].get(SOURCE_KEYS[data_type], city_name))
+        dates_by_source.setdefault(source, set()).update(dates)
+    runs_by_source = {source: date_runs(dates) for source, dates in dates_by_source.items()}
+    jobs = []
+    for (city_name, data_type), dates in pending_by_job.items():
+        for start_date, end_date in runs_by_source[(data_type, cities[city_name].get(SOURCE_KEYS[data_type], city_name))]:
+            if any(start_date <= date <= end_date for date in dates):
+                jobs.append(FetchJob(data_type, cities[city_name], start_date, end_date))
+
+    # (city name, data type, start, end) -> rows fetched so far per date; jobs that failed part-way
+    fetched_rows = {}
+    failed = set()
+    with FetchScheduler.from_config(config) as scheduler:
+        # A cache miss during offline replay says nothing about the API, so don't record it
+        replay = scheduler.client.cache is not None and scheduler.client.cache.replay
+        for job, records in scheduler.stream(jobs, api_keys):
+            key = (job.city['name'], job.data_type, job.start_date, job.end_date)
+            rows = fetched_rows.setdefault(key, {})
+            if records is None:
+                failed.add(key)
+                continue
+            days = records['date'].dt.strftime('%Y-%m-%d')
+            wanted = (days.isin(pending_by_job[(job.city['name'], job.data_type)])
+                      & (days >= job.start_date) & (days <= job.end_date))
+            if wanted.any():
+                upsert_records(records[wanted], job.data_type)
+                for date, count in days[wanted].value_counts().items():
+                    rows[date] = rows.get(date, 0) + count
+    if replay:
+        return
+
+    for job in jobs:
+        city_name = job.city['name']
+        key = (city_name, job.data_type, job.start_date, job.end_date)
+        pending = {date for date in pending_by_job[(city_name, job.data_type)]
+                   if job.start_date <= date <= job.end_date}
+        rows = fetched_rows.get(key, {})
+        fetched = {date for date, count in rows.items() if count >= COMPLETE_ROWS_PER_DAY[job.data_type]}
+        retry_queue.remove((city_name, date, job.data_type) for date in fetched)
+        # A failed request may have stopped part-way through a short day as well
+        missing = [(city_name, date, job.data_type) for date in sorted(pending - fetched)]
+        if missing:
+            retry_queue.record_failures(missing, "fetch_failed" if key in failed else "no_data")
+
+def backfill_ranges(config, dates, data_types, api_keys, retry_queue):
+    """Fetches the (city, date) cells of the given data types that the raw store is missing.
+
+    Cells already stored in full are skipped, as are dates whose last failure is still
+    backing off, that another worker has leased, or that have exhausted their attempts. An
+    interrupted or extended backfill therefore only fetches what is still missing.
+    """
+    blocked = retry_queue.blocked_keys()
+    city_names = [city['name'] for city in config["cities"]]
+    pending_by_job = {}
+    for data_type in data_types:
+        stored = stored_cells(data_type, dates, city_names)
+        for city_name in city_names:
+            missing = [date for date in dates if (city_name, date) not in stored]
+            pending = [date for date in missing if (city_name, date, data_type) not in blocked]
+            logging.info(f"{data_type} data for {city_name}: {len(dates) - len(missing)} of {len(dates)} days stored, "
+                         f"{len(pending)} to fetch, {len(missing) - len(pending)} waiting in the retry queue.")
+            if pending:
+                pending_by_job[(city_name, data_type)] = set(pending)
+    fetch_pending(config, pending_by_job, api_keys, retry_queue)
+
+def drain_retry_queue(worker=None, batch_size=DRAIN_BATCH_SIZE):
+    """Retries due items of the queue until none are left. Returns the number of items attempted.
+
+    Several drain workers, in separate processes or on separate hosts sharing the queue
+    file, can run at once: each leases its own batch of items.
+    """
+    config = load_config()
+    api_keys = {
+        "noaa": config["noaa_token"],
+        "eia": config["eia_api_key"]
+    }
+    configured = {city['name'] for city in config["cities"]}
+    attempted = 0
+    with open_retry_queue(config) as retry_queue:
+        while True:
+            keys = retry_queue.claim(batch_size, worker)
+            if not keys:
+                break
+            unknown = [key for key in keys if key[0] not in configured]
+            if unknown:
+                logging.warning(f"Dropping {len(unknown)} queued fetches for cities no longer in config.yaml.")
+                retry_queue.remove(unknown)
+            pending_by_job = {}
+            for city_name, date, data_type in keys:
+                if city_name in configured:
+                    pending_by_job.setdefault((city_name, data_type), set()).add(date)
+            fetch_pending(config, pending_by_job, api_keys, retry_queue)
+            attempted += len(keys) - len(unknown)
+        logging.info(f"Retry queue drained: {attempted} items attempted, {retry_queue.stats()}.")
+    return attempted
+
+def backfill_dates_from_config(config, start_date=None, end_date=None):
+    """Returns the backfill dates, defaulting the window length to backfill.days in config.yaml."""
+    return get_backfill_dates(start_date, end_date, config.get("backfill", {}).get("days", BACKFILL_DAYS))
+
+def backfill_historical_data(start_date=None, end_date=None):
+    """Fetches the missing days of the backfill window, processes them, performs quality checks, and statistical analysis.
+
+    The window defaults to the last backfill.days days. Timings and counters for the run are
+    written to data/metrics even if a step fails.
+    """
+    metrics.reset()
+    try:
+        _backfill_historical_data(start_date, end_date)
+    finally:
+        metrics.write_reports("backfill")
+
+def _backfill_historical_data(start_date, end_date):
     config = load_config()
     api_keys = {
         "noaa": config["noaa_token"],
         "eia": config["eia_api_key"]
     }
     
-    # Clear existing CSVs to ensure fresh data for processing
-    raw_data_path = os.path.join(os.path.dirname(__file__), 'data', 'raw')
-    weather_csv_path = os.path.join(raw_data_path, 'weather_data.csv')
-    energy_csv_path = os.path.join(raw_data_path, 'energy_data.csv')
-    if os.path.exists(weather_csv_path):
-        os.remove(weather_csv_path)
-    if os.path.exists(energy_csv_path):
-        os.remove(energy_csv_path)
-
-    failed_fetches = load_failed_fetches()
-
-    today = datetime.now()
-    for i in range(90):
-        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-        for city in config["cities"]:
-            city_name = city['name']
-            
-            # Check and fetch weather data
-            weather_key = (city_name, date, "weather")
-            if weather_key in failed_fetches:
-                logging.info(f"Skipping weather data for {city_name} on {date} due to previous failure.")
-            else:
-                weather_data = get_weather_data(city, date, api_keys["noaa"])
-                if weather_data:
-                    save_to_csv(weather_data, "weather")
-                else:
-                    failed_fetches.add(weather_key)
-
-            # Check and fetch energy data
-            energy_key = (city_name, date, "energy")
-            if energy_key in failed_fetches:
-                logging.info(f"Skipping energy data for {city_name} on {date} due to previous failure.")
-            else:
-                energy_data = get_energy_data(city, date, api_keys["eia"])
-                if energy_data:
-                    save_to_csv(energy_data, "energy")
-                else:
-                    failed_fetches.add(energy_key)
-    
-    save_failed_fetches(failed_fetches)
+    with metrics.timer("stage", stage="fetch"), open_retry_queue(config) as retry_queue:
+        backfill_ranges(config, backfill_dates_from_config(config, start_date, end_date), ["weather", "energy"],
+                        api_keys, retry_queue)
+
+    # Process and merge the full history within the configured memory budget
+    with metrics.timer("stage", stage="process"):
+        merged_df = process_data_chunked(memory_limit_mb=config.get("processing", {}).get("memory_limit_mb", DEFAULT_MEMORY_LIMIT_MB))
 
-    # Process and merge data
-    merged_df = process_data()
+    hourly = hourly_mode_enabled(config)
+    if hourly:
+        with metrics.timer("stage", stage="hourly"):
+            hourly_df = process_data_hourly()
+        if not hourly_df.empty:
+            save_hourly_dataset(hourly_df)
+            catalog.publish({"hourly_dataset": catalog.describe_artifact(HOURLY_DATASET_FILE, hourly_df)})
 
     # Perform quality checks
     if merged_df is not None:
-        df_with_quality_flags = perform_quality_checks(merged_df)
+        with metrics.timer("stage", stage="quality"):
+            df_with_quality_flags = perform_quality_checks(merged_df)
         
-        # Save the DataFrame with quality flags to processed directory
-        processed_data_path = os.path.join(os.path.dirname(__file__), 'data', 'processed')
-        output_filename = f"merged_with_quality_flags_{pd.Timestamp.now().strftime('%Y%m%d')}.parquet"
-        output_filepath = os.path.join(processed_data_path, output_filename)
-        df_with_quality_flags.to_parquet(output_filepath, index=False)
-        logging.info(f"Merged data with quality flags saved to {output_filepath}")
+        # Replace the quality dataset the pipeline's analyze stage reads
+        tmp_filepath = f"{QUALITY_DATASET_FILE}.tmp"
+        with metrics.timer("write", target="quality_dataset"):
+            df_with_quality_flags.to_parquet(tmp_filepath, index=False)
+            os.replace(tmp_filepath, QUALITY_DATASET_FILE)
+        metrics.record_write("quality_dataset", QUALITY_DATASET_FILE, len(df_with_quality_flags))
+        logging.info(f"Merged data with quality flags saved to {QUALITY_DATASET_FILE}")
+        catalog.publish({"quality_dataset": catalog.describe_artifact(QUALITY_DATASET_FILE, df_with_quality_flags)})
 
         # Perform statistical analysis
-        analyze_data()
+        with metrics.timer("stage", stage="analyze"):
+            analyze_data(input_path=QUALITY_DATASET_FILE, hourly_path=HOURLY_DATASET_FILE if hourly else None)
 
-def backfill_weather_only():
-    """Fetches the last 90 days of weather data for configured cities and saves to CSV."""
+def backfill_weather_only(start_date=None, end_date=None):
+    """Fetches the missing days of weather data in the backfill window into the raw store."""
     config = load_config()
     api_keys = {
         "noaa": config["noaa_token"]
     }
-    raw_data_path = os.path.join(os.path.dirname(__file__), 'data', 'raw')
-    weather_csv_path = os.path.join(raw_data_path, 'weather_data.csv')
-    if os.path.exists(weather_csv_path):
-        os.remove(weather_csv_path)
-    
-    failed_fetches = load_failed_fetches()
-
-    today = datetime.now()
-    for i in range(90):
-        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-        for city in config["cities"]:
-            city_name = city['name']
-            weather_key = (city_name, date, "weather")
-            if weather_key in failed_fetches:
-                logging.info(f"Skipping weather data for {city_name} on {date} due to previous failure.")
-            else:
-                weather_data = get_weather_data(city, date, api_keys["noaa"])
-                if weather_data:
-                    save_to_csv(weather_data, "weather")
-                else:
-                    failed_fetches.add(weather_key)
-    save_failed_fetches(failed_fetches)
-
-def backfill_energy_only():
-    """Fetches the last 90 days of energy data for configured cities and saves to CSV."""
+    with open_retry_queue(config) as retry_queue:
+        backfill_ranges(config, backfill_dates_from_config(config, start_date, end_date), ["weather"], api_keys, retry_queue)
+
+def backfill_energy_only(start_date=None, end_date=None):
+    """Fetches the missing days of energy data in the backfill window into the raw store."""
     config = load_config()
     api_keys = {
         "eia": config["eia_api_key"]
     }
-    raw_data_path = os.path.join(os.path.dirname(__file__), 'data', 'raw')
-    energy_csv_path = os.path.join(raw_data_path, 'energy_data.csv')
-    if os.path.exists(energy_csv_path):
-        os.remove(energy_csv_path)
-    
-    failed_fetches = load_failed_fetches()
-
-    today = datetime.now()
-    for i in range(90):
-        date = (today - timedelta(days=i)).strftime('%Y-%m-%d')
-        for city in config["cities"]:
-            city_name = city['name']
-            energy_key = (city_name, date, "energy")
-            if energy_key in failed_fetches:
-                logging.info(f"Skipping energy data for {city_name} on {date} due to previous failure.")
-            else:
-                energy_data = get_energy_data(city, date, api_keys["eia"])
-                if energy_data:
-                    save_to_csv(energy_data, "energy")
-                else:
-                    failed_fetches.add(energy_key)
-    save_failed_fetches(failed_fetches)
+    with open_retry_queue(config) as retry_queue:
+        backfill_ranges(config, backfill_dates_from_config(config, start_date, end_date), ["energy"], api_keys, retry_queue)
 
 if __name__ == "__main__":
-    import sys
-    if len(sys.argv) > 1:
-        if sys.argv[1] == '--weather-only':
-            backfill_weather_only()
-        elif sys.argv[1] == '--energy-only':
-            backfill_energy_only()
-        elif sys.argv[1] == '--clear-failed-fetches':
-            clear_failed_fetches()
-        else:
-            backfill_historical_data()
+    parser = argparse.ArgumentParser(description="Backfill historical weather and energy data.")
+    parser.add_argument("--start", help="First date of the backfill window (YYYY-MM-DD).")
+    parser.add_argument("--end", help="Last date of the backfill window (YYYY-MM-DD, default today).")
+    action = parser.add_mutually_exclusive_group()
+    action.add_argument("--weather-only", action="store_true", help="Only fetch weather data, without processing.")
+    action.add_argument("--energy-only", action="store_true", help="Only fetch energy data, without processing.")
+    action.add_argument("--drain-retry-queue", nargs="?", const="", metavar="WORKER",
+                        help="Retry due items of the retry queue, optionally naming this worker.")
+    action.add_argument("--retry-queue-status", action="store_true", help="Show the retry queue.")
+    action.add_argument("--clear-retry-queue", action="store_true", help="Remove items from the retry queue.")
+    parser.add_argument("--dead-only", action="store_true", help="With --clear-retry-queue, only remove dead items.")
+    args = parser.parse_args()
+
+    if args.weather_only:
+        backfill_weather_only(args.start, args.end)
+    elif args.energy_only:
+        backfill_energy_only(args.start, args.end)
+    elif args.drain_retry_queue is not None:
+        drain_retry_queue(worker=args.drain_retry_queue or None)
+    elif args.retry_queue_status:
+        with open_retry_queue(load_config()) as retry_queue:
+            print(format_items(retry_queue.items()))
+            print(retry_queue.stats())
+    elif args.clear_retry_queue:
+        with open_retry_queue(load_config()) as retry_queue:
+            logging.info(f"Cleared {retry_queue.clear(dead_only=args.dead_only)} items from the retry queue.")
     else:
-        backfill_historical_data()
\ No newline at end of file
+        backfill_historical_data(args.start, args.end)
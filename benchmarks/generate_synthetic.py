@@ -0,0 +1,96 @@
+import os
+import sys
+import argparse
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from raw_store import upsert_records
+
+REGIONS = ['NYIS', 'PJM', 'ERCO', 'AZPS', 'SCL', 'CISO', 'MISO', 'ISNE', 'SWPP', 'FPL']
+
+def synthetic_cities(n_cities):
+    """Returns n_cities city configs shaped like config.yaml entries, spread over latitudes and regions."""
+    return [{"name": f"City {i:03d}", "region": REGIONS[i % len(REGIONS)], "latitude": 25 + 25 * i / max(1, n_cities - 1)}
+            for i in range(n_cities)]
+
+def generate_weather(cities, start_date, end_date, seed=0):
+    """Returns daily weather rows in the raw store format, with seasonal temperatures and a few gaps."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, end_date, freq='D')
+    day_of_year = dates.dayofyear.to_numpy()
+    frames = []
+    for city in cities:
+        n = len(dates)
+        seasonal = 20 * -np.cos(2 * np.pi * (day_of_year - 15) / 365.25)
+        tmax = 95 - 0.9 * city["latitude"] + seasonal + rng.normal(0, 6, n)
+        frame = pd.DataFrame({
+            'date': dates,
+            'city': city["name"],
+            'tmax_f': tmax.round(1),
+            'tmin_f': (tmax - rng.uniform(10, 25, n)).round(1),
+            'prcp': np.where(rng.random(n) < 0.3, rng.exponential(0.3, n), 0.0).round(2),
+            'snow': np.where(tmax < 35, rng.exponential(1.0, n), 0.0).round(1),
+            'snwd': 0.0,
+            'awnd': rng.gamma(4, 2, n).round(1),
+            'tsun': np.nan,
+            'wdf2': rng.integers(0, 36, n) * 10.0,
+            'wsf2': rng.gamma(6, 3, n).round(1),
+            'timestamp_utc': dates.strftime('%Y-%m-%dT12:00:00Z'),
+        })
+        # About 1% of readings are missing, like real station data
+        frame.loc[rng.random(n) < 0.01, 'tmax_f'] = np.nan
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+def generate_energy(cities, start_date, end_date, hours_per_day=24, seed=0):
+    """Returns hourly demand rows in the raw store format; hours_per_day of each day's 24 hours are kept."""
+    rng = np.random.default_rng(seed + 1)
+    hours = pd.date_range(start_date, pd.Timestamp(end_date) + pd.Timedelta(hours=23), freq='h')
+    hours = hours[np.isin(hours.hour, np.linspace(0, 23, hours_per_day).round().astype(int))]
+    hour_of_day = hours.hour.to_numpy()
+    day_of_year = hours.dayofyear.to_numpy()
+    frames = []
+    for i, city in enumerate(cities):
+        n = len(hours)
+        base = rng.uniform(2000, 20000)
+        seasonal = 1 + 0.25 * np.abs(np.cos(2 * np.pi * (day_of_year - 15) / 365.25))
+        daily = 1 + 0.2 * np.sin(2 * np.pi * (hour_of_day - 9) / 24)
+        demand = base * seasonal * daily * rng.normal(1, 0.05, n)
+        frames.append(pd.DataFrame({
+            'date': hours.normalize(),
+            'city': city["name"],
+            'region': city["region"],
+            'demand_mwh': demand.round(),
+            'timestamp_utc': hours.strftime('%Y-%m-%dT%H:00:00Z'),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+def generate_raw_store(store_path, n_cities, years, hours_per_day=24, end_date=None, seed=0):
+    """Writes synthetic weather and energy data into a raw store at store_path. Returns (weather rows, energy rows)."""
+    end_date = pd.Timestamp(end_date or pd.Timestamp.now().normalize() - pd.Timedelta(days=1))
+    start_date = end_date - pd.DateOffset(years=years) + pd.Timedelta(days=1)
+    cities = synthetic_cities(n_cities)
+    weather_df = generate_weather(cities, start_date, end_date, seed)
+    energy_df = generate_energy(cities, start_date, end_date, hours_per_day, seed)
+    upsert_records(weather_df, 'weather', store_path)
+    upsert_records(energy_df, 'energy', store_path)
+    logging.info(f"Generated {len(weather_df)} weather and {len(energy_df)} energy rows for {n_cities} cities over {years} years.")
+    return len(weather_df), len(energy_df)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic raw data store for benchmarking.")
+    parser.add_argument("--cities", type=int, default=5)
+    parser.add_argument("--years", type=int, default=1)
+    parser.add_argument("--hours-per-day", type=int, default=24, choices=range(1, 25), metavar="1-24")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), '..', 'data', 'synthetic', 'store'),
+                        help="Raw store directory to write (never the real data/raw/store by default).")
+    args = parser.parse_args()
+    generate_raw_store(args.output, args.cities, args.years, args.hours_per_day, seed=args.seed)
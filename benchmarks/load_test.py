@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from data_fetcher import load_config
+import metrics
+from fetch_scheduler import FetchScheduler, FetchJob
+from mock_api_server import MockAPIServer, FaultProfile
+
+def load_test_config(server, n_cities, args):
+    """Returns a pipeline config that points the fetch layer at the mock server, with caching off."""
+    config = load_config()
+    config["api_endpoints"] = server.endpoints()
+    config["response_cache"] = {"mode": "off"}
+    config["fetch"] = {
+        "max_concurrency": args.concurrency,
+        "timeout_seconds": args.timeout,
+        "max_retries": args.retries,
+        "backoff_base_seconds": args.backoff_base,
+        "rate_limits": {api: {"requests_per_second": args.rps, "burst": args.burst} for api in ("noaa", "eia")},
+    }
+    config["cities"] = [{"name": f"City {i:03d}", "noaa_station_id": f"GHCND:MOCK{i:07d}", "eia_region_code": f"R{i:03d}"}
+                        for i in range(n_cities)]
+    return config
+
+def _percentiles(values):
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return {"p50": p50, "p95": p95, "p99": p99, "max": max(values)}
+
+def run_load_test(args):
+    """Fetches every (city, data type) job through the FetchScheduler against the mock server and returns a report."""
+    faults = FaultProfile(args.latency_ms, args.jitter_ms, args.rate_429, args.rate_5xx, args.rate_timeout,
+                          args.stall_seconds, seed=args.seed)
+    server = MockAPIServer(faults=faults).start()
+    config = load_test_config(server, args.cities, args)
+    start_date = datetime(2024, 1, 1)
+    end_date = (start_date + timedelta(days=args.days - 1)).strftime('%Y-%m-%d')
+    start_date = start_date.strftime('%Y-%m-%d')
+    jobs = [FetchJob(data_type, city, start_date, end_date) for city in config["cities"] for data_type in ("weather", "energy")]
+
+    request_latencies = []
+    job_latencies = []
+    lock = threading.Lock()
+
+    def record_response(response, *_, **__):
+        with lock:
+            request_latencies.append(response.elapsed.total_seconds())
+
+    failed_jobs = 0
+    records = 0
+    metrics.reset()
+    started = time.perf_counter()
+    try:
+        with FetchScheduler.from_config(config) as scheduler:
+            for session in scheduler.client.sessions.values():
+                session.hooks["response"].append(record_response)
+            # Planned and batched as in the pipeline's fetch stage; every job is queued up front,
+            # so a job's latency is the time until run() hands over its records
+            for job, result in scheduler.run(jobs, {"noaa": "mock-token", "eia": "mock-key"}):
+                job_latencies.append(time.perf_counter() - started)
+                if result is None:
+                    failed_jobs += 1
+                else:
+                    records += len(result)
+        elapsed = time.perf_counter() - started
+    finally:
+        # Stop serving and release the listening socket, even if the run failed
+        server.shutdown()
+        server.server_close()
+
+    attempts = sum(server.stats.values())
+    counters = metrics.REGISTRY.report("load_test")["counters"]
+    return {
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "elapsed_seconds": elapsed,
+        "jobs": len(jobs),
+        "failed_jobs": failed_jobs,
+        "records": records,
+        "records_per_sec": records / elapsed,
+        "http_requests": attempts,
+        "requests_per_sec": attempts / elapsed,
+        "retries": sum(c['value'] for c in counters if c['name'] == "fetch_retries"),
+        "responses": {f"{api}:{outcome}": count for (api, outcome), count in sorted(server.stats.items())},
+        "request_latency_seconds": _percentiles(request_latencies),
+        "job_latency_seconds": _percentiles(job_latencies),
+        # What the fetch client itself counted, to cross-check against the server's view
+        "client_counters": {f"{c['name']}{c['labels']}": c['value'] for c in counters},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test the fetch layer against a local mock of the NOAA and EIA APIs.")
+    parser.add_argument("--cities", type=int, default=20)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--seed", type=int, default=0)
+    fetch = parser.add_argument_group("fetch settings under test")
+    fetch.add_argument("--concurrency", type=int, default=4)
+    fetch.add_argument("--rps", type=float, default=50, help="Token-bucket requests per second per API.")
+    fetch.add_argument("--burst", type=int, default=10)
+    fetch.add_argument("--timeout", type=float, default=2.0, help="Client timeout per request in seconds.")
+    fetch.add_argument("--retries", type=int, default=5)
+    fetch.add_argument("--backoff-base", type=float, default=0.05)
+    faults = parser.add_argument_group("injected faults")
+    faults.add_argument("--latency-ms", type=float, default=50)
+    faults.add_argument("--jitter-ms", type=float, default=50)
+    faults.add_argument("--rate-429", type=float, default=0.05)
+    faults.add_argument("--rate-5xx", type=float, default=0.02)
+    faults.add_argument("--rate-timeout", type=float, default=0.01)
+    faults.add_argument("--stall-seconds", type=float, default=3.0, help="How long a timed-out request stalls.")
+    parser.add_argument("--output", help="Also write the report to this JSON file.")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL) # Retries are expected; only the report matters
+    report = run_load_test(args)
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,187 @@
+import json
+import time
+import random
+import argparse
+import logging
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+NOAA_PATH = "/cdo-web/api/v2/data"
+EIA_PATH = "/v2/electricity/rto/region-data/data/"
+# Largest pages the real APIs serve
+NOAA_MAX_PAGE_SIZE = 1000
+EIA_MAX_PAGE_SIZE = 5000
+
+class FaultProfile:
+    """Latency and failure injection settings for the mock server.
+
+    Each request waits latency_ms (plus up to jitter_ms) and then, by probability, answers
+    429, a 5xx error, or stalls for timeout_seconds (long enough to trip the client timeout)
+    before answering normally.
+    """
+
+    def __init__(self, latency_ms=50, jitter_ms=50, rate_429=0.0, rate_5xx=0.0, rate_timeout=0.0,
+                 timeout_seconds=5.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.rate_timeout = rate_timeout
+        self.timeout_seconds = timeout_seconds
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def draw(self):
+        """Returns (delay_seconds, outcome) for one request; outcome is "ok", "429", "5xx" or "timeout"."""
+        with self.lock:
+            delay = (self.latency_ms + self.random.uniform(0, self.jitter_ms)) / 1000
+            roll = self.random.random()
+        if roll < self.rate_429:
+            return delay, "429"
+        if roll < self.rate_429 + self.rate_5xx:
+            return delay, "5xx"
+        if roll < self.rate_429 + self.rate_5xx + self.rate_timeout:
+            return delay + self.timeout_seconds, "timeout"
+        return delay, "ok"
+
+def _dates(start_date, end_date):
+    start = datetime.strptime(start_date[:10], '%Y-%m-%d')
+    end = datetime.strptime(end_date[:10], '%Y-%m-%d')
+    while start <= end:
+        yield start
+        start += timedelta(days=1)
+
+def noaa_payload(params, max_page_size=None):
+    """Builds a NOAA CDO /data response with one result per requested station, date and datatype.
+
+    Results are paged by the 1-based offset parameter; max_page_size caps the page below the
+    requested limit, as the real API does beyond its maximum.
+    """
+    datatypes = params.get("datatype", ["TMAX"])[0].split(',')
+    limit = min(int(params.get("limit", ["25"])[0]), max_page_size or NOAA_MAX_PAGE_SIZE)
+    offset = int(params.get("offset", ["1"])[0])
+    stations = params.get("stationid", [""])
+    results = []
+    for day in _dates(params["startdate"][0], params["enddate"][0]):
+        for station in stations:
+            for datatype in datatypes:
+                # Seeded by string so the same request always returns the same values
+                value = round(40 + 40 * random.Random(f"{station}{day:%Y%m%d}{datatype}").random(), 1)
+                results.append({"date": day.strftime('%Y-%m-%dT00:00:00'), "datatype": datatype,
+                                "station": station, "attributes": ",,W,2400", "value": value})
+    return {"metadata": {"resultset": {"offset": offset, "count": len(results), "limit": limit}},
+            "results": results[offset - 1:offset - 1 + limit]}
+
+def eia_payload(params, max_page_size=None):
+    """Builds an EIA region-data response with one demand row per hour of the requested range.
+
+    Rows are paged by the 0-based offset parameter; max_page_size caps the page below the
+    requested length.
+    """
+    region = params.get("facets[respondent][]", [""])[0]
+    length = min(int(params.get("length", ["5000"])[0]), max_page_size or EIA_MAX_PAGE_SIZE)
+    offset = int(params.get("offset", ["0"])[0])
+    data = []
+    for day in _dates(params["start"][0], params["end"][0]):
+        for hour in range(24):
+            data.append({"period": f"{day.strftime('%Y-%m-%d')}T{hour:02d}", "respondent": region,
+                         "respondent-name": region, "type": "D", "type-name": "Demand",
+                         "value": 10000 + 100 * hour, "value-units": "megawatthours"})
+    # The real API reports the total as a string
+    return {"response": {"total": str(len(data)), "dateFormat": "YYYY-MM-DD\"T\"HH24", "frequency": "hourly",
+                         "data": data[offset:offset + length]}}
+
+class MockAPIServer(ThreadingHTTPServer):
+    """Threaded HTTP server emulating the NOAA CDO data and EIA region-data endpoints.
+
+    `stats` counts responses by endpoint and outcome, so callers can derive how many
+    requests were retries.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), faults=None, max_page_size=None):
+        super().__init__(address, MockAPIHandler)
+        self.faults = faults or FaultProfile()
+        self.max_page_size = max_page_size
+        self.stats = Counter()
+        self.stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+    def endpoints(self):
+        """Returns an api_endpoints config section pointing at this server."""
+        return {"noaa": self.base_url + NOAA_PATH, "eia": self.base_url + EIA_PATH}
+
+    def record(self, api, outcome):
+        with self.stats_lock:
+            self.stats[(api, outcome)] += 1
+
+    def start(self):
+        """Serves requests on a background thread and returns self."""
+        threading.Thread(target=self.serve_forever, name="mock-api-server", daemon=True).start()
+        return self
+
+class MockAPIHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path == NOAA_PATH:
+            api, build_payload = "noaa", noaa_payload
+        elif url.path.rstrip('/') == EIA_PATH.rstrip('/'):
+            api, build_payload = "eia", eia_payload
+        else:
+            self._respond(404, {"error": "not found"})
+            return
+
+        delay, outcome = self.server.faults.draw()
+        time.sleep(delay)
+        self.server.record(api, outcome)
+        if outcome == "429":
+            self._respond(429, {"error": "Too Many Requests"})
+        elif outcome == "5xx":
+            self._respond(503, {"error": "Service Unavailable"})
+        else:
+            try:
+                self._respond(200, build_payload(params, self.server.max_page_size))
+            except (KeyError, ValueError) as e:
+                self._respond(400, {"error": f"bad request: {e}"})
+
+    def _respond(self, status, body):
+        payload = json.dumps(body).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except (BrokenPipeError, ConnectionResetError):
+            pass # The client gave up (e.g. it timed out while we stalled)
+
+    def log_message(self, format, *args):
+        pass # Keep load tests quiet
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local mock of the NOAA and EIA APIs.")
+    parser.add_argument("--port", type=int, default=8808)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=50)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-timeout", type=float, default=0.0)
+    parser.add_argument("--timeout-seconds", type=float, default=5.0)
+    parser.add_argument("--max-page-size", type=int, default=None,
+                        help="Serve at most this many results per page, to exercise pagination")
+    args = parser.parse_args()
+    faults = FaultProfile(args.latency_ms, args.jitter_ms, args.rate_429, args.rate_5xx, args.rate_timeout, args.timeout_seconds)
+    server = MockAPIServer(("127.0.0.1", args.port), faults, args.max_page_size)
+    logging.info(f"Mock NOAA endpoint: {server.base_url + NOAA_PATH}")
+    logging.info(f"Mock EIA endpoint: {server.base_url + EIA_PATH}")
+    server.serve_forever()
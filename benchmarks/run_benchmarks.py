@@ -0,0 +1,154 @@
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import logging
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Add the src directory to the Python path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+import hourly
+from analysis import analyze_data
+from data_processor import process_data, process_data_chunked, process_data_hourly
+from quality_checks import perform_quality_checks
+from generate_synthetic import generate_raw_store, synthetic_cities
+
+RESULTS_PATH = os.path.join(os.path.dirname(__file__), 'results')
+DEFAULT_SCALES = "5x1,20x2,50x3"
+# A stage this much slower than the baseline is reported as a regression
+REGRESSION_THRESHOLD = 1.10
+
+def parse_scales(scales):
+    """Parses "CITIESxYEARS,..." into a list of (cities, years) tuples."""
+    return [tuple(int(part) for part in scale.split('x')) for scale in scales.split(',')]
+
+def measure(func):
+    """Runs func twice: once for wall time and once under tracemalloc for peak Python/NumPy memory.
+
+    Returns (result, seconds, peak_mb). Memory allocated by Arrow outside the Python
+    allocator is not traced.
+    """
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+
+    del result
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, peak / (1024 * 1024)
+
+def hourly_stage(store_path):
+    """Builds the hourly dataset from the raw store and its peak, profile and peak-statistics outputs."""
+    hourly_df = process_data_hourly(store_path=store_path)
+    peaks_df = hourly.daily_peaks(hourly_df)
+    return hourly_df, peaks_df, hourly.hourly_profile(hourly_df), hourly.peak_statistics(peaks_df)
+
+def benchmark_scale(n_cities, years, hours_per_day, seed=0):
+    """Generates one synthetic scale in a temporary raw store and benchmarks every stage on it.
+
+    The pipeline's own functions run against the temporary store, and the analysis outputs
+    and catalog snapshots are written next to it, so data/ is never touched.
+    """
+    with tempfile.TemporaryDirectory() as work_path:
+        store_path = os.path.join(work_path, 'store')
+        analytics_path = os.path.join(work_path, 'analytics')
+        catalog_path = os.path.join(work_path, 'catalog')
+        quality_path = os.path.join(work_path, 'quality_dataset.parquet')
+        weather_rows, energy_rows = generate_raw_store(store_path, n_cities, years, hours_per_day, seed=seed)
+        expected_cities = {city["name"] for city in synthetic_cities(n_cities)}
+        scale = {"cities": n_cities, "years": years, "hours_per_day": hours_per_day}
+
+        merged_df, process_seconds, process_peak = measure(lambda: process_data(store_path=store_path))
+        _, chunked_seconds, chunked_peak = measure(lambda: process_data_chunked(store_path=store_path))
+        quality_df, quality_seconds, quality_peak = measure(lambda: perform_quality_checks(merged_df.copy(), expected_cities))
+        quality_df.to_parquet(quality_path, index=False)
+        _, analysis_seconds, analysis_peak = measure(lambda: analyze_data(
+            input_path=quality_path, analytics_data_path=analytics_path, catalog_path=catalog_path))
+        _, hourly_seconds, hourly_peak = measure(lambda: hourly_stage(store_path))
+
+    results = []
+    for stage, rows, seconds, peak in [("process", weather_rows + energy_rows, process_seconds, process_peak),
+                                       ("process_chunked", weather_rows + energy_rows, chunked_seconds, chunked_peak),
+                                       ("quality", len(merged_df), quality_seconds, quality_peak),
+                                       ("analysis", len(quality_df), analysis_seconds, analysis_peak),
+                                       ("hourly", energy_rows, hourly_seconds, hourly_peak)]:
+        results.append({"scale": scale, "stage": stage, "rows": rows, "seconds": seconds,
+                        "rows_per_sec": rows / seconds if seconds else None, "peak_memory_mb": peak})
+        logging.info(f"[{n_cities} cities x {years}y] {stage}: {rows} rows in {seconds:.3f}s "
+                     f"({rows / seconds if seconds else float('inf'):,.0f} rows/s), peak {peak:.1f} MB")
+    return results
+
+def current_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def run_benchmarks(scales, hours_per_day=24, seed=0, output_path=None):
+    """Benchmarks every scale and writes the results JSON. Returns the output file path."""
+    commit = current_commit()
+    report = {
+        "commit": commit,
+        "created_at": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "results": [result for n_cities, years in scales
+                    for result in benchmark_scale(n_cities, years, hours_per_day, seed)],
+    }
+    if output_path is None:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        output_path = os.path.join(RESULTS_PATH, f"{commit}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logging.info(f"Benchmark results saved to {output_path}")
+    return output_path
+
+def compare_results(baseline_path, candidate_path):
+    """Prints the wall-time ratio of each (scale, stage) in candidate vs baseline. Returns True if none regressed."""
+    def load(path):
+        with open(path, 'r') as f:
+            report = json.load(f)
+        return report["commit"], {(json.dumps(r["scale"], sort_keys=True), r["stage"]): r for r in report["results"]}
+
+    baseline_commit, baseline = load(baseline_path)
+    candidate_commit, candidate = load(candidate_path)
+    print(f"Comparing {candidate_commit} against {baseline_commit}")
+    ok = True
+    for key, result in candidate.items():
+        if key not in baseline:
+            continue
+        ratio = result["seconds"] / baseline[key]["seconds"]
+        regressed = ratio > REGRESSION_THRESHOLD
+        ok = ok and not regressed
+        print(f"{key[0]} {key[1]:<9} {baseline[key]['seconds']:8.3f}s -> {result['seconds']:8.3f}s "
+              f"({ratio:5.2f}x){'  REGRESSION' if regressed else ''}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the processing, quality and analysis stages on synthetic data.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help="Comma-separated CITIESxYEARS scales, e.g. 5x1,20x2.")
+    parser.add_argument("--hours-per-day", type=int, default=24, choices=range(1, 25), metavar="1-24")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<commit>_<timestamp>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"),
+                        help="Compare two results files instead of running benchmarks.")
+    args = parser.parse_args()
+    if args.compare:
+        sys.exit(0 if compare_results(*args.compare) else 1)
+    run_benchmarks(parse_scales(args.scales), args.hours_per_day, args.seed, args.output)
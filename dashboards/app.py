@@ -5,30 +5,55 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import os
+import sys
 import json
 from datetime import datetime, date
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from cube import load_cube, slice_cube, summarize, city_statistics, heatmap
+from catalog import current_snapshot, get_snapshot, PROJECT_ROOT, CATALOG_PATH
+from downsample import downsample_lines, sample_scatter
+from data_fetcher import load_config
+
+# Time series charts are drawn this many pixels wide (Streamlit narrows them to fit the page)
+CHART_WIDTH_PX = 1400
+# Points drawn per chart when config.yaml sets no dashboard.max_points_per_chart
+DEFAULT_MAX_POINTS_PER_CHART = 5000
+
+# Catalog the dashboard reads snapshots from; CATALOG_PATH in the environment points it at another one
+DASHBOARD_CATALOG_PATH = os.environ.get("CATALOG_PATH", CATALOG_PATH)
+
 # Set page config
 st.set_page_config(layout="wide", page_title="Weather and Energy Analysis", page_icon="⚡")
 
 # --- Helper Functions to Load Data ---
-@st.cache_data
-def load_all_data():
+# Cached per catalog snapshot: data is only reloaded when the current pointer moves. Only the
+# cube and the small JSON outputs are loaded here; chart rows are read per window on demand.
+@st.cache_data(max_entries=2)
+def load_all_data(snapshot_id, catalog_path=DASHBOARD_CATALOG_PATH):
     analytics_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'analytics')
     processed_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
-
-    # Load merged data with quality flags
-    df = pd.DataFrame()
-    processed_files = [f for f in os.listdir(processed_path) if f.startswith('merged_with_quality_flags_') and f.endswith('.parquet')]
-    if processed_files:
-        latest_processed_file = max(processed_files, key=lambda f: os.path.getmtime(os.path.join(processed_path, f)))
-        df = pd.read_parquet(os.path.join(processed_path, latest_processed_file))
-        df['date'] = pd.to_datetime(df['date'], errors='coerce').dt.date
-        df = df.dropna(subset=['date'])
+    # Resolved by id, not from the live pointer, so what is cached under an id is that snapshot
+    snapshot = get_snapshot(snapshot_id, catalog_path) if snapshot_id else None
+
+    def artifact_path(name, default_path):
+        if snapshot and name in snapshot['artifacts']:
+            return os.path.join(PROJECT_ROOT, snapshot['artifacts'][name]['path'])
+        return default_path
+
+    # Locate merged data with quality flags (scanning for it only if nothing is in the catalog yet)
+    quality_dataset_path = artifact_path('quality_dataset', None)
+    if quality_dataset_path is None:
+        processed_files = [f for f in os.listdir(processed_path) if f.startswith('merged_with_quality_flags') and f.endswith('.parquet')]
+        if processed_files:
+            latest_processed_file = max(processed_files, key=lambda f: os.path.getmtime(os.path.join(processed_path, f)))
+            quality_dataset_path = os.path.join(processed_path, latest_processed_file)
+    if quality_dataset_path and not os.path.exists(quality_dataset_path):
+        quality_dataset_path = None
 
     # Load analytics data
     def load_json_file(filename):
-        filepath = os.path.join(analytics_path, filename)
+        filepath = artifact_path(filename.split('.')[0], os.path.join(analytics_path, filename))
         if os.path.exists(filepath):
             with open(filepath, 'r') as f:
                 return json.load(f)
@@ -38,26 +63,47 @@ def load_all_data():
     summary_stats = load_json_file('summary_stats.json')
     top_cities_by_demand = load_json_file('top_cities_by_demand.json')
 
-    # Load parquet data
-    def load_parquet_file(filename):
-        filepath = os.path.join(analytics_path, filename)
-        if os.path.exists(filepath):
-            return pd.read_parquet(filepath)
-        return pd.DataFrame()
-
-    timeseries_df = load_parquet_file('timeseries.parquet')
-    if not timeseries_df.empty:
-        timeseries_df['date'] = pd.to_datetime(timeseries_df.index, errors='coerce').date
-        timeseries_df = timeseries_df.dropna(subset=['date'])
-
-    heatmap_df = load_parquet_file('heatmap.parquet')
-
-    return df, correlations, timeseries_df, heatmap_df, summary_stats, top_cities_by_demand
+    # Sufficient statistics per month x city x temp range x day type; KPIs, correlations and
+    # the heatmap are merged from slices of it
+    cube_df = load_cube(artifact_path('cube', os.path.join(analytics_path, 'cube.parquet')))
+
+    return quality_dataset_path, correlations, cube_df, summary_stats, top_cities_by_demand
+
+@st.cache_data(max_entries=16)
+def load_window(quality_dataset_path, start, end, cities, columns):
+    """Reads only the given columns of the quality dataset rows in the inclusive [start, end] window and cities."""
+    filters = []
+    if start is not None:
+        filters += [('date', '>=', start), ('date', '<=', end)]
+    if cities:
+        filters.append(('city', 'in', list(cities)))
+    df = pd.read_parquet(quality_dataset_path, columns=list(columns), filters=filters or None)
+    # Keep dates as datetime64 so downsampling stays vectorized
+    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    return df.dropna(subset=['date'])
+
+# Downsampled chart data is cached per (date window, cities, resolution), so re-rendering
+# with the same filters doesn't read the dataset again
+@st.cache_data(max_entries=64)
+def downsampled_timeseries(quality_dataset_path, start, end, cities, column, max_points):
+    """Returns one column of the time series, reduced with LTTB to about max_points points shared by the cities."""
+    rows = load_window(quality_dataset_path, start, end, cities, ('date', 'city', column))
+    return downsample_lines(rows, 'date', column, 'city', max_points)
+
+@st.cache_data(max_entries=64)
+def sampled_scatter_rows(quality_dataset_path, start, end, cities, max_points):
+    """Returns at most max_points merged rows for the scatter plot, sampled per city."""
+    rows = load_window(quality_dataset_path, start, end, cities, ('date', 'city', 'tmax_f', 'tmin_f', 'demand_mwh'))
+    return sample_scatter(rows.dropna(subset=['tmax_f', 'demand_mwh']), max_points, 'city')
 
 # --- Initialize Session State ---
-if 'data_loaded' not in st.session_state:
-    st.session_state.df, st.session_state.correlations, st.session_state.timeseries_df, \
-    st.session_state.heatmap_df, st.session_state.summary_stats, st.session_state.top_cities_by_demand = load_all_data()
+# Reading the small catalog pointer on every rerun is how new pipeline output is noticed
+current = current_snapshot(DASHBOARD_CATALOG_PATH)
+snapshot_id = current['snapshot_id'] if current else None
+if 'data_loaded' not in st.session_state or st.session_state.get('snapshot_id') != snapshot_id:
+    st.session_state.quality_dataset_path, st.session_state.correlations, st.session_state.cube_df, \
+    st.session_state.summary_stats, st.session_state.top_cities_by_demand = load_all_data(snapshot_id)
+    st.session_state.snapshot_id = snapshot_id
     st.session_state.data_loaded = True
 
 # --- Dashboard Layout ---
@@ -69,48 +115,51 @@ with st.sidebar:
     st.image("https://www.eia.gov/todayinenergy/images/2017.03.31/main.png", use_container_width=True)
     st.markdown("<h2 style='text-align: center;'>Filters</h2>", unsafe_allow_html=True)
 
-    # Date Range Filter
-    if not st.session_state.df.empty:
-        min_date = st.session_state.df['date'].min()
-        max_date = st.session_state.df['date'].max()
-        date_range = st.date_input("Select Date Range", value=(min_date, max_date), min_value=min_date, max_value=max_date)
+    # Month Range Filter: the cube holds whole months, so the KPIs and charts cover whole months too
+    cube_df = st.session_state.cube_df
+    if not cube_df.empty:
+        months = cube_df['month'].drop_duplicates().tolist()
+        month_range = st.select_slider("Select Month Range", options=months, value=(months[0], months[-1]),
+                                       format_func=lambda month: month.strftime('%b %Y'))
     else:
-        date_range = st.date_input("Select Date Range", value=(date(2023, 1, 1), date.today()))
+        month_range = ()
 
     # City Multiselect Filter
-    all_cities = st.session_state.df['city'].unique().tolist() if not st.session_state.df.empty else []
+    all_cities = sorted(cube_df['city'].astype(str).unique().tolist()) if not cube_df.empty else []
     selected_cities = st.multiselect("Select Cities", all_cities, default=all_cities)
 
-# --- Filter Data based on Selection ---
-if st.session_state.data_loaded and not st.session_state.df.empty:
-    if len(date_range) == 2:
-        filtered_df = st.session_state.df[(st.session_state.df['date'] >= date_range[0]) & (st.session_state.df['date'] <= date_range[1])]
-        filtered_timeseries_df = st.session_state.timeseries_df[(st.session_state.timeseries_df['date'] >= date_range[0]) & (st.session_state.timeseries_df['date'] <= date_range[1])]
-    else:
-        filtered_df = st.session_state.df
-        filtered_timeseries_df = st.session_state.timeseries_df
+# Every chart draws at most this many points, split across the selected cities by their row counts
+max_points = load_config().get("dashboard", {}).get("max_points_per_chart", DEFAULT_MAX_POINTS_PER_CHART)
 
-    if selected_cities:
-        filtered_df = filtered_df[filtered_df['city'].isin(selected_cities)]
-        filtered_timeseries_df = filtered_timeseries_df[filtered_timeseries_df['city'].isin(selected_cities)]
+# --- Filter Data based on Selection ---
+if st.session_state.data_loaded and not cube_df.empty:
+    range_start = pd.Timestamp(month_range[0])
+    range_end = pd.Timestamp(month_range[1]) + pd.offsets.MonthEnd(0)
+    city_filter = tuple(selected_cities)
+    quality_dataset_path = st.session_state.quality_dataset_path
+
+    # The cube is sorted by month, so the month window is a binary-searched slice
+    filtered_cube = slice_cube(cube_df, range_start, range_end, selected_cities or None)
 else:
     st.warning("No data available to display. Please run the data pipeline first by running `make backfill`.")
-    filtered_df = pd.DataFrame()
-    filtered_timeseries_df = pd.DataFrame()
+    filtered_cube = pd.DataFrame()
 
 # --- Display Sections ---
-if not filtered_df.empty:
+if not filtered_cube.empty:
+    cube_summary = summarize(filtered_cube)
+    cube_city_stats = city_statistics(filtered_cube)
+
     # --- Key Metrics ---
     st.markdown("###  KPIs")
     col1, col2, col3, col4 = st.columns(4)
     with col1:
-        st.metric("Avg. Demand (MWh)", f"{filtered_df['demand_mwh'].mean():,.0f}")
+        st.metric("Avg. Demand (MWh)", f"{cube_summary['demand']['mean']:,.0f}")
     with col2:
-        st.metric("Avg. Max Temp (°F)", f"{filtered_df['tmax_f'].mean():.1f}°F")
+        st.metric("Avg. Max Temp (°F)", f"{cube_summary['tmax']['mean']:.1f}°F")
     with col3:
-        st.metric("Correlation (Tmax vs Demand)", f"{filtered_df.groupby('city').apply(lambda x: x['tmax_f'].corr(x['demand_mwh'])).mean():.2f}")
+        st.metric("Correlation (Tmax vs Demand)", f"{cube_city_stats['pearson_correlation'].mean():.2f}")
     with col4:
-        st.metric("Total Records", f"{len(filtered_df):,}")
+        st.metric("Total Records", f"{cube_summary['rows']:,}")
 
     st.markdown("---_---")
 
@@ -119,33 +168,41 @@ if not filtered_df.empty:
 
     with tab1:
         st.markdown("### 📈 Time Series Analysis")
-        if not filtered_timeseries_df.empty:
-            fig_ts = px.line(filtered_timeseries_df, x='date', y='demand_mwh', color='city', title='Energy Demand Over Time')
-            st.plotly_chart(fig_ts, use_container_width=True)
-
-            fig_temp = px.line(filtered_timeseries_df, x='date', y='tmax_f', color='city', title='Max Temperature Over Time')
-            st.plotly_chart(fig_temp, use_container_width=True)
+        if quality_dataset_path:
+            demand_series = downsampled_timeseries(quality_dataset_path, range_start, range_end, city_filter, 'demand_mwh', max_points)
+            tmax_series = downsampled_timeseries(quality_dataset_path, range_start, range_end, city_filter, 'tmax_f', max_points)
+        if quality_dataset_path and (not demand_series.empty or not tmax_series.empty):
+            fig_ts = px.line(demand_series, x='date', y='demand_mwh', color='city', title='Energy Demand Over Time')
+            st.plotly_chart(fig_ts, width=CHART_WIDTH_PX)
+
+            fig_temp = px.line(tmax_series, x='date', y='tmax_f', color='city', title='Max Temperature Over Time')
+            st.plotly_chart(fig_temp, width=CHART_WIDTH_PX)
         else:
             st.info("No time series data to display for the selected filters.")
 
     with tab2:
         st.markdown("### 🔗 Correlation Analysis")
-        if st.session_state.correlations:
-            corr_df = pd.DataFrame.from_dict(st.session_state.correlations, orient='index')
+        if cube_city_stats['paired_rows'].sum() > 1:
+            corr_df = cube_city_stats.loc[cube_city_stats['paired_rows'] > 1, ['pearson_correlation', 'r_squared']]
             st.dataframe(corr_df)
 
-            st.markdown("#### Scatterplot: Temperature vs. Energy Demand")
-            fig_scatter = px.scatter(filtered_df, x='tmax_f', y='demand_mwh', color='city', hover_data=['date', 'tmin_f'], title='Temperature vs. Energy Demand by City')
-            st.plotly_chart(fig_scatter, use_container_width=True)
+            if quality_dataset_path:
+                st.markdown("#### Scatterplot: Temperature vs. Energy Demand")
+                scatter_rows = sampled_scatter_rows(quality_dataset_path, range_start, range_end, city_filter, max_points)
+                if len(scatter_rows) < cube_city_stats['paired_rows'].sum():
+                    st.caption(f"Showing a sample of {len(scatter_rows):,} of {int(cube_city_stats['paired_rows'].sum()):,} points.")
+                fig_scatter = px.scatter(scatter_rows, x='tmax_f', y='demand_mwh', color='city', hover_data=['date', 'tmin_f'], title='Temperature vs. Energy Demand by City')
+                st.plotly_chart(fig_scatter, width=CHART_WIDTH_PX)
         else:
             st.info("No correlation data available.")
 
     with tab3:
         st.markdown("### 🔥 Heatmap: Average Demand by Temperature Range and Day Type")
-        if not st.session_state.heatmap_df.empty:
-            city_heatmap = st.selectbox("Select City for Heatmap", selected_cities)
+        heatmap_df = heatmap(filtered_cube)
+        if not heatmap_df.empty:
+            city_heatmap = st.selectbox("Select City for Heatmap", heatmap_df.index.get_level_values('city').unique().tolist())
             if city_heatmap:
-                city_heatmap_df = st.session_state.heatmap_df.loc[city_heatmap]
+                city_heatmap_df = heatmap_df.loc[city_heatmap]
                 fig_heatmap = px.imshow(city_heatmap_df, labels=dict(x="Day Type", y="Temperature Range", color="Average Demand (MWh)"), title=f'Average Energy Demand for {city_heatmap}')
                 st.plotly_chart(fig_heatmap, use_container_width=True)
         else:
@@ -153,9 +210,9 @@ if not filtered_df.empty:
 
     with tab4:
         st.markdown("### ✅ Data Quality")
-        st.dataframe(filtered_df.describe())
+        st.dataframe(pd.DataFrame({name: stats for name, stats in cube_summary.items() if name != 'rows'}))
         st.markdown("#### Data Quality Score")
-        st.dataframe(filtered_df[['city', 'data_quality_score']].groupby('city').mean())
+        st.dataframe(cube_city_stats[['quality_mean']].rename(columns={'quality_mean': 'data_quality_score'}))
 
 else:
     st.info("Select filters to view data.")
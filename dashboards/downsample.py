@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+def lttb_indices(x, y, threshold):
+    """Returns the indices of the points Largest-Triangle-Three-Buckets keeps from (x, y).
+
+    x must be increasing. The first and last points are always kept, and each of the
+    threshold - 2 buckets in between contributes the point forming the largest triangle with
+    the previously kept point and the average of the next bucket.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        if i + 2 < len(edges):
+            next_start, next_end = edges[i + 1], max(edges[i + 2], edges[i + 1] + 1)
+            avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        else:
+            avg_x, avg_y = x[n - 1], y[n - 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - avg_x) * (y[start:end] - ay) - (ax - x[start:end]) * (avg_y - ay))
+        previous = start + int(np.argmax(areas))
+        selected[i + 1] = previous
+    return selected
+
+def downsample_lines(df, x_col, y_col, group_col, max_points):
+    """Reduces the groups' lines to about max_points points in total with LTTB, dropping rows where y is missing.
+
+    The budget is split across the groups in proportion to their sizes (see
+    proportional_quotas), but every line keeps at least three points, its ends and one
+    between them, so a short line is never cut to a single dot.
+    """
+    groups = [group.sort_values(x_col) for _, group in df.dropna(subset=[y_col]).groupby(group_col, observed=True, sort=False)]
+    if not groups:
+        return df.iloc[0:0]
+    sizes = np.array([len(group) for group in groups])
+    quotas = np.maximum(proportional_quotas(sizes, max_points), np.minimum(sizes, 3))
+    parts = []
+    for group, quota in zip(groups, quotas):
+        x = group[x_col]
+        if pd.api.types.is_datetime64_any_dtype(x):
+            x = x.astype('int64')
+        parts.append(group.iloc[lttb_indices(x.to_numpy(), group[y_col].to_numpy(), quota)])
+    return pd.concat(parts)
+
+def proportional_quotas(sizes, total):
+    """Splits total among groups in proportion to their sizes, never exceeding total or a group's size.
+
+    Each group gets the floor of its exact share, and the points left over go to the
+    groups with the largest remainders.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    exact = sizes * (total / sizes.sum())
+    quotas = np.floor(exact).astype(np.int64)
+    leftover = int(total - quotas.sum())
+    if leftover > 0:
+        quotas[np.argsort(quotas - exact, kind='stable')[:leftover]] += 1
+    return np.minimum(quotas, sizes)
+
+def sample_scatter(df, max_points, group_col, seed=0):
+    """Returns at most max_points rows, sampled per group in proportion to group size.
+
+    Sampling is seeded, so the same filters always draw the same points.
+    """
+    if len(df) <= max_points:
+        return df
+    rng = np.random.default_rng(seed)
+    groups = [group for _, group in df.groupby(group_col, observed=True, sort=False)]
+    quotas = proportional_quotas([len(group) for group in groups], max_points)
+    parts = [group.iloc[np.sort(rng.choice(len(group), size=quota, replace=False))]
+             for group, quota in zip(groups, quotas) if quota > 0]
+    return pd.concat(parts)
@@ -1,99 +1,349 @@
 import pandas as pd
+import numpy as np
 import os
 import logging
 import json
-from scipy.stats import pearsonr
+
+import catalog
+import data_processor
+import metrics
+import stats_accumulators
+import hourly
+from cube import TEMP_BINS, TEMP_LABELS, DAY_TYPES, KEY_COLUMNS, build_cube, save_cube, load_cube, heatmap as cube_heatmap
+from quality_checks import STALE_AFTER_DAYS
+from schema import apply_compact_schema, log_memory_usage
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def analyze_data():
-    """Performs statistical analysis on the merged and quality-checked data."""
+ANALYTICS_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'analytics')
+# Files written to ANALYTICS_DATA_PATH by analyze_data
+ANALYTICS_FILES = ['correlations.json', 'heatmap.parquet', 'cube.parquet',
+                   'top_cities_by_demand.json', 'summary_stats.json']
+# Written in addition when analyze_data is given an hourly dataset
+HOURLY_ANALYTICS_FILES = ['daily_peaks.parquet', 'hourly_profile.parquet', 'peak_stats.json']
+
+def _grouped_sum(codes, values, n_groups):
+    """Sums values per group code, ignoring rows with a negative code."""
+    valid = codes >= 0
+    return np.bincount(codes[valid], weights=values[valid], minlength=n_groups)
+
+def _grouped_count(codes, n_groups):
+    """Counts rows per group code, ignoring rows with a negative code."""
+    return np.bincount(codes[codes >= 0], minlength=n_groups).astype(float)
+
+def _grouped_mean(codes, values, n_groups):
+    """Mean of the non-null values per group code; NaN for groups without values."""
+    codes = np.where(np.isnan(values), -1, codes)
+    counts = _grouped_count(codes, n_groups)
+    sums = _grouped_sum(codes, values, n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan), counts
+
+def compute_city_aggregates(df):
+    """Computes every per-city aggregate used by the analytics outputs in one grouped pass.
+
+    Rows are factorized into integer city, temperature-range and day-type codes once, and all
+    statistics are vectorized np.bincount reductions over those codes. df must be indexed by date.
+    """
+    city_codes, cities = pd.factorize(df['city'])
+    n_cities = len(cities)
+    tmax = df['tmax_f'].to_numpy(dtype=float)
+    tmin = df['tmin_f'].to_numpy(dtype=float)
+    demand = df['demand_mwh'].to_numpy(dtype=float)
+    weekend = (df.index.dayofweek >= 5).astype(np.int64) # Weekday=0, Weekend=1
+
+    # Per-city demand means
+    demand_mean, _ = _grouped_mean(city_codes, demand, n_cities)
+
+    # Pearson correlation of tmax vs demand per city, over rows where both are present
+    pair_codes = np.where(np.isnan(tmax) | np.isnan(demand), -1, city_codes)
+    pair_counts = _grouped_count(pair_codes, n_cities)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        tmax_pair_mean = _grouped_sum(pair_codes, tmax, n_cities) / pair_counts
+        demand_pair_mean = _grouped_sum(pair_codes, demand, n_cities) / pair_counts
+        safe_codes = np.clip(pair_codes, 0, None)
+        dx = tmax - tmax_pair_mean[safe_codes]
+        dy = demand - demand_pair_mean[safe_codes]
+        sxx = _grouped_sum(pair_codes, dx * dx, n_cities)
+        syy = _grouped_sum(pair_codes, dy * dy, n_cities)
+        sxy = _grouped_sum(pair_codes, dx * dy, n_cities)
+        correlation = sxy / np.sqrt(sxx * syy)
+
+    # Average demand by city, temperature range and day type (heatmap)
+    temp_codes = pd.cut(tmax, bins=TEMP_BINS, labels=False, right=False)
+    temp_codes = np.where(np.isnan(temp_codes), -1, temp_codes).astype(np.int64)
+    n_cells = n_cities * len(TEMP_LABELS) * len(DAY_TYPES)
+    cell_codes = np.where(temp_codes < 0, -1, (city_codes * len(TEMP_LABELS) + temp_codes) * len(DAY_TYPES) + weekend)
+    cell_rows = _grouped_count(cell_codes, n_cells)
+    cell_mean, _ = _grouped_mean(cell_codes, demand, n_cells)
+
+    # Overall and day-type statistics
+    day_type_mean, _ = _grouped_mean(weekend, demand, len(DAY_TYPES))
+    demand_values = demand[~np.isnan(demand)]
+
+    return {
+        "cities": cities,
+        "demand_mean": demand_mean,
+        "pair_counts": pair_counts,
+        "correlation": correlation,
+        "cell_rows": cell_rows,
+        "cell_mean": cell_mean,
+        "day_type_mean": day_type_mean,
+        "day_type_present": _grouped_count(weekend, len(DAY_TYPES)) > 0,
+        "overall_demand_mwh_mean": demand_values.mean() if len(demand_values) else np.nan,
+        "overall_demand_mwh_std": demand_values.std(ddof=1) if len(demand_values) > 1 else np.nan,
+        "overall_tmax_f_mean": np.nanmean(tmax) if (~np.isnan(tmax)).any() else np.nan,
+        "overall_tmin_f_mean": np.nanmean(tmin) if (~np.isnan(tmin)).any() else np.nan,
+    }
+
+def build_heatmap(aggregates):
+    """Builds the (city, temp_range) x day_type table of average demand from the aggregates."""
+    cities = aggregates["cities"]
+    cell_rows = aggregates["cell_rows"].reshape(len(cities), len(TEMP_LABELS), len(DAY_TYPES))
+    cell_mean = aggregates["cell_mean"].reshape(len(cities), len(TEMP_LABELS), len(DAY_TYPES))
+
+    # Only (city, temp_range) pairs that occur in the data get a row, like groupby().unstack()
+    city_idx, temp_idx = np.nonzero(cell_rows.sum(axis=2) > 0)
+    order = np.lexsort((temp_idx, np.asarray(cities)[city_idx]))
+    city_idx, temp_idx = city_idx[order], temp_idx[order]
+    values = cell_mean[city_idx, temp_idx, :]
+    # Day types without rows for a (city, temp_range) pair are filled with 0
+    values = np.where(cell_rows[city_idx, temp_idx, :] > 0, values, 0)
+
+    index = pd.MultiIndex.from_arrays([
+        pd.Index(np.asarray(cities)[city_idx], name='city'),
+        pd.Categorical.from_codes(temp_idx, categories=TEMP_LABELS, ordered=True),
+    ], names=['city', 'temp_range'])
+    # Like unstack(), only day types that occur in some (city, temp_range) group become columns
+    present = np.nonzero(cell_rows.sum(axis=(0, 1)) > 0)[0]
+    columns = pd.Index([DAY_TYPES[i] for i in present], name='day_type')
+    return pd.DataFrame(values[:, present], index=index, columns=columns)
+
+def find_latest_quality_dataset(processed_data_path):
+    """Returns the most recently written merged-with-quality-flags Parquet file, or None."""
+    processed_files = [f for f in os.listdir(processed_data_path) if f.startswith('merged_with_quality_flags') and f.endswith('.parquet')]
+    if not processed_files:
+        return None
+    latest_processed_file = max(processed_files, key=lambda f: os.path.getmtime(os.path.join(processed_data_path, f)))
+    return os.path.join(processed_data_path, latest_processed_file)
+
+def analyze_hourly(hourly_path, analytics_data_path=ANALYTICS_DATA_PATH):
+    """Writes the daily peak, hourly profile and peak statistics outputs from the hourly dataset.
+
+    Returns {artifact name: (path, frame or None)} for the files written, or {} if there is
+    no hourly data.
+    """
+    if not os.path.exists(hourly_path):
+        logging.warning(f"Hourly dataset {hourly_path} not found, skipping hourly analysis.")
+        return {}
+    with metrics.timer("read", target="hourly_dataset"):
+        hourly_df = pd.read_parquet(hourly_path)
+    if hourly_df.empty:
+        logging.warning("Hourly dataset is empty, skipping hourly analysis.")
+        return {}
+    apply_compact_schema(hourly_df)
+    log_memory_usage("analysis_hourly", hourly_df)
+
+    with metrics.timer("analysis_block", block="daily_peaks"):
+        peaks_df = hourly.daily_peaks(hourly_df)
+    with metrics.timer("analysis_block", block="hourly_profile"):
+        profile_df = hourly.hourly_profile(hourly_df)
+    with metrics.timer("analysis_block", block="peak_stats"):
+        peak_stats = hourly.peak_statistics(peaks_df)
+
+    peaks_filepath = os.path.join(analytics_data_path, 'daily_peaks.parquet')
+    profile_filepath = os.path.join(analytics_data_path, 'hourly_profile.parquet')
+    peak_stats_filepath = os.path.join(analytics_data_path, 'peak_stats.json')
+    with metrics.timer("write", target="daily_peaks"):
+        peaks_df.to_parquet(peaks_filepath, index=False)
+    with metrics.timer("write", target="hourly_profile"):
+        profile_df.to_parquet(profile_filepath, index=False)
+    with open(peak_stats_filepath, 'w') as f:
+        json.dump(peak_stats, f, indent=2)
+    logging.info(f"Hourly peak and profile analysis saved to {analytics_data_path}")
+    return {
+        "daily_peaks": (peaks_filepath, peaks_df),
+        "hourly_profile": (profile_filepath, profile_df),
+        "peak_stats": (peak_stats_filepath, None),
+    }
+
+def _read_months(path, months):
+    """Reads the rows of the given months ('YYYY-MM') from a Parquet dataset, pushing the date ranges down to the reader."""
+    periods = [pd.Period(month, freq='M') for month in sorted(months)]
+    filters = [[('date', '>=', period.start_time), ('date', '<', (period + 1).start_time)] for period in periods]
+    return pd.read_parquet(path, filters=filters)
+
+def _recent_months(watermarks):
+    """Returns the months whose quality flags may have changed since the last run by ageing alone.
+
+    Rows turn stale STALE_AFTER_DAYS after their timestamp (see quality_checks.check_stale),
+    so the months from a day more than that before the last run up to today are rebuilt
+    with the changes.
+    """
+    last_run = max((ts for cities in watermarks.values() for ts in cities.values()), default=None)
+    if last_run is None:
+        return set()
+    if last_run.tzinfo is not None:
+        last_run = last_run.tz_convert(None)
+    start = last_run.normalize() - pd.Timedelta(days=STALE_AFTER_DAYS + 1)
+    return set(pd.period_range(start, pd.Timestamp.now(), freq='M').strftime('%Y-%m'))
+
+def analyze_data(incremental=False, input_path=None, hourly_path=None, analytics_data_path=ANALYTICS_DATA_PATH,
+                 catalog_path=catalog.CATALOG_PATH):
+    """Performs statistical analysis on the merged and quality-checked data.
+
+    input_path is the quality-checked Parquet file to analyze; by default the current
+    snapshot's quality dataset from the catalog is used. The outputs are published to the
+    catalog as a new snapshot.
+    With incremental=True, only the months with raw rows ingested since the last analysis
+    (up to the watermarks of the processed dataset, see data_processor.changed_months) are
+    read. Those months are replaced in the persisted statistics accumulators and in the
+    cube, and correlations, summary statistics and the heatmap are derived from those
+    alone. Without accumulators from an earlier run, or with incremental=False, everything
+    is recomputed from the full history and the accumulators are rebuilt.
+    If hourly_path names an hourly dataset, the hourly outputs of analyze_hourly are written
+    and published as well. Outputs and the accumulator state go to analytics_data_path, and
+    the snapshot to the catalog at catalog_path.
+    """
     processed_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
-    analytics_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'analytics')
-    
+    state_path = os.path.join(analytics_data_path, 'state', os.path.basename(stats_accumulators.STATE_FILE))
+    # The processing watermarks the accumulators and cube are current to
+    watermarks_path = os.path.join(analytics_data_path, 'state', 'watermarks.json')
+    cube_filepath = os.path.join(analytics_data_path, 'cube.parquet')
+
     if not os.path.exists(analytics_data_path):
         os.makedirs(analytics_data_path)
 
-    # Find the latest processed parquet file
-    processed_files = [f for f in os.listdir(processed_data_path) if f.startswith('merged_with_quality_flags_') and f.endswith('.parquet')]
-    if not processed_files:
+    if input_path is None:
+        # Files written before the catalog existed are only found by scanning the directory
+        input_path = catalog.current_artifact_path('quality_dataset', catalog_path) or find_latest_quality_dataset(processed_data_path)
+    if input_path is None or not os.path.exists(input_path):
         logging.error("No processed data found. Please run the pipeline first.")
         return
-    latest_processed_file = max(processed_files, key=lambda f: os.path.getmtime(os.path.join(processed_data_path, f)))
-    df = pd.read_parquet(os.path.join(processed_data_path, latest_processed_file))
 
     logging.info("Starting statistical analysis...")
+    processed_watermarks = data_processor.load_watermarks()
+    accumulator_state = stats_accumulators.load_state(state_path) if incremental else {}
+    # Without processing watermarks the changed months can't be told apart
+    if incremental and not (accumulator_state and any(processed_watermarks.values())
+                            and os.path.exists(watermarks_path) and os.path.exists(cube_filepath)):
+        logging.info("No statistics accumulators found, computing statistics from the full history.")
+        incremental = False
 
-    # Ensure date column is datetime and set as index for time series analysis
-    df['date'] = pd.to_datetime(df['date'])
-    df = df.set_index('date').sort_index()
-
-    # --- Correlation Analysis (Temperature vs. Demand) ---
-    correlations = {}
-    for city in df['city'].unique():
-        city_df = df[df['city'] == city].dropna(subset=['tmax_f', 'demand_mwh'])
-        if len(city_df) > 1:
-            corr, _ = pearsonr(city_df['tmax_f'], city_df['demand_mwh'])
-            r_squared = corr**2
-            correlations[city] = {
-                "pearson_correlation": corr,
-                "r_squared": r_squared
-            }
-    
-    correlations_filepath = os.path.join(analytics_data_path, 'correlations.json')
-    with open(correlations_filepath, 'w') as f:
-        json.dump(correlations, f, indent=2)
-    logging.info(f"Correlation analysis saved to {correlations_filepath}")
+    if incremental:
+        analyzed_watermarks = data_processor.load_watermarks(watermarks_path)
+        months = data_processor.changed_months(analyzed_watermarks, processed_watermarks) | _recent_months(analyzed_watermarks)
+        with metrics.timer("read", target="quality_dataset"):
+            df = _read_months(input_path, months)
+        logging.info(f"Analyzing {len(df)} rows of {len(months)} changed months.")
+        apply_compact_schema(df)
+        df = df.set_index('date').sort_index()
+
+        with metrics.timer("analysis_block", block="correlations"):
+            accumulator_state = stats_accumulators.update_state(accumulator_state, df, months)
+            correlations = stats_accumulators.correlations_from_state(accumulator_state)
+            summary_stats = stats_accumulators.summary_stats_from_state(accumulator_state)
+        demand_by_city = pd.Series(summary_stats["demand_by_city"], dtype=float)
+
+        with metrics.timer("analysis_block", block="cube"):
+            previous_cube = load_cube(cube_filepath)
+            kept = previous_cube[~stats_accumulators.month_keys(previous_cube['month']).isin(months)]
+            cube_df = pd.concat([kept.astype({'city': str}), build_cube(df).astype({'city': str})], ignore_index=True)
+            cube_df = cube_df.sort_values(KEY_COLUMNS, kind='stable').reset_index(drop=True).astype({'city': 'category'})
+        with metrics.timer("analysis_block", block="heatmap"):
+            heatmap_data = cube_heatmap(cube_df)
+    else:
+        with metrics.timer("read", target="quality_dataset"):
+            df = pd.read_parquet(input_path)
+
+        # Ensure date column is datetime and set as index for time series analysis
+        apply_compact_schema(df)
+        log_memory_usage("analysis", df)
+        df = df.set_index('date').sort_index()
+
+        # All per-city statistics below come from this single grouped pass
+        with metrics.timer("analysis_block", block="aggregates"):
+            aggregates = compute_city_aggregates(df)
+        cities = aggregates["cities"]
 
-    # --- Temporal Trend Analysis (Weekly and Seasonal) ---
-    # For time series plotting, we'll save the main DataFrame (or a subset)
-    # Ensure all necessary columns are present for plotting
-    timeseries_df = df[['city', 'tmax_f', 'tmin_f', 'demand_mwh']].copy()
-    timeseries_df['day_of_week'] = timeseries_df.index.dayofweek # Monday=0, Sunday=6
-    timeseries_df['month'] = timeseries_df.index.month
-    timeseries_df['year'] = timeseries_df.index.year
+        # --- Correlation Analysis (Temperature vs. Demand) ---
+        with metrics.timer("analysis_block", block="correlations"):
+            accumulator_state = stats_accumulators.accumulate(df)
+            correlations = {}
+            for i, city in enumerate(cities):
+                if aggregates["pair_counts"][i] > 1:
+                    corr = float(aggregates["correlation"][i])
+                    r_squared = corr**2
+                    correlations[city] = {
+                        "pearson_correlation": corr,
+                        "r_squared": r_squared
+                    }
 
-    timeseries_filepath = os.path.join(analytics_data_path, 'timeseries.parquet')
-    timeseries_df.to_parquet(timeseries_filepath, index=True)
-    logging.info(f"Time series data saved to {timeseries_filepath}")
+        # --- Descriptive statistics ---
+        demand_by_city = pd.Series(aggregates["demand_mean"], index=cities).sort_index()
+        summary_stats = {
+            "overall_demand_mwh_mean": float(aggregates["overall_demand_mwh_mean"]),
+            "overall_demand_mwh_std": float(aggregates["overall_demand_mwh_std"]),
+            "overall_tmax_f_mean": float(aggregates["overall_tmax_f_mean"]),
+            "overall_tmin_f_mean": float(aggregates["overall_tmin_f_mean"]),
+            "demand_by_city": demand_by_city.to_dict(),
+            "demand_weekday_vs_weekend": {day_type: float(mean) for day_type, mean, present
+                                          in zip(DAY_TYPES, aggregates["day_type_mean"], aggregates["day_type_present"])
+                                          if present}
+        }
 
-    # --- Heatmap Dataset Preparation (Average usage grouped by temp range and day) ---
-    # Define temperature ranges
-    temp_bins = [-float('inf'), 50, 60, 70, 80, 90, float('inf')]
-    temp_labels = ['<50°F', '50-60°F', '60-70°F', '70-80°F', '80-90°F', '>90°F']
-    df['temp_range'] = pd.cut(df['tmax_f'], bins=temp_bins, labels=temp_labels, right=False)
+        # --- Heatmap Dataset Preparation (Average usage grouped by temp range and day) ---
+        with metrics.timer("analysis_block", block="heatmap"):
+            heatmap_data = build_heatmap(aggregates)
 
-    # Group by temp_range and day of week (weekday/weekend)
-    df['day_type'] = df.index.dayofweek.map(lambda x: 'Weekend' if x >= 5 else 'Weekday')
-    heatmap_data = df.groupby(['city', 'temp_range', 'day_type'])['demand_mwh'].mean().unstack(fill_value=0)
+        # --- Query cube for the dashboard (sufficient statistics per month x city x temp range x day type) ---
+        with metrics.timer("analysis_block", block="cube"):
+            cube_df = build_cube(df)
+
+    stats_accumulators.save_state(accumulator_state, state_path)
+
+    correlations_filepath = os.path.join(analytics_data_path, 'correlations.json')
+    with open(correlations_filepath, 'w') as f:
+        json.dump(correlations, f, indent=2)
+    logging.info(f"Correlation analysis saved to {correlations_filepath}")
 
     heatmap_filepath = os.path.join(analytics_data_path, 'heatmap.parquet')
-    heatmap_data.to_parquet(heatmap_filepath, index=True)
+    with metrics.timer("write", target="heatmap"):
+        heatmap_data.to_parquet(heatmap_filepath, index=True)
     logging.info(f"Heatmap data saved to {heatmap_filepath}")
 
+    with metrics.timer("write", target="cube"):
+        save_cube(cube_df, cube_filepath)
+
     # --- Top Cities by Energy Consumption ---
-    top_cities_by_demand = df.groupby('city')['demand_mwh'].mean().nlargest(5).to_dict()
+    top_cities_by_demand = demand_by_city.nlargest(5).to_dict()
     top_cities_filepath = os.path.join(analytics_data_path, 'top_cities_by_demand.json')
     with open(top_cities_filepath, 'w') as f:
         json.dump(top_cities_by_demand, f, indent=2)
     logging.info(f"Top cities by demand saved to {top_cities_filepath}")
 
-    # --- Calculated insights and descriptive statistics ---
-    summary_stats = {
-        "overall_demand_mwh_mean": df['demand_mwh'].mean(),
-        "overall_demand_mwh_std": df['demand_mwh'].std(),
-        "overall_tmax_f_mean": df['tmax_f'].mean(),
-        "overall_tmin_f_mean": df['tmin_f'].mean(),
-        "demand_by_city": df.groupby('city')['demand_mwh'].mean().to_dict(),
-        "demand_weekday_vs_weekend": df.groupby('day_type')['demand_mwh'].mean().to_dict()
-    }
-
     summary_stats_filepath = os.path.join(analytics_data_path, 'summary_stats.json')
     with open(summary_stats_filepath, 'w') as f:
         json.dump(summary_stats, f, indent=2)
     logging.info(f"Summary statistics saved to {summary_stats_filepath}")
 
+    # Recorded last, so an interrupted run redoes the same months next time
+    data_processor.save_watermarks(processed_watermarks, watermarks_path)
+
+    artifacts = {
+        "correlations": (correlations_filepath, None),
+        "heatmap": (heatmap_filepath, heatmap_data),
+        "cube": (cube_filepath, cube_df),
+        "top_cities_by_demand": (top_cities_filepath, None),
+        "summary_stats": (summary_stats_filepath, None),
+    }
+    if hourly_path is not None:
+        artifacts.update(analyze_hourly(hourly_path, analytics_data_path))
+    for name, (path, frame) in artifacts.items():
+        metrics.record_write(name, path, None if frame is None else len(frame))
+    catalog.publish({name: catalog.describe_artifact(path, frame) for name, (path, frame) in artifacts.items()}, catalog_path)
+
     logging.info("Statistical analysis completed.")
 
 if __name__ == "__main__":
-    analyze_data()
\ No newline at end of file
+    analyze_data()
@@ -0,0 +1,122 @@
+import os
+import json
+import hashlib
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+CATALOG_PATH = os.path.join(PROJECT_ROOT, 'data', 'catalog')
+MANIFEST_FILE_NAME = 'manifest.json'
+# Small pointer file naming the current snapshot and its artifacts; readers only ever open this
+CURRENT_FILE_NAME = 'current.json'
+# Older snapshots are dropped from the manifest beyond this many
+MAX_SNAPSHOTS = 200
+
+def _checksum(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _write_json_atomic(data, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+@contextmanager
+def _catalog_lock(catalog_path):
+    """Holds an exclusive lock on the catalog, so concurrent publishers never interleave read-modify-write cycles."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(catalog_path, exist_ok=True)
+    with open(os.path.join(catalog_path, f"{MANIFEST_FILE_NAME}.lock"), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def describe_artifact(path, df=None):
+    """Returns the catalog entry for a written file: path, checksum, size and, given its DataFrame, schema, rows and date range."""
+    entry = {
+        "path": os.path.relpath(os.path.abspath(path), os.path.abspath(PROJECT_ROOT)),
+        "sha256": _checksum(path),
+        "bytes": os.path.getsize(path),
+        "written_at": datetime.fromtimestamp(os.path.getmtime(path)).isoformat(),
+    }
+    if df is not None:
+        entry["schema"] = {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+        entry["rows"] = len(df)
+        dates = df['date'] if 'date' in df.columns else (df.index if isinstance(df.index, pd.DatetimeIndex) else None)
+        if dates is not None and len(df):
+            entry["date_range"] = [pd.Timestamp(dates.min()).strftime('%Y-%m-%d'), pd.Timestamp(dates.max()).strftime('%Y-%m-%d')]
+    return entry
+
+def load_manifest(catalog_path=CATALOG_PATH):
+    manifest_file = os.path.join(catalog_path, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_file):
+        return {"snapshots": []}
+    with open(manifest_file, 'r') as f:
+        return json.load(f)
+
+def current_snapshot(catalog_path=CATALOG_PATH):
+    """Returns the current snapshot ({"snapshot_id", "created_at", "artifacts"}), or None if nothing was published."""
+    try:
+        with open(os.path.join(catalog_path, CURRENT_FILE_NAME), 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def get_snapshot(snapshot_id, catalog_path=CATALOG_PATH):
+    """Returns the snapshot with the given id, or None if it is unknown or was dropped from the manifest."""
+    current = current_snapshot(catalog_path)
+    if current and current["snapshot_id"] == snapshot_id:
+        return current
+    return next((snapshot for snapshot in load_manifest(catalog_path)["snapshots"] if snapshot["snapshot_id"] == snapshot_id), None)
+
+def current_artifact_path(name, catalog_path=CATALOG_PATH):
+    """Returns the absolute path of an artifact in the current snapshot, or None."""
+    snapshot = current_snapshot(catalog_path)
+    if not snapshot or name not in snapshot["artifacts"]:
+        return None
+    return os.path.join(PROJECT_ROOT, snapshot["artifacts"][name]["path"])
+
+def publish(artifacts, catalog_path=CATALOG_PATH):
+    """Publishes a new snapshot containing the given artifacts on top of the current ones.
+
+    artifacts maps artifact names to describe_artifact() entries. The snapshot is appended to
+    the manifest first, then the current pointer is swapped atomically, so readers see either
+    the previous snapshot or the new one, never a partially written file. Publishers hold
+    the catalog lock from reading the current snapshot to swapping the pointer, so
+    concurrent publishes neither drop each other's artifacts nor manifest entries.
+    """
+    with _catalog_lock(catalog_path):
+        previous = current_snapshot(catalog_path)
+        merged = dict(previous["artifacts"]) if previous else {}
+        merged.update(artifacts)
+        snapshot = {
+            "snapshot_id": datetime.now().strftime('%Y%m%dT%H%M%S%f'),
+            "created_at": datetime.now().isoformat(),
+            "artifacts": merged,
+        }
+
+        manifest = load_manifest(catalog_path)
+        manifest["snapshots"] = (manifest["snapshots"] + [snapshot])[-MAX_SNAPSHOTS:]
+        _write_json_atomic(manifest, os.path.join(catalog_path, MANIFEST_FILE_NAME))
+        _write_json_atomic(snapshot, os.path.join(catalog_path, CURRENT_FILE_NAME))
+    logging.info(f"Published catalog snapshot {snapshot['snapshot_id']} ({', '.join(sorted(artifacts))}).")
+    return snapshot
@@ -0,0 +1,177 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+CUBE_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'analytics', 'cube.parquet')
+
+# Temperature ranges used for the heatmap
+TEMP_BINS = [-float('inf'), 50, 60, 70, 80, 90, float('inf')]
+TEMP_LABELS = ['<50°F', '50-60°F', '60-70°F', '70-80°F', '80-90°F', '>90°F']
+DAY_TYPES = ['Weekday', 'Weekend']
+# Cube measure prefix -> merged dataset column
+MEASURES = {'demand': 'demand_mwh', 'tmax': 'tmax_f', 'tmin': 'tmin_f', 'quality': 'data_quality_score'}
+KEY_COLUMNS = ['month', 'city', 'temp_range', 'day_type']
+# Per-cell statistics summed when cells are merged; the M2 and co-moment columns are merged in _merge_cells
+ADDITIVE_COLUMNS = ['rows', *[f'{stat}_{name}' for name in MEASURES for stat in ('n', 'sum')],
+                    'n_pair', 'pair_sum_x', 'pair_sum_y']
+
+def month_starts(dates):
+    """Returns the first day of each date's month as datetime64[ns]."""
+    return pd.DatetimeIndex(dates).to_period('M').to_timestamp().as_unit('ns')
+
+def build_cube(df):
+    """Reduces merged rows (indexed by date) to sufficient statistics per month x city x temperature range x day type.
+
+    For every measure the cube holds the count, sum, sum of squared deviations from the cell
+    mean (M2), min and max of the non-null values; for tmax vs demand it holds the paired
+    count, sums, M2s and co-moment. temp_range is the heatmap bin of tmax_f (-1 when tmax_f
+    is missing) and day_type indexes DAY_TYPES. The cube grows with the months covered, not
+    with the rows, and any month/city slice of it merges into the exact statistics of the
+    matching rows (see _merge_cells).
+    """
+    temp_range = pd.cut(df['tmax_f'].to_numpy(dtype=float), bins=TEMP_BINS, labels=False, right=False)
+    tmax = df['tmax_f'].to_numpy(dtype=float)
+    demand = df['demand_mwh'].to_numpy(dtype=float)
+    paired = ~(np.isnan(tmax) | np.isnan(demand))
+    frame = pd.DataFrame({
+        'month': month_starts(df.index),
+        'city': df['city'].to_numpy(),
+        'temp_range': np.where(np.isnan(temp_range), -1, temp_range).astype(np.int8),
+        'day_type': (df.index.dayofweek >= 5).astype(np.int8), # Weekday=0, Weekend=1
+        **{name: df[column].to_numpy(dtype=float) if column in df.columns else np.full(len(df), np.nan)
+           for name, column in MEASURES.items()},
+        'x': np.where(paired, tmax, np.nan),
+        'y': np.where(paired, demand, np.nan),
+    })
+    grouped = frame.groupby(KEY_COLUMNS, sort=True, observed=True)
+    columns = {'rows': grouped.size()}
+    for name in MEASURES:
+        values = grouped[name]
+        columns[f'n_{name}'] = values.count()
+        columns[f'sum_{name}'] = values.sum()
+        columns[f'm2_{name}'] = (values.var(ddof=0) * columns[f'n_{name}']).fillna(0.0)
+        columns[f'min_{name}'] = values.min()
+        columns[f'max_{name}'] = values.max()
+
+    dx = frame['x'] - grouped['x'].transform('mean')
+    dy = frame['y'] - grouped['y'].transform('mean')
+    deviations = frame[KEY_COLUMNS].assign(dxx=dx * dx, dyy=dy * dy, dxy=dx * dy).groupby(KEY_COLUMNS, sort=True, observed=True)
+    columns.update({'n_pair': grouped['x'].count(), 'pair_sum_x': grouped['x'].sum(), 'pair_sum_y': grouped['y'].sum(),
+                    'pair_m2_x': deviations['dxx'].sum(), 'pair_m2_y': deviations['dyy'].sum(),
+                    'pair_c_xy': deviations['dxy'].sum()})
+
+    cube = pd.DataFrame(columns).reset_index()
+    cube['city'] = cube['city'].astype('category')
+    return cube
+
+def save_cube(cube, path=CUBE_FILE):
+    """Atomically writes the cube, sorted by month so readers can slice month ranges with a binary search."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    cube.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    logging.info(f"Query cube with {len(cube)} cells saved to {path}")
+
+def load_cube(path=CUBE_FILE):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_parquet(path)
+
+def slice_cube(cube, start_date=None, end_date=None, cities=None):
+    """Returns the cube cells of the months overlapping an inclusive date window, for a list of cities."""
+    months = cube['month'].to_numpy()
+    lo = np.searchsorted(months, month_starts([start_date])[0].to_datetime64(), side='left') if start_date is not None else 0
+    hi = np.searchsorted(months, month_starts([end_date])[0].to_datetime64(), side='right') if end_date is not None else len(cube)
+    cells = cube.iloc[lo:hi]
+    if cities is not None:
+        cells = cells[cells['city'].isin(cities)]
+    return cells
+
+def _spread(n, means, keys):
+    """Returns n * (cell mean - group mean) per cell, the offset Chan et al.'s merge adds to M2 and co-moments."""
+    total = n.groupby(keys, observed=True).transform('sum')
+    group_mean = (means * n).groupby(keys, observed=True).transform('sum') / total.where(total > 0)
+    return (means - group_mean).where(n > 0, 0.0)
+
+def _merge_cells(cells, by=None):
+    """Merges cube cells into one row of statistics per group of the by columns (one row without by)."""
+    keys = [cells[column] for column in by] if by else [pd.Series(0, index=cells.index)]
+    grouped = cells.groupby(keys, observed=True, sort=True)
+    totals = grouped[ADDITIVE_COLUMNS].sum()
+    for name in MEASURES:
+        n = cells[f'n_{name}']
+        offset = _spread(n, cells[f'sum_{name}'] / n.where(n > 0), keys)
+        totals[f'm2_{name}'] = (cells[f'm2_{name}'] + n * offset * offset).groupby(keys, observed=True).sum()
+        totals[f'min_{name}'] = grouped[f'min_{name}'].min()
+        totals[f'max_{name}'] = grouped[f'max_{name}'].max()
+    n = cells['n_pair']
+    offset_x = _spread(n, cells['pair_sum_x'] / n.where(n > 0), keys)
+    offset_y = _spread(n, cells['pair_sum_y'] / n.where(n > 0), keys)
+    merged = cells[['pair_m2_x', 'pair_m2_y', 'pair_c_xy']].assign(
+        pair_m2_x=cells['pair_m2_x'] + n * offset_x * offset_x,
+        pair_m2_y=cells['pair_m2_y'] + n * offset_y * offset_y,
+        pair_c_xy=cells['pair_c_xy'] + n * offset_x * offset_y)
+    return totals.join(merged.groupby(keys, observed=True).sum())
+
+def _moments(n, total, m2):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(n > 0, total / n, np.nan)
+        std = np.sqrt(np.where(n > 1, m2 / (n - 1), np.nan))
+    return mean, std
+
+def _pearson(n, sx, sy, sxx, syy, sxy):
+    """Pearson correlation from raw sums of x, y, x², y² and xy."""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sy
+        return np.where(n > 1, cov / np.sqrt((n * sxx - sx * sx) * (n * syy - sy * sy)), np.nan)
+
+def _comoment_correlation(n, m2_x, m2_y, c_xy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(n > 1, c_xy / np.sqrt(m2_x * m2_y), np.nan)
+
+def summarize(cells):
+    """Returns count, mean, std, min and max of every measure over a cube slice, plus the row count."""
+    totals = _merge_cells(cells).iloc[0]
+    summary = {"rows": int(totals['rows'])}
+    for name in MEASURES:
+        mean, std = _moments(totals[f'n_{name}'], totals[f'sum_{name}'], totals[f'm2_{name}'])
+        summary[name] = {
+            "count": int(totals[f'n_{name}']),
+            "mean": float(mean),
+            "std": float(std),
+            "min": float(totals[f'min_{name}']) if totals[f'n_{name}'] else float('nan'),
+            "max": float(totals[f'max_{name}']) if totals[f'n_{name}'] else float('nan'),
+        }
+    return summary
+
+def city_statistics(cells):
+    """Returns per-city means of every measure and the tmax vs demand Pearson correlation."""
+    totals = _merge_cells(cells, ['city'])
+    stats = pd.DataFrame(index=totals.index.rename('city'))
+    for name in MEASURES:
+        stats[f'{name}_mean'], _ = _moments(totals[f'n_{name}'], totals[f'sum_{name}'], totals[f'm2_{name}'])
+    stats['pearson_correlation'] = _comoment_correlation(totals['n_pair'], totals['pair_m2_x'], totals['pair_m2_y'],
+                                                         totals['pair_c_xy'])
+    stats['r_squared'] = stats['pearson_correlation'] ** 2
+    stats['paired_rows'] = totals['n_pair']
+    return stats
+
+def heatmap(cells):
+    """Builds the (city, temp_range) x day_type table of average demand, like analysis.build_heatmap."""
+    cells = cells[cells['temp_range'] >= 0]
+    totals = cells.groupby([cells['city'].astype(str).rename('city'), 'temp_range', 'day_type'],
+                           observed=True)[['rows', 'n_demand', 'sum_demand']].sum()
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = (totals['sum_demand'] / totals['n_demand']).where(totals['n_demand'] > 0)
+    # Day types without rows for a (city, temp_range) pair are filled with 0
+    table = means.unstack().where(totals['rows'].unstack().notna(), 0)
+    table.index = pd.MultiIndex.from_arrays([
+        table.index.get_level_values(0),
+        pd.Categorical.from_codes(table.index.get_level_values(1), categories=TEMP_LABELS, ordered=True),
+    ], names=['city', 'temp_range'])
+    table.columns = pd.Index([DAY_TYPES[day_type] for day_type in table.columns], name='day_type')
+    return table
@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+
+import metrics
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+DAG_STATE_FILE = os.path.join(PROJECT_ROOT, 'data', 'processed', 'state', 'pipeline_state.json')
+
+class Stage:
+    """One step of the pipeline DAG.
+
+    `inputs` and `outputs` are file or directory paths. `params` holds any other values the
+    stage's result depends on (e.g. the date being fetched). A stage is skipped when its
+    inputs and params fingerprint the same as on its last successful run and its outputs
+    are still exactly as that run left them. A func that returns False ran but did not
+    finish its work (e.g. some fetches failed); it is not recorded, so it runs again.
+    """
+
+    def __init__(self, name, func, inputs=(), outputs=(), params=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+    def depends_on(self, other):
+        """Returns True if any input of this stage is, contains or lies within an output of other."""
+        return any(_paths_overlap(i, o) for i in self.inputs for o in other.outputs)
+
+def _relative(path):
+    return os.path.relpath(os.path.abspath(path), os.path.abspath(PROJECT_ROOT))
+
+def _paths_overlap(a, b):
+    a, b = os.path.abspath(a), os.path.abspath(b)
+    return a == b or a.startswith(b + os.sep) or b.startswith(a + os.sep)
+
+def _file_digest(path, memo):
+    """Returns the sha256 of a file's content, reusing memo when size and mtime are unchanged."""
+    stat = os.stat(path)
+    key = _relative(path)
+    cached = memo.get(key)
+    if cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+        return cached["sha256"]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    memo[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": digest.hexdigest()}
+    return memo[key]["sha256"]
+
+def fingerprint(path, memo):
+    """Returns a content fingerprint of a file or directory tree, or None if it doesn't exist."""
+    if os.path.isfile(path):
+        return _file_digest(path, memo)
+    if not os.path.isdir(path):
+        return None
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for filename in sorted(files):
+            if filename.endswith('.tmp'):
+                continue
+            file_path = os.path.join(root, filename)
+            digest.update(os.path.relpath(file_path, path).encode('utf-8'))
+            digest.update(_file_digest(file_path, memo).encode('utf-8'))
+    return digest.hexdigest()
+
+def _fingerprints(paths, memo):
+    return {_relative(path): fingerprint(path, memo) for path in paths}
+
+def _params_fingerprint(params):
+    payload = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def load_state(path=DAG_STATE_FILE):
+    if not os.path.exists(path):
+        return {"stages": {}, "files": {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_state(state, path=DAG_STATE_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+def select_stages(stages, start_from=None, only=None):
+    """Returns the stages to run: all of them, those named in `only`, or `start_from` and everything downstream of it."""
+    names = [stage.name for stage in stages]
+    for name in ([start_from] if start_from else []) + list(only or []):
+        if name not in names:
+            raise ValueError(f"Unknown pipeline stage: {name}. Expected one of {names}.")
+    if only:
+        return [stage for stage in stages if stage.name in only]
+    if start_from:
+        selected = [stages[names.index(start_from)]]
+        for stage in stages[names.index(start_from) + 1:]:
+            if any(stage.depends_on(upstream) for upstream in selected):
+                selected.append(stage)
+        return selected
+    return list(stages)
+
+def run_stages(stages, start_from=None, only=None, force=False, state_path=DAG_STATE_FILE):
+    """Runs the selected stages in order, skipping those whose fingerprints are unchanged.
+
+    Stages must be given in dependency order. With force=True every selected stage runs.
+    Returns the names of the stages that actually ran.
+    """
+    state = load_state(state_path)
+    memo = state.setdefault("files", {})
+    ran = []
+    for stage in select_stages(stages, start_from, only):
+        inputs = _fingerprints(stage.inputs, memo)
+        params = _params_fingerprint(stage.params)
+        previous = state["stages"].get(stage.name)
+        if (not force and previous
+                and previous["inputs"] == inputs and previous["params"] == params
+                and all(digest is not None for digest in previous["outputs"].values())
+                and previous["outputs"] == _fingerprints(stage.outputs, memo)):
+            logging.info(f"Skipping stage '{stage.name}': inputs unchanged since {previous['finished_at']}.")
+            metrics.increment("stages_skipped", stage=stage.name)
+            continue
+
+        logging.info(f"Running stage '{stage.name}'...")
+        with metrics.timer("stage", stage=stage.name):
+            complete = stage.func()
+        ran.append(stage.name)
+        if complete is False:
+            logging.warning(f"Stage '{stage.name}' did not complete; it will run again next time.")
+            metrics.increment("stages_incomplete", stage=stage.name)
+            if state["stages"].pop(stage.name, None) is not None:
+                save_state(state, state_path)
+            continue
+
+        state["stages"][stage.name] = {
+            "inputs": inputs,
+            "params": params,
+            "outputs": _fingerprints(stage.outputs, memo),
+            "finished_at": datetime.now().isoformat(),
+        }
+        save_state(state, state_path)
+    return ran
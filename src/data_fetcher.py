@@ -1,12 +1,20 @@
 import requests
+from requests.adapters import HTTPAdapter
 import yaml
 import os
 import logging
+import threading
 import time
 import csv
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
 
+import numpy as np
+import pandas as pd
+
+import metrics
+from response_cache import ResponseCache
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
@@ -19,161 +27,466 @@ def load_config():
     # Override API keys with environment variables if available
     config["noaa_token"] = os.environ.get("NOAA_API_KEY", config.get("noaa_token"))
     config["eia_api_key"] = os.environ.get("EIA_API_KEY", config.get("eia_api_key"))
+
+    # Allow switching the response cache mode (e.g. to offline replay) without editing the file
+    if "RESPONSE_CACHE_MODE" in os.environ:
+        config.setdefault("response_cache", {})["mode"] = os.environ["RESPONSE_CACHE_MODE"]
     
     return config
 
+# NOAA caps a single response at 1000 results and EIA at 5000 rows, so range
+# requests are split into windows that fit in one response.
+NOAA_MAX_RESULTS = 1000
+EIA_MAX_RESULTS = 5000
+# Weather record column filled by each requested NOAA datatype
+WEATHER_DATATYPE_COLUMNS = {
+    'TMAX': 'tmax_f',
+    'TMIN': 'tmin_f',
+    'PRCP': 'prcp',
+    'SNOW': 'snow',
+    'SNWD': 'snwd',
+    'AWND': 'awnd',
+    'TSUN': 'tsun',
+    'WDF2': 'wdf2',
+    'WSF2': 'wsf2',
+}
+NOAA_DATATYPES = list(WEATHER_DATATYPE_COLUMNS)
+WEATHER_COLUMNS = ['date', 'city', *WEATHER_DATATYPE_COLUMNS.values(), 'timestamp_utc']
+ENERGY_COLUMNS = ['date', 'city', 'region', 'demand_mwh', 'timestamp_utc']
+# Column dtypes of parsed frames, matching the raw store schemas; the rest are float64
+RECORD_DTYPES = {
+    'date': 'datetime64[ns]',
+    'city': 'object',
+    'region': 'object',
+    'timestamp_utc': 'datetime64[ns, UTC]',
+}
+# Only the demand (D) series is requested, so EIA returns one row per hour
+EIA_ROWS_PER_DAY = 24
+DEFAULT_POOL_SIZE = 4
+DEFAULT_TIMEOUT_SECONDS = 60
+DEFAULT_MAX_RETRIES = 5
+# Retry n (0-based) waits backoff_base * 2**n seconds plus up to backoff_base of jitter
+DEFAULT_BACKOFF_BASE_SECONDS = 1
+# Most stations packed into one multi-station NOAA request, which keeps URLs short
+DEFAULT_NOAA_MAX_STATIONS = 25
+
+def split_date_range(start_date, end_date, max_days):
+    """Splits an inclusive date range into consecutive (start, end) windows of at most max_days."""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=max_days - 1), end)
+        windows.append((start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d')))
+        start = window_end + timedelta(days=1)
+    return windows
+
+def _days_in(start_date, end_date):
+    """Returns the number of days in an inclusive YYYY-MM-DD range."""
+    return (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+
+def _empty_frame(columns):
+    """Returns an empty frame with the column dtypes of parsed records."""
+    return pd.DataFrame({column: pd.Series(dtype=RECORD_DTYPES.get(column, 'float64')) for column in columns})
+
+def _parse_weather_frames(results, city_configs):
+    """Pivots NOAA results of one or more stations into one weather frame per city, one row per date.
+
+    The fields of all results are read into column arrays at once, and every value is
+    scattered into its (station and date, datatype) cell of a 2-D array in one step instead
+    of dispatching on the datatype of each entry. Each city gets the rows of its station,
+    sorted by date.
+    """
+    if not results:
+        return [_empty_frame(WEATHER_COLUMNS) for _ in city_configs]
+    raw = pd.DataFrame(results, columns=['station', 'date', 'datatype', 'value'])
+    station_codes, stations = pd.factorize(raw['station'].fillna(''))
+    date_codes, dates = pd.factorize(raw['date'].fillna('').str[:10])
+    key_codes, keys = pd.factorize(station_codes.astype(np.int64) * len(dates) + date_codes)
+    column_codes = pd.Index(NOAA_DATATYPES).get_indexer(raw['datatype'])
+
+    # Entries of unknown datatypes still create the row of their date, like missing values
+    known = column_codes >= 0
+    values = np.full((len(keys), len(NOAA_DATATYPES)), np.nan)
+    values[key_codes[known], column_codes[known]] = pd.to_numeric(raw['value'], errors='coerce').to_numpy(dtype=float)[known]
+
+    key_dates = pd.to_datetime(dates[keys % len(dates)], format='%Y-%m-%d')
+    weather_df = pd.DataFrame(values, columns=list(WEATHER_DATATYPE_COLUMNS.values()))
+    weather_df.insert(0, 'date', key_dates.astype('datetime64[ns]'))
+    # Daily observations are stamped at noon UTC of their date
+    weather_df['timestamp_utc'] = (key_dates + pd.Timedelta(hours=12)).tz_localize('UTC').astype('datetime64[ns, UTC]')
+    key_stations = np.asarray(stations)[keys // len(dates)]
+    order = np.argsort(weather_df['date'].to_numpy(), kind='stable')
+    weather_df, key_stations = weather_df.iloc[order].reset_index(drop=True), key_stations[order]
+
+    frames = []
+    for city_config in city_configs:
+        city_df = weather_df[key_stations == city_config['noaa_station_id']].reset_index(drop=True)
+        city_df.insert(1, 'city', city_config['name'])
+        frames.append(city_df[WEATHER_COLUMNS])
+    return frames
+
+def _parse_energy_frame(data, city_name):
+    """Converts EIA hourly rows into an energy frame for a city, parsing the periods in one vectorized step."""
+    if not data:
+        return _empty_frame(ENERGY_COLUMNS)
+    raw = pd.DataFrame(data, columns=['period', 'respondent', 'value'])
+    # Hourly periods are UTC hours such as 2024-01-01T05
+    timestamps = pd.to_datetime(raw['period'], format='%Y-%m-%dT%H', utc=True).astype('datetime64[ns, UTC]')
+    return pd.DataFrame({
+        'date': timestamps.dt.tz_localize(None).dt.normalize(),
+        'city': city_name,
+        'region': raw['respondent'],
+        'demand_mwh': pd.to_numeric(raw['value'], errors='coerce').astype('float64'),
+        'timestamp_utc': timestamps,
+    })
+
+def _concat_frames(frames, columns):
+    """Concatenates parsed frames, or returns an empty frame of the given columns if there are none."""
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return _empty_frame(columns)
+    return pd.concat(frames, ignore_index=True)
+
+def _whole_days(pages, day_of):
+    """Re-cuts pages of date-sorted rows so that no day spans two of them.
+
+    The last day of each page may continue on the next one, so it is held back until the
+    following page (or the end) shows it complete.
+    """
+    held = []
+    for rows in pages:
+        rows = held + rows
+        last_day = day_of(rows[-1])
+        split = len(rows)
+        while split and day_of(rows[split - 1]) == last_day:
+            split -= 1
+        held = rows[split:]
+        if split:
+            yield rows[:split]
+    if held:
+        yield held
+
+def to_records(df):
+    """Converts a parsed weather or energy frame into the record dicts written to the CSV files."""
+    df = df.astype(object).where(df.notna(), None)
+    df['date'] = [date.strftime('%Y-%m-%d') for date in df['date']]
+    df['timestamp_utc'] = [timestamp.strftime('%Y-%m-%dT%H:%M:%SZ') for timestamp in df['timestamp_utc']]
+    return df.to_dict('records')
+
+class FetchError(Exception):
+    """Raised by the page iterators when a request fails for good."""
+
+# How each API reports a page: (rows of the page, total rows of the query, offset of the first row)
+PAGINATION = {
+    "noaa": (lambda payload: payload.get('results') or [],
+             lambda payload: payload.get('metadata', {}).get('resultset', {}).get('count'),
+             1),
+    "eia": (lambda payload: payload.get('response', {}).get('data') or [],
+            lambda payload: payload.get('response', {}).get('total'),
+            0),
+}
+
+class FetcherClient:
+    """Fetches NOAA and EIA data with configuration loaded once and pooled HTTP sessions.
+
+    The client keeps an index of configured cities by name and one keep-alive
+    requests.Session per API endpoint, so repeated calls neither re-read config.yaml
+    nor open a new TCP/TLS connection for every request. Raw responses go through the
+    on-disk ResponseCache when it is enabled.
+    """
+
+    def __init__(self, config=None):
+        self.config = config if config is not None else load_config()
+        self.cities = {c["name"]: c for c in self.config["cities"]}
+        self.endpoints = self.config["api_endpoints"]
+        self.api_keys = {
+            "noaa": self.config.get("noaa_token"),
+            "eia": self.config.get("eia_api_key")
+        }
+        fetch_config = self.config.get("fetch", {})
+        pool_size = fetch_config.get("max_concurrency", DEFAULT_POOL_SIZE)
+        self.timeout = fetch_config.get("timeout_seconds", DEFAULT_TIMEOUT_SECONDS)
+        self.max_retries = fetch_config.get("max_retries", DEFAULT_MAX_RETRIES)
+        self.backoff_base = fetch_config.get("backoff_base_seconds", DEFAULT_BACKOFF_BASE_SECONDS)
+        self.sessions = {api: self._create_session(pool_size) for api in self.endpoints}
+        self.cache = ResponseCache.from_config(self.config)
+
+    @staticmethod
+    def _create_session(pool_size):
+        """Creates a session whose connection pool can serve pool_size concurrent requests."""
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def _backoff(self, attempt):
+        time.sleep(self.backoff_base * 2 ** attempt + random.uniform(0, self.backoff_base))
+
+    def get_city_config(self, city_name):
+        """Returns the configuration of a city, or None if the city is not configured."""
+        city_config = self.cities.get(city_name)
+        if not city_config:
+            logging.warning(f"No config found for city: {city_name}")
+        return city_config
+
+    def _fetch_json(self, api, url, params=None, headers=None, description="data", rate_limiter=None,
+                    end_date=None, is_complete=None):
+        """Performs a GET request with retries and returns the decoded JSON body, or None on failure.
+
+        Responses are served from and stored in the response cache when it is enabled; end_date
+        is the last day covered by the request and decides whether the response is final. A
+        response is only cached as final if is_complete (when given) accepts the payload, so
+        empty or short answers for old windows expire after the normal TTL and are fetched
+        again. In replay mode a cache miss returns None without touching the network. If a
+        rate_limiter is given, a token is acquired from it before every attempt.
+        """
+        api_name = api.upper()
+        if self.cache is not None:
+            payload = self.cache.get(url, params)
+            if payload is not None:
+                logging.info(f"Serving {description} from response cache")
+                metrics.increment("fetch_cache_hits", api=api)
+                return payload
+            if self.cache.replay:
+                logging.warning(f"No cached response for {description} in replay mode")
+                return None
+
+        session = self.sessions[api]
+        retries = self.max_retries
+        for i in range(retries):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            if i > 0:
+                metrics.increment("fetch_retries", api=api)
+            try:
+                with metrics.timer("fetch_request", api=api):
+                    response = session.get(url, params=params, headers=headers, timeout=self.timeout)
+                response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
+                payload = response.json()
+                metrics.increment("fetch_requests", api=api, outcome="ok")
+                metrics.increment("fetch_response_bytes", len(response.content), api=api)
+                if self.cache is not None:
+                    immutable = (end_date is not None and self.cache.is_immutable(end_date)
+                                 and (is_complete is None or is_complete(payload)))
+                    self.cache.put(url, params, payload, immutable=immutable)
+                return payload
+            except requests.exceptions.HTTPError as e:
+                metrics.increment("fetch_requests", api=api, outcome=str(e.response.status_code))
+                if e.response.status_code == 401:
+                    logging.error(f"Authentication error for {api_name} API. Check your API key: {e}")
+                    return None # No point in retrying if authentication fails
+                elif e.response.status_code == 404:
+                    logging.warning(f"{api_name} API endpoint not found: {e}")
+                    return None
+                elif e.response.status_code == 429:
+                    logging.warning(f"Rate limit exceeded for {api_name} API. Retrying in {self.backoff_base * 2 ** i} seconds... ({e})")
+                else:
+                    logging.error(f"HTTP error fetching {description} on attempt {i+1}/{retries}: {e}")
+                self._backoff(i) # Exponential backoff with jitter
+            except requests.exceptions.ConnectionError as e:
+                metrics.increment("fetch_requests", api=api, outcome="connection_error")
+                logging.error(f"Network connection error for {api_name} API on attempt {i+1}/{retries}: {e}")
+                self._backoff(i)
+            except requests.exceptions.Timeout as e:
+                metrics.increment("fetch_requests", api=api, outcome="timeout")
+                logging.error(f"Timeout error for {api_name} API on attempt {i+1}/{retries}: {e}")
+                self._backoff(i)
+            except requests.exceptions.RequestException as e:
+                metrics.increment("fetch_requests", api=api, outcome="error")
+                logging.error(f"An unexpected error occurred with {api_name} API on attempt {i+1}/{retries}: {e}")
+                self._backoff(i)
+        logging.error(f"Failed to fetch {description} after {retries} retries.")
+        metrics.increment("fetch_failures", api=api)
+        return None
+
+    def _iter_pages(self, api, params, headers=None, description="data", rate_limiter=None, end_date=None,
+                    expected_rows=None):
+        """Yields the rows of each page of a query, following offsets until the reported total is read.
+
+        The first page is requested without an offset, so single-page queries keep their
+        response cache entries. Pages of a query reporting fewer than expected_rows rows in
+        total, or no rows at all, are never cached as final. Raises FetchError if a page
+        can't be fetched.
+        """
+        rows_of, total_of, first_offset = PAGINATION[api]
+
+        def is_complete(payload):
+            rows = rows_of(payload)
+            total = total_of(payload)
+            count = int(total) if total is not None else len(rows)
+            return bool(rows) and (expected_rows is None or count >= expected_rows)
+
+        offset = 0
+        while True:
+            page_params = params if offset == 0 else {**params, "offset": first_offset + offset}
+            page_description = description if offset == 0 else f"{description} (offset {offset})"
+            payload = self._fetch_json(api, self.endpoints[api], params=page_params, headers=headers,
+                                       description=page_description, rate_limiter=rate_limiter, end_date=end_date,
+                                       is_complete=is_complete)
+            if payload is None:
+                raise FetchError(f"Failed to fetch {page_description}")
+            rows = rows_of(payload)
+            if rows:
+                yield rows
+            offset += len(rows)
+            total = total_of(payload)
+            if not rows or total is None or offset >= int(total):
+                return
+            metrics.increment("fetch_pages_followed", api=api)
+
+    def iter_weather_batch_pages(self, cities, start_date, end_date, api_key=None, rate_limiter=None):
+        """Yields daily weather data for one or more cities from the NOAA API, page by page.
+
+        All the cities' stations go into one request per date window, with windows sized so
+        every station's results normally fit in one page; longer answers are paginated. Each
+        item is a list aligned with cities holding the weather frame of one page, cut at day
+        boundaries. Raises FetchError if a request failed.
+        """
+        city_configs = [self.get_city_config(city["name"]) for city in cities]
+        if not all(city_configs):
+            raise FetchError("Weather requested for an unconfigured city")
+
+        headers = {'token': api_key or self.api_keys["noaa"]}
+        stations = sorted({city_config['noaa_station_id'] for city_config in city_configs})
+        max_days = max(1, NOAA_MAX_RESULTS // (len(NOAA_DATATYPES) * len(stations)))
+        names = ", ".join(city["name"] for city in cities)
+
+        for window_start, window_end in split_date_range(start_date, end_date, max_days):
+            params = {
+                "datasetid": "GHCND",
+                # Several stations are sent as one stationid parameter each
+                "stationid": stations if len(stations) > 1 else stations[0],
+                "startdate": window_start,
+                "enddate": window_end,
+                "datatype": ",".join(NOAA_DATATYPES),
+                "units": "standard",
+                "limit": NOAA_MAX_RESULTS
+            }
+            # Every station reports at least one datatype for each day it has data
+            pages = self._iter_pages("noaa", params, headers=headers,
+                                     description=f"weather data for {names} from {window_start} to {window_end}",
+                                     rate_limiter=rate_limiter, end_date=window_end,
+                                     expected_rows=len(stations) * _days_in(window_start, window_end))
+            empty = True
+            # NOAA sorts results by date
+            for results in _whole_days(pages, lambda entry: entry.get('date', '')[:10]):
+                empty = False
+                yield _parse_weather_frames(results, city_configs)
+            if empty:
+                logging.warning(f"No weather data for {names} from {window_start} to {window_end}")
+
+    def get_weather_data_range(self, city, start_date, end_date, api_key=None, rate_limiter=None):
+        """Fetches daily weather data for a city over an inclusive date range from the NOAA API.
+
+        Returns a frame with one row per date that has observations, or None if a request failed.
+        """
+        frames = self.get_weather_data_batch([city], start_date, end_date, api_key, rate_limiter)
+        return frames[0] if frames is not None else None
+
+    def get_weather_data_batch(self, cities, start_date, end_date, api_key=None, rate_limiter=None):
+        """Fetches daily weather data for several cities with multi-station NOAA requests.
+
+        Returns a list aligned with cities holding each city's weather frame, or None if a request failed.
+        """
+        pages = [[] for _ in cities]
+        try:
+            for page in self.iter_weather_batch_pages(cities, start_date, end_date, api_key, rate_limiter):
+                for city_pages, frame in zip(pages, page):
+                    city_pages.append(frame)
+        except FetchError:
+            return None
+        return [_concat_frames(city_pages, WEATHER_COLUMNS) for city_pages in pages]
+
+    def iter_energy_pages(self, city, start_date, end_date, api_key=None, rate_limiter=None):
+        """Yields hourly energy demand data for a city from EIA, one frame per page cut at day boundaries.
+
+        Raises FetchError if a request failed.
+        """
+        city_name = city["name"]
+        city_config = self.get_city_config(city_name)
+        if not city_config:
+            raise FetchError(f"No config found for city: {city_name}")
+        region = city_config["eia_region_code"]
+        if not region:
+            logging.warning(f"No region found for city: {city_name}")
+            raise FetchError(f"No region found for city: {city_name}")
+
+        max_days = EIA_MAX_RESULTS // EIA_ROWS_PER_DAY
+
+        for window_start, window_end in split_date_range(start_date, end_date, max_days):
+            params = {
+                "api_key": api_key or self.api_keys["eia"],
+                "facets[respondent][]": region,
+                "facets[type][]": "D",
+                "data[]": "value",
+                "start": f"{window_start}T00",
+                "end": f"{window_end}T23",
+                "sort[0][column]": "period",
+                "sort[0][direction]": "asc",
+                "frequency": "hourly",
+                "length": EIA_MAX_RESULTS
+            }
+            pages = self._iter_pages("eia", params,
+                                     description=f"energy data for {city_name} from {window_start} to {window_end}",
+                                     rate_limiter=rate_limiter, end_date=window_end,
+                                     expected_rows=EIA_ROWS_PER_DAY * _days_in(window_start, window_end))
+            empty = True
+            # Rows are requested sorted by period
+            for data in _whole_days(pages, lambda item: item['period'][:10]):
+                empty = False
+                yield _parse_energy_frame(data, city_name)
+            if empty:
+                logging.info(f"No energy data found for {city_name} from {window_start} to {window_end}")
+
+    def get_energy_data_range(self, city, start_date, end_date, api_key=None, rate_limiter=None):
+        """Fetches hourly energy demand data for a city over an inclusive date range from EIA.
+
+        Returns a frame of hourly rows (possibly empty), or None if a request failed.
+        """
+        try:
+            return _concat_frames(self.iter_energy_pages(city, start_date, end_date, api_key, rate_limiter),
+                                  ENERGY_COLUMNS)
+        except FetchError:
+            return None
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_default_client():
+    """Returns the shared FetcherClient used by the module-level fetch functions."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = FetcherClient()
+        return _default_client
+
+def get_weather_data_range(city, start_date, end_date, api_key, rate_limiter=None):
+    """Fetches daily weather data for a city over an inclusive date range from the NOAA API."""
+    return get_default_client().get_weather_data_range(city, start_date, end_date, api_key, rate_limiter)
+
 def get_weather_data(city, date, api_key):
     """Fetches weather data for a given city and date from the NOAA API."""
-    config = load_config()
-    city_name = city["name"]
-    city_config = next((c for c in config["cities"] if c["name"] == city_name), None)
-    if not city_config:
-        logging.warning(f"No config found for city: {city_name}")
+    weather_df = get_weather_data_range(city, date, date, api_key)
+    if weather_df is None or weather_df.empty:
         return None
+    return to_records(weather_df)[0]
 
-    base_url = config['api_endpoints']['noaa']
-    url = f"{base_url}?datasetid=GHCND&stationid={city_config['noaa_station_id']}&startdate={date}&enddate={date}&datatype=TMAX,TMIN,PRCP,SNOW,SNWD,AWND,TSUN,WDF2,WSF2&units=standard"
-    headers = {'token': api_key}
-    retries = 5
-    for i in range(retries):
-        try:
-            response = requests.get(url, headers=headers, timeout=60)
-            response.raise_for_status() # Raises HTTPError for bad responses (4xx or 5xx)
-            data = response.json()
-            if 'results' in data and data['results']:
-                tmax, tmin, prcp, snow, snwd, awnd, tsun, wdf2, wsf2 = None, None, None, None, None, None, None, None, None
-                for entry in data['results']:
-                    if entry.get('datatype') == 'TMAX':
-                        tmax = entry.get('value')
-                    elif entry.get('datatype') == 'TMIN':
-                        tmin = entry.get('value')
-                    elif entry.get('datatype') == 'PRCP':
-                        prcp = entry.get('value')
-                    elif entry.get('datatype') == 'SNOW':
-                        snow = entry.get('value')
-                    elif entry.get('datatype') == 'SNWD':
-                        snwd = entry.get('value')
-                    elif entry.get('datatype') == 'AWND':
-                        awnd = entry.get('value')
-                    elif entry.get('datatype') == 'TSUN':
-                        tsun = entry.get('value')
-                    elif entry.get('datatype') == 'WDF2':
-                        wdf2 = entry.get('value')
-                    elif entry.get('datatype') == 'WSF2':
-                        wsf2 = entry.get('value')
-                return {
-                    "date": date,
-                    "city": city_name,
-                    "tmax_f": tmax,
-                    "tmin_f": tmin,
-                    "prcp": prcp,
-                    "snow": snow,
-                    "snwd": snwd,
-                    "awnd": awnd,
-                    "tsun": tsun,
-                    "wdf2": wdf2,
-                    "wsf2": wsf2,
-                    "timestamp_utc": f"{date}T12:00:00Z"
-                }
-            else:
-                logging.warning(f"No weather data for {city_name} on {date}")
-                return None
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                logging.error(f"Authentication error for NOAA API. Check your API token: {e}")
-                return None # No point in retrying if authentication fails
-            elif e.response.status_code == 404:
-                logging.warning(f"NOAA API endpoint not found: {e}")
-                return None
-            elif e.response.status_code == 429:
-                logging.warning(f"Rate limit exceeded for NOAA API. Retrying in {2 ** i} seconds... ({e})")
-            else:
-                logging.error(f"HTTP error fetching weather data for {city_name} on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1)) # Exponential backoff with jitter
-        except requests.exceptions.ConnectionError as e:
-            logging.error(f"Network connection error for NOAA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-        except requests.exceptions.Timeout as e:
-            logging.error(f"Timeout error for NOAA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-        except requests.exceptions.RequestException as e:
-            logging.error(f"An unexpected error occurred with NOAA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-    logging.error(f"Failed to fetch weather data for {city_name} on {date} after {retries} retries.")
-    return None
+def get_energy_data_range(city, start_date, end_date, api_key, rate_limiter=None):
+    """Fetches hourly energy demand data for a city over an inclusive date range from EIA."""
+    return get_default_client().get_energy_data_range(city, start_date, end_date, api_key, rate_limiter)
 
 def get_energy_data(city, date, api_key):
     """Fetches hourly energy demand data for a given city and date from EIA."""
-    config = load_config()
-    city_name = city["name"]
-    base_url = config["api_endpoints"]["eia"]
-    city_config = next((c for c in config["cities"] if c["name"] == city_name), None)
-    if not city_config:
-        logging.warning(f"No config found for city: {city_name}")
+    energy_df = get_energy_data_range(city, date, date, api_key)
+    if energy_df is None or energy_df.empty:
         return None
-    region = city_config["eia_region_code"]
-    if not region:
-        logging.warning(f"No region found for city: {city_name}")
-        return None
-
-    start_of_day = f"{date}T00"
-    end_of_day = f"{date}T23"
-    
-    params = {
-        "api_key": api_key,
-        "facets[respondent][]": region,
-        "data[]": "value",
-        "start": start_of_day,
-        "end": end_of_day,
-        "sort[0][column]": "period",
-        "sort[0][direction]": "asc",
-        "frequency": "hourly"
-    }
-    
-    retries = 5
-    for i in range(retries):
-        try:
-            response = requests.get(base_url, params=params, timeout=60)
-            response.raise_for_status()
-            data = response.json().get('response', {}).get('data', [])
-            if data:
-                processed_data = []
-                for item in data:
-                    item_date = item['period'].split('T')[0] # Extract date from period
-                    processed_data.append({
-                        'date': item_date,
-                        'city': city_name,
-                        'region': item['respondent'],
-                        'demand_mwh': item['value'], # Rename 'value' to 'demand_mwh'
-                        'timestamp_utc': item['period']
-                    })
-                return processed_data
-            else:
-                logging.info(f"No energy data found for {city_name} on {date}")
-                return None
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                logging.error(f"Authentication error for EIA API. Check your API key: {e}")
-                return None
-            elif e.response.status_code == 404:
-                logging.warning(f"EIA API endpoint not found: {e}")
-                return None
-            elif e.response.status_code == 429:
-                logging.warning(f"Rate limit exceeded for EIA API. Retrying in {2**i} seconds... ({e})")
-            else:
-                logging.error(f"HTTP error fetching energy data for {city_name} on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-        except requests.exceptions.ConnectionError as e:
-            logging.error(f"Network connection error for EIA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-        except requests.exceptions.Timeout as e:
-            logging.error(f"Timeout error for EIA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-        except requests.exceptions.RequestException as e:
-            logging.error(f"An unexpected error occurred with EIA API on attempt {i+1}/{retries}: {e}")
-            time.sleep(2 ** i + random.uniform(0, 1))
-    logging.error(f"Failed to fetch energy data for {city_name} on {date} after {retries} retries.")
-    return None
+    return to_records(energy_df)
 
 def save_to_csv(data, data_type):
     """Appends data to a CSV file."""
@@ -185,11 +498,11 @@ def save_to_csv(data, data_type):
     filepath = os.path.join(raw_data_path, filename)
     file_exists = os.path.isfile(filepath)
 
-    with open(filepath, 'a', newline='') as f:
+    with metrics.timer("write", target=f"{data_type}_csv"), open(filepath, 'a', newline='') as f:
         if data_type == 'weather':
-            fieldnames = ['date', 'city', 'tmax_f', 'tmin_f', 'prcp', 'snow', 'snwd', 'awnd', 'tsun', 'wdf2', 'wsf2', 'timestamp_utc']
+            fieldnames = WEATHER_COLUMNS
         elif data_type == 'energy':
-            fieldnames = ['date', 'city', 'region', 'demand_mwh', 'timestamp_utc']
+            fieldnames = ENERGY_COLUMNS
         else:
             return
 
@@ -203,6 +516,7 @@ def save_to_csv(data, data_type):
                 writer.writerows(data)
             else:
                 writer.writerow(data)
+    metrics.increment("rows_written", len(data) if isinstance(data, list) else int(bool(data)), target=f"{data_type}_csv")
     logging.info(f"Saved {data_type} data to {filepath}")
 
 if __name__ == "__main__":
@@ -2,33 +2,47 @@ import pandas as pd
 import os
 import logging
 import yaml
+import json
+
+import metrics
+import raw_store
+from hourly import HOURLY_DATASET_FILE, build_hourly_dataset, save_hourly_dataset
+from schema import apply_compact_schema, log_memory_usage
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+PROCESSED_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
+# Merged dataset maintained by incremental processing, and the raw-store watermarks it is current to
+PROCESSED_DATASET_FILE = os.path.join(PROCESSED_DATA_PATH, 'merged_dataset.parquet')
+WATERMARKS_FILE = os.path.join(PROCESSED_DATA_PATH, 'state', 'watermarks.json')
+# Raw store watermarks the hourly dataset is current to
+HOURLY_WATERMARKS_FILE = os.path.join(PROCESSED_DATA_PATH, 'state', 'hourly_watermarks.json')
+
+# Chunked processing sizes its energy batches from the memory limit using this per-row estimate
+DEFAULT_MEMORY_LIMIT_MB = 256
+ESTIMATED_BYTES_PER_ROW = 512
+PARTIAL_SUMS_PER_MERGE = 8
+
+WEATHER_COLUMNS = ['date', 'city', 'tmax_f', 'tmin_f', 'prcp', 'snow', 'snwd', 'awnd', 'tsun', 'wdf2', 'wsf2', 'timestamp_utc']
+
 def load_config():
     """Loads the configuration from config.yaml."""
     config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
     with open(config_path, 'r') as f:
         return yaml.safe_load(f)
 
-def process_data():
-    """Reads raw weather and energy data, processes it, and returns the merged DataFrame.
-    """
-    raw_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
-    
-    weather_filepath = os.path.join(raw_data_path, 'weather_data.csv')
-    energy_filepath = os.path.join(raw_data_path, 'energy_data.csv')
-
-    if not os.path.exists(weather_filepath) or not os.path.exists(energy_filepath):
-        logging.error("Raw weather_data.csv or energy_data.csv not found. Please run data collection first.")
-        return pd.DataFrame() # Return empty DataFrame instead of None
+RAW_DATA_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
+WEATHER_CSV_FILE = os.path.join(RAW_DATA_PATH, 'weather_data.csv')
+ENERGY_CSV_FILE = os.path.join(RAW_DATA_PATH, 'energy_data.csv')
 
+def _read_legacy_weather_csv():
+    """Reads the legacy weather_data.csv, returning None if it is unreadable."""
     try:
-        weather_df = pd.read_csv(weather_filepath)
+        weather_df = pd.read_csv(WEATHER_CSV_FILE)
         if weather_df.empty:
             logging.warning("weather_data.csv is empty. Creating an empty DataFrame with expected columns.")
             # Define expected columns for weather_df if it's empty
-            weather_df = pd.DataFrame(columns=['date', 'city', 'tmax_f', 'tmin_f', 'prcp', 'snow', 'snwd', 'awnd', 'tsun', 'wdf2', 'wsf2', 'timestamp_utc'])
+            weather_df = pd.DataFrame(columns=WEATHER_COLUMNS)
         else:
             # Convert date columns to datetime objects
             weather_df['date'] = pd.to_datetime(weather_df['date'])
@@ -38,37 +52,352 @@ def process_data():
                 weather_df['tmax_f'] = pd.to_numeric(weather_df['tmax_f'], errors='coerce')
             if 'tmin_f' in weather_df.columns:
                 weather_df['tmin_f'] = pd.to_numeric(weather_df['tmin_f'], errors='coerce')
+            # Typed like the raw store, so merged rows from both sources can be combined
+            if 'timestamp_utc' in weather_df.columns:
+                weather_df['timestamp_utc'] = pd.to_datetime(weather_df['timestamp_utc'], utc=True, format='ISO8601')
 
     except pd.errors.EmptyDataError:
         logging.warning("weather_data.csv is empty. Creating an empty DataFrame with expected columns.")
-        weather_df = pd.DataFrame(columns=['date', 'city', 'tmax_f', 'tmin_f', 'prcp', 'snow', 'snwd', 'awnd', 'tsun', 'wdf2', 'wsf2', 'timestamp_utc'])
+        weather_df = pd.DataFrame(columns=WEATHER_COLUMNS)
     except Exception as e:
         logging.error(f"Error reading weather_data.csv: {e}")
-        return pd.DataFrame()
+        return None
+    return weather_df
+
+def _read_legacy_csvs():
+    """Reads the legacy append-only weather_data.csv and energy_data.csv.
+
+    Returns (weather_df, energy_df), or None if the data is missing or unreadable.
+    """
+    weather_filepath = WEATHER_CSV_FILE
+    energy_filepath = ENERGY_CSV_FILE
+
+    if not os.path.exists(weather_filepath) or not os.path.exists(energy_filepath):
+        logging.error("Raw weather_data.csv or energy_data.csv not found. Please run data collection first.")
+        return None
+
+    weather_df = _read_legacy_weather_csv()
+    if weather_df is None:
+        return None
 
     try:
         energy_df = pd.read_csv(energy_filepath)
         if energy_df.empty:
             logging.warning("energy_data.csv is empty. Returning empty DataFrame.")
-            return pd.DataFrame()
+            return None
         else:
             energy_df['date'] = pd.to_datetime(energy_df['date'])
     except pd.errors.EmptyDataError:
         logging.warning("energy_data.csv is empty. Returning empty DataFrame.")
-        return pd.DataFrame()
+        return None
     except Exception as e:
         logging.error(f"Error reading energy_data.csv: {e}")
+        return None
+
+    return weather_df, energy_df
+
+def load_raw_data(start_date=None, end_date=None, store_path=raw_store.RAW_STORE_PATH):
+    """Loads raw weather and energy data, preferring the partitioned Parquet store at store_path.
+
+    With a date window only the store partitions covering it are read. Falls back to the
+    legacy CSVs when the store has not been populated yet. Returns (weather_df, energy_df),
+    or None if no usable data is available.
+    """
+    if raw_store.has_data('weather', store_path=store_path) and raw_store.has_data('energy', store_path=store_path):
+        weather_df = raw_store.read_raw('weather', start_date, end_date, columns=raw_store.DATA_COLUMNS['weather'], store_path=store_path)
+        energy_df = raw_store.read_raw('energy', start_date, end_date, columns=raw_store.DATA_COLUMNS['energy'], store_path=store_path)
+        if energy_df.empty:
+            logging.warning("No energy data in the raw store for the requested window. Returning empty DataFrame.")
+            return None
+        return weather_df, energy_df
+
+    logging.info("Raw Parquet store is empty, reading legacy CSV files.")
+    return _read_legacy_csvs()
+
+def process_data(start_date=None, end_date=None, store_path=raw_store.RAW_STORE_PATH):
+    """Reads raw weather and energy data, processes it, and returns the merged DataFrame.
+
+    start_date and end_date (inclusive, YYYY-MM-DD) optionally restrict processing to a window.
+    """
+    raw_data = load_raw_data(start_date, end_date, store_path)
+    if raw_data is None:
+        return pd.DataFrame() # Return empty DataFrame instead of None
+    weather_df, energy_df = raw_data
+
+    merged_df = apply_compact_schema(merge_weather_energy(weather_df, energy_df))
+
+    logging.info("Processed and merged data.")
+    log_memory_usage("process", merged_df)
+    return merged_df
+
+def process_data_hourly(start_date=None, end_date=None, store_path=raw_store.RAW_STORE_PATH):
+    """Like process_data, but keeps one row per city and hour instead of summing demand to days.
+
+    Each hourly row carries the daily tmax_f and tmin_f of its city and date.
+    """
+    raw_data = load_raw_data(start_date, end_date, store_path)
+    if raw_data is None:
         return pd.DataFrame()
+    weather_df, energy_df = raw_data
+
+    hourly_df = build_hourly_dataset(weather_df, energy_df)
+
+    logging.info("Processed hourly data.")
+    log_memory_usage("process_hourly", hourly_df)
+    return hourly_df
 
+def merge_weather_energy(weather_df, energy_df):
+    """Aggregates hourly energy data to daily totals and merges it with daily weather data."""
     # Aggregate hourly energy data to daily total
     daily_energy_df = energy_df.groupby(['date', 'city', 'region'])['demand_mwh'].sum().reset_index()
+    return _merge_daily(weather_df, daily_energy_df)
 
-    # Merge dataframes
-    merged_df = pd.merge(weather_df, daily_energy_df, on=['date', 'city'], how='inner')
+def _merge_daily(weather_df, daily_energy_df):
+    """Merges daily weather with daily energy totals, ordered by date and city."""
+    with metrics.timer("merge"):
+        merged_df = pd.merge(weather_df, daily_energy_df, on=['date', 'city'], how='inner')
+        merged_df = merged_df.sort_values(['date', 'city'], kind='stable').reset_index(drop=True)
+    metrics.increment("rows_merged", len(merged_df))
+    return merged_df
 
-    logging.info("Processed and merged data.")
+def _iter_energy_chunks(batch_size, use_store, start_date=None, end_date=None, store_path=raw_store.RAW_STORE_PATH):
+    """Yields hourly energy rows in chunks from the raw store or the legacy CSV."""
+    columns = ['date', 'city', 'region', 'demand_mwh']
+    if use_store:
+        yield from raw_store.iter_raw_batches('energy', batch_size, start_date, end_date, columns=columns, store_path=store_path)
+        return
+    try:
+        for chunk in pd.read_csv(ENERGY_CSV_FILE, usecols=columns, chunksize=batch_size):
+            chunk['date'] = pd.to_datetime(chunk['date'])
+            if start_date:
+                chunk = chunk[chunk['date'] >= pd.Timestamp(start_date)]
+            if end_date:
+                chunk = chunk[chunk['date'] <= pd.Timestamp(end_date)]
+            yield chunk
+    except pd.errors.EmptyDataError:
+        logging.warning("energy_data.csv is empty.")
+
+def process_data_chunked(start_date=None, end_date=None, memory_limit_mb=DEFAULT_MEMORY_LIMIT_MB,
+                         store_path=raw_store.RAW_STORE_PATH):
+    """Processes raw data with bounded memory and returns the same merged DataFrame as process_data.
+
+    Hourly energy rows are streamed in chunks sized to fit memory_limit_mb and reduced to
+    partial daily sums per (date, city, region), which are merged as they arrive. The daily
+    totals are then joined against weather data one month at a time, so neither the full
+    hourly history nor the full weather history is ever held in memory.
+    """
+    batch_size = max(1, int(memory_limit_mb * 1024 * 1024 // ESTIMATED_BYTES_PER_ROW))
+    logging.info(f"Processing raw data in chunks of {batch_size} rows (memory limit {memory_limit_mb} MB).")
+
+    use_store = raw_store.has_data('weather', store_path=store_path) and raw_store.has_data('energy', store_path=store_path)
+    if not use_store:
+        if not os.path.exists(WEATHER_CSV_FILE) or not os.path.exists(ENERGY_CSV_FILE):
+            logging.error("Raw weather_data.csv or energy_data.csv not found. Please run data collection first.")
+            return pd.DataFrame()
+        logging.info("Raw Parquet store is empty, reading legacy CSV files.")
+        # Daily weather is 24x smaller than hourly energy, so the legacy file is read at once
+        legacy_weather_df = _read_legacy_weather_csv()
+        if legacy_weather_df is None:
+            return pd.DataFrame()
+
+    # Partial daily sums are combined every few chunks, so only daily-level data accumulates
+    daily_totals = None
+    pending = []
+    for chunk in _iter_energy_chunks(batch_size, use_store, start_date, end_date, store_path):
+        pending.append(chunk.groupby(['date', 'city', 'region'])['demand_mwh'].sum())
+        if len(pending) >= PARTIAL_SUMS_PER_MERGE:
+            daily_totals = _combine_partial_sums(daily_totals, pending)
+            pending = []
+    daily_totals = _combine_partial_sums(daily_totals, pending)
+    if daily_totals is None or daily_totals.empty:
+        logging.warning("No energy data available. Returning empty DataFrame.")
+        return pd.DataFrame()
+    daily_energy_df = daily_totals.reset_index()
+
+    merged_parts = []
+    months = daily_energy_df['date'].dt.to_period('M')
+    for month, month_energy_df in daily_energy_df.groupby(months, sort=True):
+        window_start, window_end = month.start_time.normalize(), month.end_time.normalize()
+        if use_store:
+            weather_df = raw_store.read_raw('weather', window_start, window_end, columns=raw_store.DATA_COLUMNS['weather'],
+                                            store_path=store_path)
+        else:
+            weather_df = legacy_weather_df[(legacy_weather_df['date'] >= window_start) & (legacy_weather_df['date'] <= window_end)]
+        with metrics.timer("merge"):
+            merged_parts.append(pd.merge(weather_df, month_energy_df, on=['date', 'city'], how='inner'))
+
+    merged_df = pd.concat(merged_parts, ignore_index=True)
+    merged_df = merged_df.sort_values(['date', 'city'], kind='stable').reset_index(drop=True)
+    metrics.increment("rows_merged", len(merged_df))
+    apply_compact_schema(merged_df)
+    logging.info("Processed and merged data in chunks.")
+    log_memory_usage("process", merged_df)
     return merged_df
 
+def _combine_partial_sums(daily_totals, partial_sums):
+    """Adds a list of partial (date, city, region) demand sums into the running daily totals."""
+    if not partial_sums:
+        return daily_totals
+    parts = partial_sums if daily_totals is None else [daily_totals] + partial_sums
+    return pd.concat(parts).groupby(level=['date', 'city', 'region']).sum()
+
+def load_watermarks(path=None):
+    """Loads per-source, per-city ingestion watermarks, by default those of the last incremental run."""
+    path = path or WATERMARKS_FILE
+    if not os.path.exists(path):
+        return {source: {} for source in raw_store.SCHEMAS}
+    with open(path, 'r') as f:
+        stored = json.load(f)
+    return {source: {city: pd.Timestamp(ts) for city, ts in stored.get(source, {}).items()}
+            for source in raw_store.SCHEMAS}
+
+def save_watermarks(watermarks, path=None):
+    """Persists watermarks atomically so an interrupted run never leaves a partial file."""
+    path = path or WATERMARKS_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    serializable = {source: {city: ts.isoformat() for city, ts in cities.items()}
+                    for source, cities in watermarks.items()}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(serializable, f, indent=2)
+    os.replace(tmp_path, path)
+
+def changed_months(since, until):
+    """Returns the months ('YYYY-MM') of raw rows ingested after the since watermarks and up to the until ones.
+
+    Derived outputs that keep the watermarks they were built from (see save_watermarks) use
+    this to find what to rebuild: since are their own watermarks and until those of the
+    merged dataset they read, so rows not yet processed are left for a later run.
+    """
+    months = set()
+    for source in raw_store.SCHEMAS:
+        changes = raw_store.read_changes(source, since[source], columns=['city', 'date', 'ingested_at'])
+        limit = changes['city'].map(until[source]).astype(changes['ingested_at'].dtype)
+        changes = changes[changes['ingested_at'] <= limit]
+        months.update(changes['date'].dt.strftime('%Y-%m').unique())
+    return months
+
+def save_processed_dataset(df):
+    """Atomically replaces the persisted merged dataset."""
+    os.makedirs(os.path.dirname(PROCESSED_DATASET_FILE), exist_ok=True)
+    tmp_path = f"{PROCESSED_DATASET_FILE}.tmp"
+    with metrics.timer("write", target="processed_dataset"):
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, PROCESSED_DATASET_FILE)
+    metrics.record_write("processed_dataset", PROCESSED_DATASET_FILE, len(df))
+
+def load_processed_dataset():
+    """Returns the persisted merged dataset maintained by incremental runs (empty if none)."""
+    if not os.path.exists(PROCESSED_DATASET_FILE):
+        return pd.DataFrame()
+    return pd.read_parquet(PROCESSED_DATASET_FILE)
+
+def process_data_incremental():
+    """Processes only the (city, date) cells whose raw rows changed since the last run.
+
+    Raw rows ingested after each city's watermark determine the affected dates. Only those
+    dates are re-aggregated and merged, and the result replaces the matching rows of the
+    persisted merged dataset. Returns the full, updated merged DataFrame.
+    """
+    if not (raw_store.has_data('weather') and raw_store.has_data('energy')):
+        logging.info("Raw Parquet store is empty, falling back to full processing.")
+        processed_df = process_data()
+        if not processed_df.empty:
+            save_processed_dataset(processed_df)
+        return processed_df
+
+    processed_df = load_processed_dataset()
+    # Without the merged dataset the watermarks are meaningless, so rebuild from scratch
+    watermarks = load_watermarks() if not processed_df.empty else {source: {} for source in raw_store.SCHEMAS}
+    changes = {source: raw_store.read_changes(source, watermarks[source], columns=['city', 'date', 'ingested_at'])
+               for source in raw_store.SCHEMAS}
+    changed_cells = pd.concat([changes[source][['city', 'date']] for source in changes]).drop_duplicates()
+
+    if changed_cells.empty:
+        logging.info("No new or changed raw data since the last run.")
+        return processed_df
+
+    cities = changed_cells['city'].unique().tolist()
+    start_date, end_date = changed_cells['date'].min(), changed_cells['date'].max()
+    weather_df = raw_store.read_raw('weather', start_date, end_date, cities, columns=raw_store.DATA_COLUMNS['weather'])
+    energy_df = raw_store.read_raw('energy', start_date, end_date, cities, columns=raw_store.DATA_COLUMNS['energy'])
+
+    # Keep only the changed cells; the window can also contain untouched dates of other cities
+    changed_index = pd.MultiIndex.from_frame(changed_cells[['city', 'date']])
+    weather_df = weather_df[pd.MultiIndex.from_frame(weather_df[['city', 'date']]).isin(changed_index)]
+    energy_df = energy_df[pd.MultiIndex.from_frame(energy_df[['city', 'date']]).isin(changed_index)]
+    updated_df = merge_weather_energy(weather_df, energy_df)
+
+    if not processed_df.empty:
+        unchanged = ~pd.MultiIndex.from_frame(processed_df[['city', 'date']]).isin(changed_index)
+        processed_df = pd.concat([processed_df[unchanged], updated_df], ignore_index=True)
+    else:
+        processed_df = updated_df
+    processed_df = apply_compact_schema(processed_df.sort_values(['date', 'city']).reset_index(drop=True))
+
+    save_processed_dataset(processed_df)
+
+    # Advance the watermarks only after the merged dataset has been written
+    for source, changes_df in changes.items():
+        latest = changes_df.groupby('city')['ingested_at'].max()
+        for city, ingested_at in latest.items():
+            if pd.notna(ingested_at):
+                watermarks[source][city] = ingested_at
+    save_watermarks(watermarks)
+
+    logging.info(f"Incrementally processed {len(changed_cells)} changed (city, date) cells.")
+    log_memory_usage("process", processed_df)
+    return processed_df
+
+def process_data_hourly_incremental(path=HOURLY_DATASET_FILE, watermarks_path=HOURLY_WATERMARKS_FILE,
+                                    store_path=raw_store.RAW_STORE_PATH):
+    """Rebuilds only the months of the hourly dataset whose raw rows changed since the last run.
+
+    Raw rows ingested after the hourly watermarks determine the affected months. Those
+    months are rebuilt from the raw store with process_data_hourly and replace the
+    matching rows of the hourly dataset at path. Without a persisted hourly dataset, the
+    whole history is rebuilt. Returns the full, updated hourly DataFrame.
+    """
+    if not (raw_store.has_data('weather', store_path=store_path) and raw_store.has_data('energy', store_path=store_path)):
+        logging.info("Raw Parquet store is empty, falling back to full hourly processing.")
+        hourly_df = process_data_hourly(store_path=store_path)
+        if not hourly_df.empty:
+            save_hourly_dataset(hourly_df, path)
+        return hourly_df
+
+    hourly_df = pd.read_parquet(path) if os.path.exists(path) else pd.DataFrame()
+    # Without the hourly dataset the watermarks are meaningless, so rebuild from scratch
+    watermarks = load_watermarks(watermarks_path) if not hourly_df.empty else {source: {} for source in raw_store.SCHEMAS}
+    changes = {source: raw_store.read_changes(source, watermarks[source], columns=['city', 'date', 'ingested_at'],
+                                              store_path=store_path)
+               for source in raw_store.SCHEMAS}
+    months = sorted(set().union(*(changes_df['date'].dt.to_period('M').unique() for changes_df in changes.values())))
+
+    if not months:
+        logging.info("No new or changed raw data for the hourly dataset since the last run.")
+        return hourly_df
+
+    updated = [process_data_hourly(month.start_time, month.end_time.normalize(), store_path) for month in months]
+    updated = [month_df for month_df in updated if not month_df.empty]
+    if not hourly_df.empty:
+        unchanged = ~hourly_df['date'].dt.to_period('M').isin(months)
+        updated.insert(0, hourly_df[unchanged].astype({'city': object, 'region': object}))
+    hourly_df = pd.concat([month_df.astype({'city': object, 'region': object}) for month_df in updated], ignore_index=True)
+    hourly_df = apply_compact_schema(hourly_df.sort_values(['date', 'city', 'hour'], kind='stable').reset_index(drop=True))
+
+    save_hourly_dataset(hourly_df, path)
+
+    # Advance the watermarks only after the hourly dataset has been written
+    for source, changes_df in changes.items():
+        latest = changes_df.groupby('city')['ingested_at'].max()
+        for city, ingested_at in latest.items():
+            if pd.notna(ingested_at):
+                watermarks[source][city] = ingested_at
+    save_watermarks(watermarks, watermarks_path)
+
+    logging.info(f"Incrementally rebuilt {len(months)} months of the hourly dataset.")
+    return hourly_df
+
 if __name__ == "__main__":
     df = process_data()
     if df is not None:
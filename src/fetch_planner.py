@@ -0,0 +1,69 @@
+import logging
+from collections import namedtuple
+from datetime import datetime
+
+from data_fetcher import NOAA_MAX_RESULTS, NOAA_DATATYPES
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# The city config field identifying what each data type is fetched for
+SOURCE_KEYS = {
+    "weather": "noaa_station_id",
+    "energy": "eia_region_code",
+}
+
+# One request to issue (`job`) and the city jobs (`jobs`, including `job`) its rows are fanned out to
+FetchGroup = namedtuple('FetchGroup', ['job', 'jobs'])
+
+def source_key(job):
+    """Returns what a job actually fetches: its data type, NOAA station or EIA region, and window."""
+    source = job.city.get(SOURCE_KEYS[job.data_type])
+    # A city without a station or region can't share a request; keep it on its own
+    if source is None:
+        source = ("city", job.city["name"])
+    return job.data_type, source, job.start_date, job.end_date
+
+def plan(jobs):
+    """Groups jobs that fetch the same NOAA station or EIA region over the same window.
+
+    Each group is fetched once, so request volume grows with the number of unique stations
+    and regions rather than with the number of cities. Groups keep the order of their first job.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(source_key(job), []).append(job)
+    planned = [FetchGroup(group[0], group) for group in groups.values()]
+    if len(planned) < len(jobs):
+        logging.info(f"Planned {len(planned)} requests for {len(jobs)} city fetch jobs.")
+    return planned
+
+def fan_out(group, records):
+    """Yields (job, records) for every city job of a group, with the rows relabelled to each job's city."""
+    for job in group.jobs:
+        if records is None or job is group.job:
+            yield job, records
+        else:
+            yield job, records.assign(city=job.city['name'])
+
+def stations_per_request(start_date, end_date, max_stations):
+    """Returns how many NOAA stations fit in one request over a window, given the per-response result cap."""
+    days = (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days + 1
+    return max(1, min(max_stations, NOAA_MAX_RESULTS // (len(NOAA_DATATYPES) * days)))
+
+def batch_weather(groups, max_stations):
+    """Packs weather groups with the same window into batches that share multi-station NOAA requests.
+
+    Groups already fetch distinct stations, so a batch of n groups is n stations. Batches are
+    as large as a single response can hold for the window; windows too long for more than
+    one station yield single-group batches.
+    """
+    by_window = {}
+    for group in groups:
+        by_window.setdefault((group.job.start_date, group.job.end_date), []).append(group)
+    batches = []
+    for (start_date, end_date), window_groups in by_window.items():
+        size = stations_per_request(start_date, end_date, max_stations)
+        batches.extend(window_groups[i:i + size] for i in range(0, len(window_groups), size))
+    if len(batches) < len(groups):
+        logging.info(f"Packed {len(groups)} weather requests into {len(batches)} multi-station requests.")
+    return batches
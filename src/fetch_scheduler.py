@@ -0,0 +1,202 @@
+import queue
+import logging
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from data_fetcher import FetcherClient, FetchError, DEFAULT_NOAA_MAX_STATIONS
+from fetch_planner import plan, fan_out, batch_weather
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Maps each data type to the API it is fetched from and the FetcherClient method that retrieves it
+FETCHERS = {
+    "weather": ("noaa", "get_weather_data_range"),
+    "energy": ("eia", "get_energy_data_range"),
+}
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_RATE_LIMITS = {
+    "noaa": {"requests_per_second": 4, "burst": 4},
+    "eia": {"requests_per_second": 5, "burst": 5},
+}
+
+FetchJob = namedtuple('FetchJob', ['data_type', 'city', 'start_date', 'end_date'])
+
+# Put on the page queue by a streaming worker once its batch is finished
+BATCH_DONE = object()
+
+class TokenBucket:
+    """Thread-safe token bucket that allows `rate` requests per second with bursts of up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and consumes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class FetchScheduler:
+    """Runs NOAA and EIA range fetches concurrently.
+
+    Each API gets its own worker pool and token bucket, so retries and backoff against one
+    API never occupy the workers or the request budget of the other.
+    """
+
+    def __init__(self, max_concurrency=DEFAULT_MAX_CONCURRENCY, rate_limits=None, client=None,
+                 noaa_max_stations=DEFAULT_NOAA_MAX_STATIONS):
+        self.client = client if client is not None else FetcherClient()
+        self.noaa_max_stations = noaa_max_stations
+        rate_limits = rate_limits or DEFAULT_RATE_LIMITS
+        self.rate_limiters = {}
+        self.executors = {}
+        for api, _ in FETCHERS.values():
+            limits = rate_limits.get(api, DEFAULT_RATE_LIMITS[api])
+            self.rate_limiters[api] = TokenBucket(limits["requests_per_second"], limits.get("burst"))
+            self.executors[api] = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{api}-fetch")
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a scheduler, and the FetcherClient it uses, from the loaded configuration."""
+        fetch_config = config.get("fetch", {})
+        return cls(
+            max_concurrency=fetch_config.get("max_concurrency", DEFAULT_MAX_CONCURRENCY),
+            rate_limits=fetch_config.get("rate_limits"),
+            client=FetcherClient(config),
+            noaa_max_stations=fetch_config.get("noaa_max_stations_per_request", DEFAULT_NOAA_MAX_STATIONS),
+        )
+
+    def submit(self, job, api_keys):
+        """Schedules a FetchJob and returns a future resolving to its records frame (or None on failure)."""
+        api, method_name = FETCHERS[job.data_type]
+        fetch_range = getattr(self.client, method_name)
+        return self.executors[api].submit(
+            fetch_range, job.city, job.start_date, job.end_date, api_keys[api],
+            rate_limiter=self.rate_limiters[api],
+        )
+
+    def submit_weather_batch(self, jobs, api_keys):
+        """Schedules one multi-station weather fetch for jobs sharing a window.
+
+        The future resolves to a list of records frames per job, or None if the fetch failed.
+        """
+        return self.executors["noaa"].submit(
+            self.client.get_weather_data_batch, [job.city for job in jobs], jobs[0].start_date,
+            jobs[0].end_date, api_keys["noaa"], rate_limiter=self.rate_limiters["noaa"],
+        )
+
+    def _batches(self, jobs):
+        """Plans jobs into batches of FetchGroups, each fetched by one worker."""
+        groups = plan(jobs)
+        metrics.increment("fetch_jobs_deduplicated", len(jobs) - len(groups))
+        weather_groups = [group for group in groups if group.job.data_type == "weather"]
+        weather_batches = batch_weather(weather_groups, self.noaa_max_stations)
+        metrics.increment("fetch_jobs_batched", len(weather_groups) - len(weather_batches))
+        return [[group] for group in groups if group.job.data_type != "weather"] + weather_batches
+
+    def run(self, jobs, api_keys):
+        """Fetches all jobs concurrently and yields (job, records) pairs as they complete.
+
+        records is a DataFrame of the job's rows, or None if the fetch failed.
+        Jobs of cities that share a NOAA station or EIA region over the same window are
+        fetched once, and the rows are fanned out to each of those cities (see fetch_planner).
+        Weather fetches of different stations over the same short window share multi-station
+        NOAA requests.
+        """
+        batches = self._batches(jobs)
+        futures = {}
+        for batch in batches:
+            if len(batch) == 1:
+                futures[self.submit(batch[0].job, api_keys)] = batch
+            else:
+                futures[self.submit_weather_batch([group.job for group in batch], api_keys)] = batch
+        for future in as_completed(futures):
+            batch = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                names = ", ".join(group.job.city['name'] for group in batch)
+                logging.error(f"Unexpected error fetching {batch[0].job.data_type} data for {names}: {e}")
+                result = None
+            if len(batch) == 1:
+                results = [result]
+            else:
+                results = result if result is not None else [None] * len(batch)
+            for group, records in zip(batch, results):
+                yield from fan_out(group, records)
+
+    def _stream_batch(self, batch, api_keys, pages):
+        """Fetches a batch page by page, putting (batch, records per group) on the pages queue.
+
+        A failed fetch puts None instead of records, and BATCH_DONE follows the last item.
+        """
+        first = batch[0].job
+        api, _ = FETCHERS[first.data_type]
+        try:
+            if first.data_type == "weather":
+                iterator = self.client.iter_weather_batch_pages(
+                    [group.job.city for group in batch], first.start_date, first.end_date, api_keys[api],
+                    rate_limiter=self.rate_limiters[api])
+            else:
+                iterator = ([page] for page in self.client.iter_energy_pages(
+                    first.city, first.start_date, first.end_date, api_keys[api],
+                    rate_limiter=self.rate_limiters[api]))
+            for results in iterator:
+                pages.put((batch, results))
+        except FetchError:
+            pages.put((batch, None))
+        except Exception as e:
+            names = ", ".join(group.job.city['name'] for group in batch)
+            logging.error(f"Unexpected error fetching {first.data_type} data for {names}: {e}")
+            pages.put((batch, None))
+        finally:
+            pages.put((batch, BATCH_DONE))
+
+    def stream(self, jobs, api_keys):
+        """Fetches all jobs concurrently and yields (job, records) for every page as it arrives.
+
+        Where run() hands over a job's records once its whole range is fetched, stream() hands
+        over each parsed page, so a writer can persist long ranges incrementally instead of
+        holding them in memory. A job whose fetch fails yields (job, None) after the pages it
+        did get. Jobs are deduplicated and batched as in run().
+        """
+        # Unbounded, so workers never block on a consumer that stopped reading
+        pages = queue.Queue()
+        batches = self._batches(jobs)
+        for batch in batches:
+            api, _ = FETCHERS[batch[0].job.data_type]
+            self.executors[api].submit(self._stream_batch, batch, api_keys, pages)
+        remaining = len(batches)
+        while remaining:
+            batch, results = pages.get()
+            if results is BATCH_DONE:
+                remaining -= 1
+                continue
+            for group, records in zip(batch, results if results is not None else [None] * len(batch)):
+                yield from fan_out(group, records)
+
+    def shutdown(self):
+        for executor in self.executors.values():
+            executor.shutdown(wait=True)
+        self.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
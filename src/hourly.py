@@ -0,0 +1,156 @@
+import os
+import logging
+
+import numpy as np
+import pandas as pd
+
+import metrics
+from cube import DAY_TYPES, _pearson
+from schema import apply_compact_schema
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Hourly demand aligned with daily weather, maintained when hourly mode is enabled
+HOURLY_DATASET_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed', 'hourly_dataset.parquet')
+HOURLY_COLUMNS = ['date', 'hour', 'city', 'region', 'demand_mwh', 'tmax_f', 'tmin_f']
+HOURS_PER_DAY = 24
+
+def hourly_mode_enabled(config):
+    """Returns True if config.yaml asks for the hourly-resolution dataset and analytics."""
+    return bool(config.get("processing", {}).get("hourly_mode", False))
+
+def build_hourly_dataset(weather_df, energy_df):
+    """Aligns every hourly demand row with the daily weather observation of the same city and date.
+
+    hour is the UTC hour of the EIA period and date the UTC day it falls in, the same day
+    the daily merge sums it into. Repeated (city, date, hour) rows keep the last one, as the
+    raw store does. Cities and dates without weather are dropped, like the daily merge.
+    """
+    hourly_df = pd.DataFrame({
+        'date': pd.to_datetime(energy_df['date']).to_numpy(),
+        'hour': pd.to_datetime(energy_df['timestamp_utc'], utc=True).dt.hour.to_numpy(dtype=np.int8),
+        'city': energy_df['city'].to_numpy(),
+        'region': energy_df['region'].to_numpy(),
+        'demand_mwh': pd.to_numeric(energy_df['demand_mwh'], errors='coerce').to_numpy(),
+    }).drop_duplicates(subset=['city', 'date', 'hour'], keep='last')
+    weather_df = weather_df[['date', 'city', 'tmax_f', 'tmin_f']].astype({'city': object})
+    with metrics.timer("merge", resolution="hourly"):
+        merged_df = pd.merge(hourly_df, weather_df, on=['date', 'city'], how='inner')
+        merged_df = merged_df.sort_values(['date', 'city', 'hour'], kind='stable').reset_index(drop=True)
+    metrics.increment("rows_merged", len(merged_df), resolution="hourly")
+    return apply_compact_schema(merged_df[HOURLY_COLUMNS])
+
+def save_hourly_dataset(df, path=HOURLY_DATASET_FILE):
+    """Atomically replaces the persisted hourly dataset."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with metrics.timer("write", target="hourly_dataset"):
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    metrics.record_write("hourly_dataset", path, len(df))
+    logging.info(f"Hourly dataset saved to {path}")
+
+def _day_codes(df):
+    """Returns (codes, cities, dates): one integer code per (city, date) with the city and date of each code."""
+    city_codes, cities = pd.factorize(df['city'])
+    date_codes, dates = pd.factorize(df['date'])
+    day_codes, keys = pd.factorize(city_codes.astype(np.int64) * len(dates) + date_codes)
+    return day_codes, np.asarray(cities)[keys // len(dates)], dates[keys % len(dates)]
+
+def daily_peaks(df):
+    """Reduces hourly rows to one row per city and date with the peak hour and load factor.
+
+    The peak of each day is found with a single lexsort on (day, demand) instead of a grouped
+    apply. load_factor is the mean hourly demand over the peak and is only computed for days
+    with all 24 hours, since a partial day understates the mean. tmax_f and tmin_f are the
+    day's weather observation.
+    """
+    day_codes, cities, dates = _day_codes(df)
+    n_days = len(dates)
+    demand = df['demand_mwh'].to_numpy(dtype=float)
+    valid = ~np.isnan(demand)
+    hours = np.bincount(day_codes[valid], minlength=n_days)
+    sums = np.bincount(day_codes[valid], weights=demand[valid], minlength=n_days)
+
+    # After sorting by (day, demand), the last row of each day is its peak; missing demand sorts first
+    order = np.lexsort((np.where(valid, demand, -np.inf), day_codes))
+    sorted_codes = day_codes[order]
+    peak_rows = order[np.r_[sorted_codes[1:] != sorted_codes[:-1], True]]
+
+    peak = demand[peak_rows]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = sums / hours
+        load_factor = np.where((hours == HOURS_PER_DAY) & (peak > 0), mean / peak, np.nan)
+    peaks_df = pd.DataFrame({
+        'date': dates,
+        'city': cities,
+        'hours': hours.astype(np.int8),
+        'peak_demand_mwh': peak,
+        'peak_hour': df['hour'].to_numpy()[peak_rows],
+        'mean_demand_mwh': mean,
+        'load_factor': load_factor,
+        'tmax_f': df['tmax_f'].to_numpy(dtype=float)[peak_rows],
+        'tmin_f': df['tmin_f'].to_numpy(dtype=float)[peak_rows],
+    })
+    peaks_df = peaks_df[hours > 0].sort_values(['date', 'city'], kind='stable').reset_index(drop=True)
+    return apply_compact_schema(peaks_df).astype({column: 'float32' for column in
+                                                  ['peak_demand_mwh', 'mean_demand_mwh', 'load_factor']})
+
+def hourly_profile(df):
+    """Returns the mean demand per city, day type and hour of day, in long format."""
+    city_codes, cities = pd.factorize(df['city'])
+    weekend = (df['date'].dt.dayofweek.to_numpy() >= 5).astype(np.int64)
+    demand = df['demand_mwh'].to_numpy(dtype=float)
+    codes = (city_codes * len(DAY_TYPES) + weekend) * HOURS_PER_DAY + df['hour'].to_numpy(dtype=np.int64)
+    codes = codes[~np.isnan(demand)]
+    n_cells = len(cities) * len(DAY_TYPES) * HOURS_PER_DAY
+    rows = np.bincount(codes, minlength=n_cells)
+    sums = np.bincount(codes, weights=demand[~np.isnan(demand)], minlength=n_cells)
+
+    cell = np.nonzero(rows)[0]
+    profile_df = pd.DataFrame({
+        'city': np.asarray(cities)[cell // (len(DAY_TYPES) * HOURS_PER_DAY)],
+        'day_type': np.asarray(DAY_TYPES)[cell // HOURS_PER_DAY % len(DAY_TYPES)],
+        'hour': (cell % HOURS_PER_DAY).astype(np.int8),
+        'rows': rows[cell],
+        'mean_demand_mwh': (sums[cell] / rows[cell]).astype(np.float32),
+    })
+    profile_df = profile_df.sort_values(['city', 'day_type', 'hour'], kind='stable').reset_index(drop=True)
+    return profile_df.astype({'city': 'category', 'day_type': 'category'})
+
+def peak_statistics(peaks_df):
+    """Returns per-city peak demand, typical peak hour, mean load factor and peak demand vs tmax correlation."""
+    city_codes, cities = pd.factorize(peaks_df['city'])
+    n_cities = len(cities)
+    peak = peaks_df['peak_demand_mwh'].to_numpy(dtype=float)
+    tmax = peaks_df['tmax_f'].to_numpy(dtype=float)
+    load_factor = peaks_df['load_factor'].to_numpy(dtype=float)
+
+    days = np.bincount(city_codes, minlength=n_cities)
+    peak_sum = np.bincount(city_codes, weights=peak, minlength=n_cities)
+    peak_max = np.full(n_cities, -np.inf)
+    np.maximum.at(peak_max, city_codes, peak)
+    hour_counts = np.bincount(city_codes * HOURS_PER_DAY + peaks_df['peak_hour'].to_numpy(dtype=np.int64),
+                              minlength=n_cities * HOURS_PER_DAY).reshape(n_cities, HOURS_PER_DAY)
+    complete = ~np.isnan(load_factor)
+    complete_days = np.bincount(city_codes[complete], minlength=n_cities)
+    load_factor_sum = np.bincount(city_codes[complete], weights=load_factor[complete], minlength=n_cities)
+
+    paired = ~np.isnan(tmax)
+    codes, x, y = city_codes[paired], tmax[paired], peak[paired]
+    sums = [np.bincount(codes, weights=w, minlength=n_cities) for w in (np.ones(len(x)), x, y, x * x, y * y, x * y)]
+    correlation = _pearson(*sums)
+
+    stats = {}
+    for i, city in enumerate(cities):
+        corr = float(correlation[i])
+        stats[city] = {
+            "days": int(days[i]),
+            "mean_peak_demand_mwh": float(peak_sum[i] / days[i]),
+            "max_peak_demand_mwh": float(peak_max[i]),
+            "most_common_peak_hour": int(hour_counts[i].argmax()),
+            "mean_load_factor": float(load_factor_sum[i] / complete_days[i]) if complete_days[i] else None,
+            "peak_vs_tmax_correlation": corr if not np.isnan(corr) else None,
+            "peak_vs_tmax_r_squared": corr ** 2 if not np.isnan(corr) else None,
+        }
+    return dict(sorted(stats.items()))
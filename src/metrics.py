@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError: # Not available on Windows
+    resource = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+METRICS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'metrics')
+# Overwritten on every run, for the node_exporter textfile collector
+PROMETHEUS_FILE = os.path.join(METRICS_PATH, 'pipeline.prom')
+METRIC_PREFIX = "pipeline"
+
+class MetricsRegistry:
+    """Thread-safe in-process timers and counters for one pipeline run.
+
+    Recording is a lock and a dict update, cheap enough to leave on in production.
+    Series are keyed by name plus a sorted tuple of label pairs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.timers = {}
+            self.counters = {}
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            timer = self.timers.setdefault(key, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            timer["count"] += 1
+            timer["total_seconds"] += seconds
+            timer["max_seconds"] = max(timer["max_seconds"], seconds)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Times the enclosed block, recording it even if the block raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self, run_name):
+        """Returns the run report as a JSON-serializable dict."""
+        with self.lock:
+            return {
+                "run": run_name,
+                "started_at": self.started_at.isoformat(),
+                "finished_at": datetime.now().isoformat(),
+                "duration_seconds": time.perf_counter() - self.started,
+                "peak_rss_bytes": peak_rss_bytes(),
+                "timers": [{"name": name, "labels": dict(labels), **values}
+                           for (name, labels), values in sorted(self.timers.items())],
+                "counters": [{"name": name, "labels": dict(labels), "value": value}
+                             for (name, labels), value in sorted(self.counters.items())],
+            }
+
+def record_write(target, path, rows=None):
+    """Counts the rows and on-disk bytes of a file the pipeline just wrote."""
+    if rows is not None:
+        increment("rows_written", rows, target=target)
+    if os.path.isfile(path):
+        increment("bytes_written", os.path.getsize(path), target=target)
+
+def peak_rss_bytes():
+    """Returns the peak resident set size of this process in bytes, or None where unsupported."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in labels.items()) + "}"
+
+def to_prometheus(report):
+    """Renders a run report in the Prometheus text exposition format."""
+    run_labels = {"run": report["run"]}
+    finished = datetime.fromisoformat(report["finished_at"]).timestamp()
+    # metric name -> (type, sample lines); each family's samples must be contiguous
+    families = {}
+
+    def add(metric, kind, labels, value):
+        families.setdefault(metric, (kind, []))[1].append(f"{metric}{_prometheus_labels({**run_labels, **labels})} {value}")
+
+    add(f"{METRIC_PREFIX}_run_duration_seconds", "gauge", {}, f"{report['duration_seconds']:.6f}")
+    add(f"{METRIC_PREFIX}_last_run_timestamp_seconds", "gauge", {}, f"{finished:.0f}")
+    if report["peak_rss_bytes"] is not None:
+        add(f"{METRIC_PREFIX}_peak_rss_bytes", "gauge", {}, report["peak_rss_bytes"])
+    for timer in report["timers"]:
+        add(f"{METRIC_PREFIX}_{timer['name']}_seconds_total", "counter", timer["labels"], timer["total_seconds"])
+        add(f"{METRIC_PREFIX}_{timer['name']}_seconds_max", "gauge", timer["labels"], timer["max_seconds"])
+        add(f"{METRIC_PREFIX}_{timer['name']}_calls_total", "counter", timer["labels"], timer["count"])
+    for counter in report["counters"]:
+        add(f"{METRIC_PREFIX}_{counter['name']}_total", "counter", counter["labels"], counter["value"])
+
+    lines = []
+    for metric, (kind, samples) in families.items():
+        lines.append(f"# TYPE {metric} {kind}")
+        lines.extend(samples)
+    return "\n".join(lines) + "\n"
+
+def write_reports(run_name, registry=None, metrics_path=METRICS_PATH, prometheus_file=PROMETHEUS_FILE):
+    """Writes the per-run JSON report and the Prometheus text file. Returns the report."""
+    report = (registry or REGISTRY).report(run_name)
+    os.makedirs(metrics_path, exist_ok=True)
+    json_path = os.path.join(metrics_path, f"{run_name}_{datetime.now().strftime('%Y%m%dT%H%M%S%f')}.json")
+    with open(json_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    tmp_path = f"{prometheus_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(to_prometheus(report))
+    os.replace(tmp_path, prometheus_file)
+
+    slowest = sorted(report["timers"], key=lambda t: t["total_seconds"], reverse=True)[:5]
+    summary = ", ".join(f"{t['name']}{t['labels'] or ''}={t['total_seconds']:.2f}s" for t in slowest)
+    logging.info(f"Run metrics saved to {json_path} and {prometheus_file}. Slowest: {summary}")
+    return report
+
+REGISTRY = MetricsRegistry()
+# Module-level shortcuts to the process-wide registry
+timer = REGISTRY.timer
+increment = REGISTRY.increment
+reset = REGISTRY.reset
@@ -1,5 +1,6 @@
 import os
 import sys
+import argparse
 from datetime import datetime, timedelta
 import pandas as pd
 import logging
@@ -7,67 +8,157 @@ import logging
 # Add the src directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from data_fetcher import load_config, get_weather_data, get_energy_data, save_to_csv
-from data_processor import process_data
+from data_fetcher import load_config
+from fetch_scheduler import FetchScheduler, FetchJob
+from raw_store import upsert_records, RAW_STORE_PATH
+from retry_queue import RetryQueue
+from data_processor import process_data_incremental, process_data_hourly_incremental, PROCESSED_DATA_PATH, PROCESSED_DATASET_FILE
+from hourly import HOURLY_DATASET_FILE, hourly_mode_enabled
 from quality_checks import perform_quality_checks, generate_quality_report
-from analysis import analyze_data
+from analysis import analyze_data, ANALYTICS_DATA_PATH, ANALYTICS_FILES, HOURLY_ANALYTICS_FILES
+from dag import Stage, run_stages
+import catalog
+import metrics
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def run_pipeline():
-    """Runs the full data pipeline: fetch, process, quality check, and analyze."""
-    config = load_config()
-    api_keys = {
-        "noaa": config["noaa_token"],
-        "eia": config["eia_api_key"]
-    }
-    
-    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+# Quality-checked merged dataset the analysis stage reads
+QUALITY_DATASET_FILE = os.path.join(PROCESSED_DATA_PATH, 'merged_with_quality_flags.parquet')
+# The hourly stage only exists when processing.hourly_mode is enabled
+STAGE_NAMES = ["fetch", "process", "hourly", "quality", "analyze"]
 
-    # Ensure raw data directory exists
-    raw_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
-    if not os.path.exists(raw_data_path):
-        os.makedirs(raw_data_path)
+def fetch_stage(config, api_keys, fetch_date):
+    """Fetches one day of data for all cities concurrently into the raw store.
 
-    # Ensure weather data file exists with headers (will not overwrite existing data)
-    save_to_csv(None, "weather")
+    Failed fetches, and fetches the API had no data for yet, are recorded in the retry
+    queue; fetched cells leave it. Returns False if any fetch failed, so the stage isn't
+    recorded as complete and a rerun fetches again.
+    """
+    jobs = [FetchJob(data_type, city, fetch_date, fetch_date)
+            for city in config["cities"] for data_type in ("weather", "energy")]
+    fetched, failed, no_data = [], [], []
+    with FetchScheduler.from_config(config) as scheduler:
+        # A cache miss during offline replay says nothing about the API, so don't record it
+        replay = scheduler.client.cache is not None and scheduler.client.cache.replay
+        for job, records in scheduler.run(jobs, api_keys):
+            key = (job.city['name'], fetch_date, job.data_type)
+            if records is None:
+                failed.append(key)
+            elif records.empty:
+                no_data.append(key)
+            else:
+                upsert_records(records, job.data_type)
+                fetched.append(key)
 
-    # Fetch new data
-    for city in config["cities"]:
-        weather_data = get_weather_data(city, yesterday, api_keys["noaa"])
-        if weather_data:
-            save_to_csv(weather_data, "weather")
+    if not replay:
+        with RetryQueue.from_config(config) as retry_queue:
+            retry_queue.remove(fetched)
+            if failed:
+                retry_queue.record_failures(failed, "fetch_failed")
+            if no_data:
+                retry_queue.record_failures(no_data, "no_data")
+    if failed:
+        logging.warning(f"{len(failed)} of {len(jobs)} fetches failed and were queued for retry.")
+    return not failed
 
-        energy_data = get_energy_data(city, yesterday, api_keys["eia"])
-        if energy_data:
-            save_to_csv(energy_data, "energy")
+def hourly_stage():
+    """Rebuilds the months of the hourly dataset with new or revised raw rows and publishes it."""
+    hourly_df = process_data_hourly_incremental()
+    if hourly_df.empty:
+        logging.warning("No hourly data available.")
+        return
+    catalog.publish({"hourly_dataset": catalog.describe_artifact(HOURLY_DATASET_FILE, hourly_df)})
+
+def quality_stage(run_stamp):
+    """Runs quality checks on the merged dataset and writes the report and quality-flagged data."""
+    merged_df = pd.read_parquet(PROCESSED_DATASET_FILE) if os.path.exists(PROCESSED_DATASET_FILE) else pd.DataFrame()
 
-    # Process and perform quality checks
-    merged_df = process_data()
-    
     # Always perform quality checks and generate report, even if merged_df is empty
     df_with_quality = perform_quality_checks(merged_df)
 
     # Generate and save quality report
     quality_report_df = generate_quality_report(df_with_quality)
-    processed_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed')
-    report_filename = f"quality_report_{pd.Timestamp.now().strftime('%Y%m%d')}.csv"
-    report_filepath = os.path.join(processed_data_path, report_filename)
-    quality_report_df.to_csv(report_filepath, index=False)
+    report_filepath = os.path.join(PROCESSED_DATA_PATH, f"quality_report_{run_stamp}.csv")
+    with metrics.timer("write", target="quality_report"):
+        quality_report_df.to_csv(report_filepath, index=False)
     logging.info(f"Data quality report saved to {report_filepath}")
 
-    if not merged_df.empty:
-        # Save final data
-        final_df = df_with_quality[['date', 'city', 'tmax_f', 'tmin_f', 'demand_mwh', 'is_outlier', 'data_quality_score']]
-        output_filename = f"merged_{pd.Timestamp.now().strftime('%Y%m%d')}.parquet"
-        output_filepath = os.path.join(processed_data_path, output_filename)
+    if merged_df.empty:
+        logging.warning("No data available for further processing or analysis.")
+        return
+
+    # Save final data
+    final_df = df_with_quality[['date', 'city', 'tmax_f', 'tmin_f', 'demand_mwh', 'is_outlier', 'data_quality_score']]
+    output_filepath = os.path.join(PROCESSED_DATA_PATH, f"merged_{run_stamp}.parquet")
+    with metrics.timer("write", target="merged_snapshot"):
         final_df.to_parquet(output_filepath, index=False)
-        logging.info(f"Final processed data saved to {output_filepath}")
+    metrics.record_write("merged_snapshot", output_filepath, len(final_df))
+    logging.info(f"Final processed data saved to {output_filepath}")
 
-        # Perform analysis
-        analyze_data()
-    else:
-        logging.warning("No data available for further processing or analysis.")
+    tmp_path = f"{QUALITY_DATASET_FILE}.tmp"
+    with metrics.timer("write", target="quality_dataset"):
+        df_with_quality.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, QUALITY_DATASET_FILE)
+    metrics.record_write("quality_dataset", QUALITY_DATASET_FILE, len(df_with_quality))
+    logging.info(f"Merged data with quality flags saved to {QUALITY_DATASET_FILE}")
+    catalog.publish({"quality_dataset": catalog.describe_artifact(QUALITY_DATASET_FILE, df_with_quality)})
+
+def build_stages(config, api_keys, fetch_date, run_stamp):
+    """Declares the pipeline stages in dependency order, with the files each reads and writes."""
+    hourly = hourly_mode_enabled(config)
+    analytics_files = ANALYTICS_FILES + (HOURLY_ANALYTICS_FILES if hourly else [])
+    stages = [
+        Stage("fetch", lambda: fetch_stage(config, api_keys, fetch_date),
+              outputs=[RAW_STORE_PATH],
+              params={"date": fetch_date, "cities": [city["name"] for city in config["cities"]]}),
+        Stage("process", process_data_incremental,
+              inputs=[RAW_STORE_PATH], outputs=[PROCESSED_DATASET_FILE]),
+    ]
+    if hourly:
+        stages.append(Stage("hourly", hourly_stage, inputs=[RAW_STORE_PATH], outputs=[HOURLY_DATASET_FILE]))
+    return stages + [
+        # The dated report and snapshot it writes aren't fingerprinted: their names change
+        # daily, so listing them would rerun the stage even when its input is unchanged
+        Stage("quality", lambda: quality_stage(run_stamp),
+              inputs=[PROCESSED_DATASET_FILE], outputs=[QUALITY_DATASET_FILE]),
+        Stage("analyze", lambda: analyze_data(incremental=True, input_path=QUALITY_DATASET_FILE,
+                                              hourly_path=HOURLY_DATASET_FILE if hourly else None),
+              inputs=[QUALITY_DATASET_FILE] + ([HOURLY_DATASET_FILE] if hourly else []),
+              outputs=[os.path.join(ANALYTICS_DATA_PATH, filename) for filename in analytics_files],
+              params={"hourly_mode": hourly}),
+    ]
+
+def run_pipeline(start_from=None, only=None, force=False):
+    """Runs the data pipeline: fetch, process, quality check, and analyze.
+
+    Stages whose inputs are unchanged since their last run are skipped. start_from runs a
+    stage and everything downstream of it; only runs just the named stages; force reruns
+    every selected stage regardless of fingerprints. Timings and counters for the run are
+    written to data/metrics even if a stage fails.
+    """
+    metrics.reset()
+    config = load_config()
+    api_keys = {
+        "noaa": config["noaa_token"],
+        "eia": config["eia_api_key"]
+    }
+    
+    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    stages = build_stages(config, api_keys, yesterday, pd.Timestamp.now().strftime('%Y%m%d'))
+    try:
+        ran = run_stages(stages, start_from=start_from, only=only, force=force)
+    finally:
+        metrics.write_reports("pipeline")
+    logging.info(f"Pipeline finished. Stages run: {', '.join(ran) if ran else 'none'}.")
 
 if __name__ == "__main__":
-    run_pipeline()
+    parser = argparse.ArgumentParser(description="Run the weather and energy data pipeline.")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--from", dest="start_from", choices=STAGE_NAMES,
+                           help="Run this stage and every stage downstream of it.")
+    selection.add_argument("--only", action="append", choices=STAGE_NAMES,
+                           help="Run only this stage (repeatable).")
+    parser.add_argument("--force", action="store_true",
+                        help="Run the selected stages even if their inputs are unchanged.")
+    args = parser.parse_args()
+    run_pipeline(start_from=args.start_from, only=args.only, force=args.force)
@@ -2,45 +2,105 @@ import pandas as pd
 import os
 import logging
 from datetime import datetime, timedelta
+from functools import lru_cache
 import yaml
 
+import metrics
+from schema import apply_compact_schema, log_memory_usage
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def perform_quality_checks(df):
-    """Performs various quality checks on the merged DataFrame and adds a data quality score."""
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
+
+# Rows are flagged stale once their timestamp is this old
+STALE_AFTER_DAYS = 2
+
+# Registered checks in evaluation order: name -> (check function, contributes to the score).
+# A check takes the DataFrame and a context dict and returns a boolean Series aligned with it.
+QUALITY_CHECKS = {}
+
+def register_check(name, scored=True):
+    """Registers a vectorized quality check whose result is stored in the column `name`.
+
+    Checks run in registration order, so a check can build on columns added by earlier ones.
+    Only scored checks count towards the data quality score.
+    """
+    def decorator(func):
+        QUALITY_CHECKS[name] = (func, scored)
+        return func
+    return decorator
+
+@lru_cache(maxsize=1)
+def load_expected_cities():
+    """Returns the configured city names, reading config.yaml only once per process."""
+    with open(CONFIG_PATH, 'r') as f:
+        config = yaml.safe_load(f)
+    return tuple(city['name'] for city in config['cities'])
+
+# 1. Missing data detection
+@register_check('has_missing_data')
+def check_missing_data(df, context):
+    return df.isnull().any(axis=1)
+
+# 2. Outlier detection
+@register_check('is_temp_outlier', scored=False)
+def check_temp_outlier(df, context):
+    return ((df['tmax_f'] < -50) | (df['tmax_f'] > 130) | \
+            (df['tmin_f'] < -50) | (df['tmin_f'] > 130))
+
+@register_check('is_demand_outlier', scored=False)
+def check_demand_outlier(df, context):
+    return df['demand_mwh'] < 0
+
+@register_check('is_outlier')
+def check_outlier(df, context):
+    return df['is_temp_outlier'] | df['is_demand_outlier']
+
+# 3. Staleness check
+@register_check('is_stale')
+def check_stale(df, context):
+    return (context['current_time'] - df['timestamp_utc']) > timedelta(days=STALE_AFTER_DAYS)
+
+# 4. Synchronization check
+@register_check('all_cities_present')
+def check_all_cities_present(df, context):
+    expected_cities = set(context['expected_cities'])
+    # Count distinct expected cities per date once, then broadcast the result to the rows
+    cities_per_date = df.loc[df['city'].isin(expected_cities)].groupby('date')['city'].nunique()
+    return df['date'].map(cities_per_date).fillna(0).to_numpy() >= len(expected_cities)
+
+def perform_quality_checks(df, expected_cities=None):
+    """Performs the registered quality checks on the merged DataFrame and adds a data quality score.
+
+    expected_cities defaults to the cities in config.yaml.
+    """
     logging.info("Performing data quality checks...")
 
     if df.empty:
         logging.warning("DataFrame is empty, skipping quality checks.")
         return df
 
-    # 1. Missing data detection
-    df['has_missing_data'] = df.isnull().any(axis=1)
-
-    # 2. Outlier detection
-    df['is_temp_outlier'] = ((df['tmax_f'] < -50) | (df['tmax_f'] > 130) | \
-                             (df['tmin_f'] < -50) | (df['tmin_f'] > 130))
-    df['is_demand_outlier'] = (df['demand_mwh'] < 0)
-    df['is_outlier'] = df['is_temp_outlier'] | df['is_demand_outlier']
-
-    # 3. Staleness check
-    current_time = datetime.utcnow() # Use UTC time
+    apply_compact_schema(df)
     df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc']).dt.tz_convert(None) # Convert to naive UTC datetime
-    df['is_stale'] = (current_time - df['timestamp_utc']) > timedelta(hours=48)
+    context = {
+        'current_time': datetime.utcnow(), # Use UTC time
+        'expected_cities': expected_cities if expected_cities is not None else load_expected_cities(),
+    }
 
-    # 4. Synchronization check
-    config_path = os.path.join(os.path.dirname(__file__), '..', 'config', 'config.yaml')
-    with open(config_path, 'r') as f:
-        config = yaml.safe_load(f)
-    expected_cities = [city['name'] for city in config['cities']]
-    df['all_cities_present'] = df.groupby('date')['city'].transform(lambda x: set(expected_cities).issubset(set(x)))
+    scored_checks = []
+    for name, (check, scored) in QUALITY_CHECKS.items():
+        with metrics.timer("quality_check", check=name):
+            df[name] = check(df, context)
+        metrics.increment("quality_flagged_rows", int(df[name].sum()), check=name)
+        if scored:
+            scored_checks.append(name)
 
     # Calculate data quality score (0-100)
-    quality_checks = ['has_missing_data', 'is_outlier', 'is_stale', 'all_cities_present']
     # Score is based on the percentage of passed checks (i.e., False values)
-    df['data_quality_score'] = (1 - df[quality_checks].sum(axis=1) / len(quality_checks)) * 100
+    df['data_quality_score'] = ((1 - df[scored_checks].sum(axis=1) / len(scored_checks)) * 100).astype('float32')
 
     logging.info("Data quality checks completed.")
+    log_memory_usage("quality", df)
     return df
 
 def generate_quality_report(df):
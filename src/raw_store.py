@@ -0,0 +1,249 @@
+import os
+import logging
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+import metrics
+
+try:
+    import fcntl
+except ImportError: # Not available on Windows
+    fcntl = None
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+RAW_STORE_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw', 'store')
+
+# Typed columns for each raw source. Rows are unique on (city, timestamp_utc), and
+# ingested_at records when a row was last written so processing can pick up changes.
+SCHEMAS = {
+    "weather": pa.schema([
+        ("date", pa.timestamp("ns")),
+        ("city", pa.string()),
+        ("tmax_f", pa.float64()),
+        ("tmin_f", pa.float64()),
+        ("prcp", pa.float64()),
+        ("snow", pa.float64()),
+        ("snwd", pa.float64()),
+        ("awnd", pa.float64()),
+        ("tsun", pa.float64()),
+        ("wdf2", pa.float64()),
+        ("wsf2", pa.float64()),
+        ("timestamp_utc", pa.timestamp("ns", tz="UTC")),
+        ("ingested_at", pa.timestamp("ns", tz="UTC")),
+    ]),
+    "energy": pa.schema([
+        ("date", pa.timestamp("ns")),
+        ("city", pa.string()),
+        ("region", pa.string()),
+        ("demand_mwh", pa.float64()),
+        ("timestamp_utc", pa.timestamp("ns", tz="UTC")),
+        ("ingested_at", pa.timestamp("ns", tz="UTC")),
+    ]),
+}
+KEY_COLUMNS = ["city", "timestamp_utc"]
+# The columns carrying observations, i.e. everything except store bookkeeping
+DATA_COLUMNS = {source: [name for name in schema.names if name != "ingested_at"] for source, schema in SCHEMAS.items()}
+
+def _city_dir(source, city, store_path=RAW_STORE_PATH):
+    return os.path.join(store_path, f"source={source}", f"city={quote(city, safe='')}")
+
+def _partition_path(source, city, month, store_path=RAW_STORE_PATH):
+    return os.path.join(_city_dir(source, city, store_path), f"month={month}.parquet")
+
+def to_typed_frame(records, source):
+    """Converts raw fetch records (list of dicts or DataFrame) into a frame matching the source schema."""
+    schema = SCHEMAS[source]
+    df = pd.DataFrame(records)
+    df = df.reindex(columns=schema.names)
+    df['date'] = pd.to_datetime(df['date']).astype('datetime64[ns]')
+    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc'], utc=True).astype('datetime64[ns, UTC]')
+    for field in schema:
+        if pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype('float64')
+    return df
+
+def _write_partition(df, path, schema):
+    """Atomically replaces a partition file with the given rows."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+    tmp_path = f"{path}.tmp"
+    with metrics.timer("write", target="raw_store"):
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+    metrics.record_write("raw_store", path)
+
+@contextmanager
+def _partition_lock(path):
+    """Holds an exclusive lock on a partition, so concurrent writers never interleave read-merge-write cycles."""
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def upsert_records(records, source, store_path=RAW_STORE_PATH):
+    """Writes raw records into the partitioned store, replacing rows with the same (city, timestamp_utc).
+
+    Only the (city, month) partitions touched by the records are rewritten, each under a
+    lock so that concurrent fetch workers can upsert safely. Returns the number of rows written.
+    """
+    if records is None or len(records) == 0:
+        return 0
+    schema = SCHEMAS[source]
+    new_df = to_typed_frame(records, source)
+    new_df = new_df.dropna(subset=KEY_COLUMNS)
+    new_df['ingested_at'] = pd.Timestamp.now(tz='UTC')
+
+    months = new_df['date'].dt.strftime('%Y-%m')
+    for (city, month), partition_df in new_df.groupby([new_df['city'], months], sort=False):
+        path = _partition_path(source, city, month, store_path)
+        with _partition_lock(path):
+            if os.path.exists(path):
+                existing_df = ds.dataset(path, schema=schema, format="parquet").to_table().to_pandas()
+                partition_df = pd.concat([existing_df, partition_df], ignore_index=True)
+            partition_df = (partition_df.drop_duplicates(subset=KEY_COLUMNS, keep='last')
+                            .sort_values('timestamp_utc')
+                            .reset_index(drop=True))
+            _write_partition(partition_df, path, schema)
+
+    metrics.increment("rows_upserted", len(new_df), source=source)
+    logging.info(f"Upserted {len(new_df)} {source} rows into {os.path.join(store_path, f'source={source}')}")
+    return len(new_df)
+
+def list_partitions(source, start_date=None, end_date=None, cities=None, store_path=RAW_STORE_PATH):
+    """Returns the partition files that may hold rows for the given cities and date window."""
+    source_dir = os.path.join(store_path, f"source={source}")
+    if not os.path.isdir(source_dir):
+        return []
+    start_month = pd.Timestamp(start_date).strftime('%Y-%m') if start_date else None
+    end_month = pd.Timestamp(end_date).strftime('%Y-%m') if end_date else None
+    wanted_cities = set(cities) if cities else None
+
+    paths = []
+    for city_dir in sorted(os.listdir(source_dir)):
+        if not city_dir.startswith("city="):
+            continue
+        if wanted_cities is not None and unquote(city_dir[len("city="):]) not in wanted_cities:
+            continue
+        for filename in sorted(os.listdir(os.path.join(source_dir, city_dir))):
+            if not (filename.startswith("month=") and filename.endswith(".parquet")):
+                continue
+            month = filename[len("month="):-len(".parquet")]
+            if (start_month and month < start_month) or (end_month and month > end_month):
+                continue
+            paths.append(os.path.join(source_dir, city_dir, filename))
+    return paths
+
+def _window_filter(start_date=None, end_date=None, cities=None):
+    """Builds the dataset filter expression for a date window and city list (None if unrestricted)."""
+    filters = []
+    if start_date:
+        filters.append(ds.field("date") >= pa.scalar(pd.Timestamp(start_date), type=pa.timestamp("ns")))
+    if end_date:
+        filters.append(ds.field("date") <= pa.scalar(pd.Timestamp(end_date), type=pa.timestamp("ns")))
+    if cities:
+        filters.append(ds.field("city").isin(list(cities)))
+    expression = None
+    for condition in filters:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def read_raw(source, start_date=None, end_date=None, cities=None, columns=None, store_path=RAW_STORE_PATH):
+    """Reads raw rows for a source, optionally restricted to a date window, cities and columns.
+
+    Partitions outside the window or city list are never opened, and the date filter is pushed
+    down to the Parquet row groups of the partitions that are.
+    """
+    schema = SCHEMAS[source]
+    paths = list_partitions(source, start_date, end_date, cities, store_path)
+    if not paths:
+        empty_df = schema.empty_table().to_pandas()
+        return empty_df[columns] if columns else empty_df
+
+    dataset = ds.dataset(paths, schema=schema, format="parquet")
+    table = dataset.to_table(columns=columns, filter=_window_filter(start_date, end_date, cities))
+    return table.to_pandas()
+
+def coverage(source, start_date=None, end_date=None, cities=None, store_path=RAW_STORE_PATH):
+    """Returns the stored row count per (city, date) of a source in the window, as a DataFrame.
+
+    Only the city and date columns are read, so the index costs a small fraction of reading
+    the rows themselves.
+    """
+    df = read_raw(source, start_date, end_date, cities, columns=['city', 'date'], store_path=store_path)
+    return df.groupby(['city', 'date']).size().rename('rows').reset_index()
+
+def iter_raw_batches(source, batch_size, start_date=None, end_date=None, cities=None, columns=None,
+                     store_path=RAW_STORE_PATH):
+    """Yields raw rows as DataFrames of at most batch_size rows, without loading the whole window."""
+    paths = list_partitions(source, start_date, end_date, cities, store_path)
+    if not paths:
+        return
+    dataset = ds.dataset(paths, schema=SCHEMAS[source], format="parquet")
+    for batch in dataset.to_batches(columns=columns, filter=_window_filter(start_date, end_date, cities),
+                                    batch_size=batch_size):
+        if batch.num_rows:
+            yield batch.to_pandas()
+
+def read_changes(source, watermarks, columns=None, store_path=RAW_STORE_PATH):
+    """Reads rows ingested after each city's watermark.
+
+    watermarks maps city names to a UTC pd.Timestamp; cities without a watermark are read in
+    full. Partition files not modified since their city's watermark are skipped unopened.
+    """
+    paths = []
+    expression = None
+    for path in list_partitions(source, store_path=store_path):
+        city = unquote(os.path.basename(os.path.dirname(path))[len("city="):])
+        watermark = watermarks.get(city)
+        if watermark is not None and pd.Timestamp(os.path.getmtime(path), unit='s', tz='UTC') <= watermark:
+            continue
+        paths.append(path)
+        condition = ds.field("city") == city
+        if watermark is not None:
+            condition = condition & (ds.field("ingested_at") > pa.scalar(watermark, type=pa.timestamp("ns", tz="UTC")))
+        expression = condition if expression is None else expression | condition
+
+    schema = SCHEMAS[source]
+    if not paths:
+        empty_df = schema.empty_table().to_pandas()
+        return empty_df[columns] if columns else empty_df
+    dataset = ds.dataset(paths, schema=schema, format="parquet")
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+def has_data(source, store_path=RAW_STORE_PATH):
+    """Returns True if the store holds at least one partition for the source."""
+    return bool(list_partitions(source, store_path=store_path))
+
+def migrate_csv_to_store(raw_data_path=None, store_path=RAW_STORE_PATH):
+    """Imports the legacy append-only weather_data.csv and energy_data.csv into the store.
+
+    Duplicate rows in the CSVs collapse to the last row for each (city, timestamp_utc).
+    """
+    if raw_data_path is None:
+        raw_data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'raw')
+    for source in SCHEMAS:
+        csv_path = os.path.join(raw_data_path, f"{source}_data.csv")
+        if not os.path.exists(csv_path):
+            logging.warning(f"No legacy CSV found at {csv_path}, skipping {source} migration.")
+            continue
+        try:
+            df = pd.read_csv(csv_path)
+        except pd.errors.EmptyDataError:
+            logging.warning(f"{csv_path} is empty, skipping {source} migration.")
+            continue
+        upsert_records(df, source, store_path)
+
+if __name__ == "__main__":
+    migrate_csv_to_store()
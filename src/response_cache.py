@@ -0,0 +1,149 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+DEFAULT_CACHE_DIR = os.path.join('data', 'raw_responses', 'cache')
+CACHE_MODES = ("off", "readwrite", "replay")
+# Request parameters that carry credentials and must not affect the cache key
+SECRET_PARAMS = {"api_key", "token"}
+
+class ResponseCache:
+    """Content-addressed on-disk cache of raw NOAA/EIA JSON responses.
+
+    Entries are keyed by the endpoint plus the normalized request parameters. Responses
+    for windows that ended more than `immutable_after_days` ago never expire; more recent
+    ones expire after `ttl_hours`. When the cache grows beyond `max_size_mb`, the least
+    recently used entries are evicted.
+
+    In "replay" mode the cache is the only source of data and callers must not touch
+    the network.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, mode="readwrite", ttl_hours=24,
+                 immutable_after_days=7, max_size_mb=1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown response cache mode: {mode}. Expected one of {CACHE_MODES}.")
+        if not os.path.isabs(cache_dir):
+            cache_dir = os.path.join(PROJECT_ROOT, cache_dir)
+        self.cache_dir = cache_dir
+        self.mode = mode
+        self.ttl_seconds = ttl_hours * 3600
+        self.immutable_after_days = immutable_after_days
+        self.max_size_bytes = max_size_mb * 1024 * 1024
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.total_bytes = sum(os.path.getsize(path) for path in self._entry_paths())
+
+    @classmethod
+    def from_config(cls, config):
+        """Creates a cache from the `response_cache` section of the configuration, or None if disabled."""
+        cache_config = config.get("response_cache", {})
+        mode = cache_config.get("mode", "readwrite")
+        if mode == "off":
+            return None
+        return cls(
+            cache_dir=cache_config.get("directory", DEFAULT_CACHE_DIR),
+            mode=mode,
+            ttl_hours=cache_config.get("ttl_hours", 24),
+            immutable_after_days=cache_config.get("immutable_after_days", 7),
+            max_size_mb=cache_config.get("max_size_mb", 1024),
+        )
+
+    @property
+    def replay(self):
+        return self.mode == "replay"
+
+    @staticmethod
+    def make_key(endpoint, params):
+        """Returns the cache key for an endpoint and its request parameters (credentials excluded)."""
+        items = params.items() if isinstance(params, dict) else (params or [])
+        normalized = sorted((str(k), str(v)) for k, v in items if k not in SECRET_PARAMS)
+        payload = json.dumps({"endpoint": endpoint, "params": normalized}, separators=(',', ':'))
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def is_immutable(self, end_date):
+        """Returns True if data for a window ending on end_date (YYYY-MM-DD) is considered final."""
+        cutoff = datetime.now() - timedelta(days=self.immutable_after_days)
+        return datetime.strptime(end_date, '%Y-%m-%d') < cutoff
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _entry_paths(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for filename in files:
+                if filename.endswith('.json'):
+                    yield os.path.join(root, filename)
+
+    def get(self, endpoint, params):
+        """Returns the cached payload for a request, or None on a miss or expired entry."""
+        path = self._entry_path(self.make_key(endpoint, params))
+        try:
+            with open(path, 'r') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Discarding unreadable response cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+        # In replay mode stale entries are still better than nothing
+        if not entry.get("immutable") and not self.replay and time.time() - entry["fetched_at"] > self.ttl_seconds:
+            self._remove(path)
+            return None
+
+        try:
+            os.utime(path) # Mark as recently used for eviction
+        except FileNotFoundError:
+            pass
+        return entry["payload"]
+
+    def put(self, endpoint, params, payload, immutable=False):
+        """Stores a response payload and evicts old entries if the cache exceeds its size limit."""
+        path = self._entry_path(self.make_key(endpoint, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        items = params.items() if isinstance(params, dict) else (params or [])
+        entry = {
+            "endpoint": endpoint,
+            "params": [[k, v] for k, v in items if k not in SECRET_PARAMS],
+            "fetched_at": time.time(),
+            "immutable": immutable,
+            "payload": payload,
+        }
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(entry, f)
+        with self.lock:
+            previous_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp_path, path)
+            self.total_bytes += os.path.getsize(path) - previous_size
+            if self.total_bytes > self.max_size_bytes:
+                self._evict()
+
+    def _remove(self, path):
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """Removes least recently used entries until the cache fits in max_size_bytes. Caller holds the lock."""
+        entries = sorted(self._entry_paths(), key=os.path.getmtime)
+        for path in entries:
+            if self.total_bytes <= self.max_size_bytes:
+                break
+            size = os.path.getsize(path)
+            os.remove(path)
+            self.total_bytes -= size
+        logging.info(f"Evicted response cache entries; cache size is now {self.total_bytes / (1024 * 1024):.1f} MB")
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), '..')
+RETRY_QUEUE_FILE = os.path.join(PROJECT_ROOT, 'data', 'raw_responses', 'retry_queue.sqlite')
+# Skip list written by earlier versions of the backfill; imported once, then renamed
+LEGACY_FAILED_FETCHES_FILE = os.path.join(PROJECT_ROOT, 'data', 'raw_responses', 'failed_fetches.json')
+
+DEFAULT_BASE_DELAY_SECONDS = 3600
+DEFAULT_MAX_DELAY_SECONDS = 7 * 24 * 3600
+DEFAULT_MAX_ATTEMPTS = 10
+DEFAULT_LEASE_SECONDS = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS fetch_retries (
+    city TEXT NOT NULL,
+    date TEXT NOT NULL,
+    data_type TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    first_failed_at REAL NOT NULL,
+    last_attempt_at REAL NOT NULL,
+    next_attempt_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_until REAL,
+    PRIMARY KEY (city, date, data_type)
+);
+CREATE INDEX IF NOT EXISTS fetch_retries_due ON fetch_retries (status, next_attempt_at);
+"""
+
+class RetryQueue:
+    """Durable queue of (city, date, data_type) fetches to retry, stored in SQLite.
+
+    Every failure increments the item's attempt count, records the error class and pushes
+    its next eligible time out with exponential backoff; after max_attempts the item is
+    parked as 'dead' until cleared. Each change is committed immediately, so a crash loses
+    at most the attempt in flight. Workers in separate processes drain the queue safely:
+    claim() leases due items inside an IMMEDIATE transaction, so no two workers get the same
+    item until its lease expires.
+    """
+
+    def __init__(self, path=RETRY_QUEUE_FILE, base_delay_seconds=DEFAULT_BASE_DELAY_SECONDS,
+                 max_delay_seconds=DEFAULT_MAX_DELAY_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS,
+                 lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.path = path
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Autocommit mode; transactions are opened explicitly where several statements must be atomic
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+
+    @classmethod
+    def from_config(cls, config, path=RETRY_QUEUE_FILE):
+        """Creates the queue with the backoff settings of the retry_queue config section."""
+        queue_config = config.get("retry_queue", {})
+        return cls(
+            path,
+            base_delay_seconds=queue_config.get("base_delay_seconds", DEFAULT_BASE_DELAY_SECONDS),
+            max_delay_seconds=queue_config.get("max_delay_seconds", DEFAULT_MAX_DELAY_SECONDS),
+            max_attempts=queue_config.get("max_attempts", DEFAULT_MAX_ATTEMPTS),
+            lease_seconds=queue_config.get("lease_seconds", DEFAULT_LEASE_SECONDS),
+        )
+
+    @contextmanager
+    def transaction(self):
+        """Runs the enclosed statements in one write transaction, taking the write lock up front."""
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield self.connection
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        self.connection.execute("COMMIT")
+
+    def backoff_seconds(self, attempts):
+        """Returns the wait before the next attempt of an item that has failed `attempts` times."""
+        return min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (attempts - 1))
+
+    def record_failures(self, keys, error, now=None):
+        """Records one failed attempt for each (city, date, data_type) key, in a single transaction."""
+        now = now if now is not None else time.time()
+        with self.transaction() as connection:
+            for city, date, data_type in keys:
+                row = connection.execute("SELECT attempts FROM fetch_retries WHERE city=? AND date=? AND data_type=?",
+                                         (city, date, data_type)).fetchone()
+                attempts = (row[0] if row else 0) + 1
+                status = 'dead' if attempts >= self.max_attempts else 'pending'
+                connection.execute(
+                    "INSERT INTO fetch_retries (city, date, data_type, attempts, last_error, first_failed_at,"
+                    " last_attempt_at, next_attempt_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (city, date, data_type) DO UPDATE SET attempts=excluded.attempts,"
+                    " last_error=excluded.last_error, last_attempt_at=excluded.last_attempt_at,"
+                    " next_attempt_at=excluded.next_attempt_at, status=excluded.status,"
+                    " lease_owner=NULL, lease_until=NULL",
+                    (city, date, data_type, attempts, error, now, now, now + self.backoff_seconds(attempts), status))
+                if status == 'dead':
+                    logging.warning(f"Giving up on {data_type} data for {city} on {date} after {attempts} attempts ({error}).")
+
+    def remove(self, keys):
+        """Removes keys that have been fetched or no longer apply; keys that were never queued are ignored."""
+        with self.transaction() as connection:
+            connection.executemany("DELETE FROM fetch_retries WHERE city=? AND date=? AND data_type=?", list(keys))
+
+    def blocked_keys(self, now=None):
+        """Returns the keys that must not be fetched now: backing off, leased by a worker, or dead."""
+        now = now if now is not None else time.time()
+        rows = self.connection.execute(
+            "SELECT city, date, data_type FROM fetch_retries"
+            " WHERE status='dead' OR next_attempt_at > ? OR lease_until > ?", (now, now))
+        return set(rows.fetchall())
+
+    def claim(self, limit=100, worker=None, now=None):
+        """Leases up to `limit` due items to this worker and returns their (city, date, data_type) keys.
+
+        A claimed item is invisible to other workers until it is recorded as a success or a
+        failure, or until its lease expires because the worker died.
+        """
+        now = now if now is not None else time.time()
+        worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+        with self.transaction() as connection:
+            keys = connection.execute(
+                "SELECT city, date, data_type FROM fetch_retries WHERE status='pending' AND next_attempt_at <= ?"
+                " AND (lease_until IS NULL OR lease_until <= ?) ORDER BY next_attempt_at LIMIT ?",
+                (now, now, limit)).fetchall()
+            connection.executemany(
+                "UPDATE fetch_retries SET lease_owner=?, lease_until=? WHERE city=? AND date=? AND data_type=?",
+                [(worker, now + self.lease_seconds, *key) for key in keys])
+        return keys
+
+    def stats(self):
+        """Returns the number of queued items by status, plus how many pending items are due now."""
+        counts = dict(self.connection.execute("SELECT status, COUNT(*) FROM fetch_retries GROUP BY status").fetchall())
+        due = self.connection.execute("SELECT COUNT(*) FROM fetch_retries WHERE status='pending' AND next_attempt_at <= ?",
+                                      (time.time(),)).fetchone()[0]
+        return {"pending": counts.get('pending', 0), "dead": counts.get('dead', 0), "due": due}
+
+    def items(self):
+        """Returns every queued item as a dict, soonest first."""
+        cursor = self.connection.execute("SELECT * FROM fetch_retries ORDER BY next_attempt_at")
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def clear(self, dead_only=False):
+        """Deletes every queued item (or only the dead ones). Returns the number deleted."""
+        with self.transaction() as connection:
+            cursor = connection.execute("DELETE FROM fetch_retries" + (" WHERE status='dead'" if dead_only else ""))
+        return cursor.rowcount
+
+    def import_legacy_failed_fetches(self, path=LEGACY_FAILED_FETCHES_FILE):
+        """Queues the entries of an old failed_fetches.json as due for retry, then renames the file."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, 'r') as f:
+            keys = [tuple(item) for item in json.load(f)]
+        now = time.time()
+        with self.transaction() as connection:
+            connection.executemany(
+                "INSERT OR IGNORE INTO fetch_retries (city, date, data_type, attempts, last_error, first_failed_at,"
+                " last_attempt_at, next_attempt_at) VALUES (?, ?, ?, 1, 'legacy_skip_list', ?, ?, ?)",
+                [(city, date, data_type, now, now, now) for city, date, data_type in keys])
+        os.replace(path, f"{path}.migrated")
+        logging.info(f"Imported {len(keys)} entries from {path} into the retry queue.")
+        return len(keys)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+def format_items(items):
+    """Formats queued items as a readable table for the command line."""
+    lines = [f"{'city':<14} {'date':<10} {'type':<7} {'tries':>5}  {'status':<7} {'next attempt':<19}  last error"]
+    for item in items:
+        next_attempt = datetime.fromtimestamp(item['next_attempt_at']).strftime('%Y-%m-%d %H:%M:%S')
+        lines.append(f"{item['city']:<14} {item['date']:<10} {item['data_type']:<7} {item['attempts']:>5}  "
+                     f"{item['status']:<7} {next_attempt:<19}  {item['last_error']}")
+    return "\n".join(lines)
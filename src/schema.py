@@ -0,0 +1,62 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Canonical compact dtypes for the merged weather/energy frame used by every stage after fetching.
+# demand_mwh is int32 when every value is a whole number in range, otherwise float32.
+MERGED_SCHEMA = {
+    'date': 'datetime64[ns]',
+    'hour': 'int8',
+    'city': 'category',
+    'region': 'category',
+    'tmax_f': 'float32',
+    'tmin_f': 'float32',
+    'prcp': 'float32',
+    'snow': 'float32',
+    'snwd': 'float32',
+    'awnd': 'float32',
+    'tsun': 'float32',
+    'wdf2': 'float32',
+    'wsf2': 'float32',
+    'demand_mwh': 'int32',
+    'data_quality_score': 'float32',
+}
+
+INT32_MIN, INT32_MAX = np.iinfo(np.int32).min, np.iinfo(np.int32).max
+
+def _fits_int32(series):
+    values = series.to_numpy(dtype=float)
+    return (not np.isnan(values).any()
+            and np.array_equal(values, np.round(values))
+            and (len(values) == 0 or (values.min() >= INT32_MIN and values.max() <= INT32_MAX)))
+
+def apply_compact_schema(df):
+    """Casts the columns of df that appear in MERGED_SCHEMA to their compact dtypes, in place.
+
+    Columns not in the schema are left alone. Returns df for chaining.
+    """
+    for column, dtype in MERGED_SCHEMA.items():
+        if column not in df.columns:
+            continue
+        if dtype == 'datetime64[ns]':
+            df[column] = pd.to_datetime(df[column]).astype(dtype)
+        elif dtype == 'category':
+            if not isinstance(df[column].dtype, pd.CategoricalDtype):
+                df[column] = df[column].astype('category')
+        elif dtype == 'int32':
+            numeric = pd.to_numeric(df[column], errors='coerce')
+            df[column] = numeric.astype('int32') if _fits_int32(numeric) else numeric.astype('float32')
+        else:
+            df[column] = pd.to_numeric(df[column], errors='coerce').astype(dtype)
+    return df
+
+def memory_usage_mb(df):
+    """Returns the deep memory footprint of a DataFrame in megabytes."""
+    return df.memory_usage(deep=True).sum() / (1024 * 1024)
+
+def log_memory_usage(stage, df):
+    """Logs the row count and memory footprint of the frame produced by a pipeline stage."""
+    logging.info(f"[{stage}] {len(df)} rows, {memory_usage_mb(df):.2f} MB in memory")
@@ -0,0 +1,254 @@
+import os
+import json
+import logging
+import math
+
+import numpy as np
+import pandas as pd
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+STATE_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'analytics', 'state', 'accumulators.json')
+DAY_TYPES = ['Weekday', 'Weekend']
+MOMENT_COLUMNS = {'demand': 'demand_mwh', 'tmax': 'tmax_f', 'tmin': 'tmin_f'}
+# Bumped when the persisted layout changes; state of another version is rebuilt
+STATE_VERSION = 2
+
+class MomentAccumulator:
+    """Mergeable count, mean and sum of squared deviations (M2) of one variable.
+
+    Batches are combined with Chan et al.'s parallel form of Welford's algorithm, so
+    accumulators built over separate shards merge into exactly the statistics of the union.
+    """
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.n, self.mean, self.m2 = other.n, other.mean, other.m2
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+        return self
+
+    def std(self, ddof=1):
+        if self.n <= ddof:
+            return float('nan')
+        return math.sqrt(self.m2 / (self.n - ddof))
+
+    def result_mean(self):
+        return self.mean if self.n else float('nan')
+
+    def to_dict(self):
+        return {"n": self.n, "mean": self.mean, "m2": self.m2}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["n"], data["mean"], data["m2"])
+
+class CoMomentAccumulator:
+    """Mergeable co-moments of two paired variables, enough to compute Pearson's r."""
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, m2_x=0.0, m2_y=0.0, c_xy=0.0):
+        self.n = n
+        self.mean_x = mean_x
+        self.mean_y = mean_y
+        self.m2_x = m2_x
+        self.m2_y = m2_y
+        self.c_xy = c_xy
+
+    def merge(self, other):
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update(other.__dict__)
+            return self
+        n = self.n + other.n
+        dx = other.mean_x - self.mean_x
+        dy = other.mean_y - self.mean_y
+        weight = self.n * other.n / n
+        self.m2_x += other.m2_x + dx * dx * weight
+        self.m2_y += other.m2_y + dy * dy * weight
+        self.c_xy += other.c_xy + dx * dy * weight
+        self.mean_x += dx * other.n / n
+        self.mean_y += dy * other.n / n
+        self.n = n
+        return self
+
+    def correlation(self):
+        denominator = math.sqrt(self.m2_x * self.m2_y)
+        if self.n < 2 or denominator == 0:
+            return float('nan')
+        return self.c_xy / denominator
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+def _new_cell():
+    cell = {name: MomentAccumulator() for name in MOMENT_COLUMNS}
+    cell['tmax_demand'] = CoMomentAccumulator()
+    return cell
+
+def month_keys(dates):
+    """Returns the 'YYYY-MM' state partition of each date."""
+    return pd.DatetimeIndex(dates).strftime('%Y-%m')
+
+def accumulate(df):
+    """Builds accumulator state from a merged frame indexed by date.
+
+    The state maps month ('YYYY-MM') -> city -> day type -> accumulators. Keeping the months
+    apart lets update_state replace the months whose rows changed without touching the
+    rest of the history. Moments for every (month, city, day type) cell are computed with
+    one vectorized groupby per statistic.
+    """
+    state = {}
+    if df.empty:
+        return state
+    month = pd.Series(month_keys(df.index), index=df.index)
+    day_type = pd.Series(np.where(df.index.dayofweek >= 5, 'Weekend', 'Weekday'), index=df.index)
+    keys = [month, df['city'], day_type]
+
+    for name, column in MOMENT_COLUMNS.items():
+        # Reduce in float64 even when the frame stores compact float32 columns
+        grouped = df[column].astype('float64').groupby(keys, sort=False, observed=True)
+        batch = pd.DataFrame({'n': grouped.count(), 'mean': grouped.mean(), 'var': grouped.var(ddof=0)})
+        for (cell_month, city, cell_day_type), row in batch.iterrows():
+            cell = state.setdefault(cell_month, {}).setdefault(city, {}).setdefault(cell_day_type, _new_cell())
+            if row['n'] > 0:
+                cell[name].merge(MomentAccumulator(int(row['n']), float(row['mean']), float(row['var'] * row['n'])))
+
+    paired = (df[['city', 'tmax_f', 'demand_mwh']].astype({'tmax_f': 'float64', 'demand_mwh': 'float64'})
+              .assign(month=month, day_type=day_type).dropna(subset=['tmax_f', 'demand_mwh']))
+    if not paired.empty:
+        cell_keys = ['month', 'city', 'day_type']
+        grouped = paired.groupby(cell_keys, sort=False, observed=True)
+        dx = paired['tmax_f'] - grouped['tmax_f'].transform('mean')
+        dy = paired['demand_mwh'] - grouped['demand_mwh'].transform('mean')
+        moments = paired[cell_keys].assign(dxx=dx * dx, dyy=dy * dy, dxy=dx * dy)
+        sums = moments.groupby(cell_keys, sort=False, observed=True)[['dxx', 'dyy', 'dxy']].sum()
+        means = grouped[['tmax_f', 'demand_mwh']].mean()
+        counts = grouped.size()
+        for key in sums.index:
+            state[key[0]][key[1]][key[2]]['tmax_demand'].merge(CoMomentAccumulator(
+                int(counts[key]), float(means.loc[key, 'tmax_f']), float(means.loc[key, 'demand_mwh']),
+                float(sums.loc[key, 'dxx']), float(sums.loc[key, 'dyy']), float(sums.loc[key, 'dxy'])))
+    return state
+
+def merge_states(*states):
+    """Merges accumulator states computed over disjoint shards into a new state."""
+    merged = {}
+    for state in states:
+        for month, cities in state.items():
+            for city, cells in cities.items():
+                target = merged.setdefault(month, {}).setdefault(city, {})
+                for day_type, cell in cells.items():
+                    target_cell = target.setdefault(day_type, _new_cell())
+                    for name, accumulator in cell.items():
+                        target_cell[name].merge(accumulator)
+    return merged
+
+def update_state(state, df, months):
+    """Replaces the given months of the state with the statistics of df.
+
+    df holds every row of those months (indexed by date) and nothing else is read, so an
+    update costs the size of the changed months, not of the history. A month with no rows
+    left in df is dropped from the state.
+    """
+    months = set(months)
+    df = df[month_keys(df.index).isin(months)]
+    logging.info(f"Updating statistics accumulators with {len(df)} rows of {len(months)} changed months.")
+    kept = {month: cities for month, cities in state.items() if month not in months}
+    return merge_states(kept, accumulate(df))
+
+def _cells(state, city=None, day_type=None):
+    """Returns the cells of every month, optionally only those of one city and/or day type."""
+    return [cell for cities in state.values() for cell_city, cells in cities.items() if city in (None, cell_city)
+            for cell_day_type, cell in cells.items() if day_type in (None, cell_day_type)]
+
+def _cities(state):
+    return sorted({city for cities in state.values() for city in cities})
+
+def _merge_cells(cells, name):
+    total = MomentAccumulator() if name in MOMENT_COLUMNS else CoMomentAccumulator()
+    for cell in cells:
+        total.merge(cell[name])
+    return total
+
+def correlations_from_state(state):
+    """Returns correlations.json content (Pearson r and R² of tmax vs demand per city)."""
+    correlations = {}
+    for city in _cities(state):
+        comoments = _merge_cells(_cells(state, city), 'tmax_demand')
+        if comoments.n > 1:
+            corr = comoments.correlation()
+            correlations[city] = {
+                "pearson_correlation": corr,
+                "r_squared": corr**2
+            }
+    return correlations
+
+def summary_stats_from_state(state):
+    """Returns summary_stats.json content computed from the accumulators."""
+    all_cells = _cells(state)
+    demand = _merge_cells(all_cells, 'demand')
+    demand_by_city = {city: _merge_cells(_cells(state, city), 'demand').result_mean() for city in _cities(state)}
+    demand_by_day_type = {}
+    for day_type in DAY_TYPES:
+        cells = _cells(state, day_type=day_type)
+        if cells:
+            demand_by_day_type[day_type] = _merge_cells(cells, 'demand').result_mean()
+    return {
+        "overall_demand_mwh_mean": demand.result_mean(),
+        "overall_demand_mwh_std": demand.std(ddof=1),
+        "overall_tmax_f_mean": _merge_cells(all_cells, 'tmax').result_mean(),
+        "overall_tmin_f_mean": _merge_cells(all_cells, 'tmin').result_mean(),
+        "demand_by_city": demand_by_city,
+        "demand_weekday_vs_weekend": demand_by_day_type
+    }
+
+def load_state(path=STATE_FILE):
+    """Loads persisted accumulator state, or an empty state if none exists.
+
+    State saved before it was kept per month can't be updated by month, so it is ignored
+    and the statistics are rebuilt once.
+    """
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        stored = json.load(f)
+    if stored.get("version") != STATE_VERSION:
+        logging.info("Statistics accumulators were saved in an older format; they will be rebuilt.")
+        return {}
+    state = {}
+    for month, cities in stored["months"].items():
+        for city, cells in cities.items():
+            for day_type, cell in cells.items():
+                accumulators = {name: MomentAccumulator.from_dict(data) for name, data in cell.items() if name in MOMENT_COLUMNS}
+                accumulators['tmax_demand'] = CoMomentAccumulator.from_dict(cell['tmax_demand'])
+                state.setdefault(month, {}).setdefault(city, {})[day_type] = accumulators
+    return state
+
+def save_state(state, path=STATE_FILE):
+    """Persists accumulator state atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    serializable = {"version": STATE_VERSION,
+                    "months": {month: {city: {day_type: {name: accumulator.to_dict() for name, accumulator in cell.items()}
+                                              for day_type, cell in cells.items()}
+                                       for city, cells in cities.items()}
+                               for month, cities in state.items()}}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(serializable, f)
+    os.replace(tmp_path, path)
@@ -0,0 +1,52 @@
+import os
+import sys
+import argparse
+from functools import partial
+
+import pytest
+
+# The pipeline modules import each other by bare name, as the scripts do
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+for path in (ROOT, os.path.join(ROOT, 'src'), os.path.join(ROOT, 'benchmarks'), os.path.join(ROOT, 'dashboards')):
+    sys.path.append(path)
+
+import data_processor
+import raw_store
+from load_test import load_test_config
+from mock_api_server import MockAPIServer, FaultProfile
+
+# Fetch settings for tests against the mock server: fast retries, no meaningful rate limit
+FETCH_SETTINGS = argparse.Namespace(concurrency=4, timeout=2.0, retries=1, backoff_base=0.01, rps=1000, burst=100)
+API_KEYS = {"noaa": "mock-token", "eia": "mock-key"}
+
+@pytest.fixture
+def store_path(tmp_path, monkeypatch):
+    """Points the raw store functions at an empty store under tmp_path instead of data/raw/store."""
+    path = str(tmp_path / 'store')
+    for name in ('upsert_records', 'read_raw', 'coverage', 'iter_raw_batches', 'read_changes', 'has_data'):
+        monkeypatch.setattr(raw_store, name, partial(getattr(raw_store, name), store_path=path))
+    return path
+
+@pytest.fixture
+def processed_files(tmp_path, monkeypatch):
+    """Points the merged dataset and processing watermarks at tmp_path."""
+    monkeypatch.setattr(data_processor, 'PROCESSED_DATASET_FILE', str(tmp_path / 'merged_dataset.parquet'))
+    monkeypatch.setattr(data_processor, 'WATERMARKS_FILE', str(tmp_path / 'state' / 'watermarks.json'))
+
+@pytest.fixture
+def mock_api():
+    """Returns start(n_cities, faults, max_page_size), which serves a mock NOAA and EIA API.
+
+    start returns the server and a pipeline config for n_cities that fetches from it. Every
+    server started is shut down after the test.
+    """
+    servers = []
+
+    def start(n_cities=3, faults=None, max_page_size=None):
+        server = MockAPIServer(faults=faults or FaultProfile(0, 0), max_page_size=max_page_size).start()
+        servers.append(server)
+        return server, load_test_config(server, n_cities, FETCH_SETTINGS)
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+import catalog
+import data_processor
+from quality_checks import perform_quality_checks
+from test_data_processor import upsert
+from generate_synthetic import synthetic_cities
+
+JSON_OUTPUTS = ['correlations.json', 'summary_stats.json', 'top_cities_by_demand.json']
+
+def write_quality_dataset(path, cities):
+    """Processes the raw store incrementally and writes the quality-checked dataset, like the pipeline."""
+    merged = data_processor.process_data_incremental()
+    perform_quality_checks(merged, expected_cities=[city['name'] for city in cities]).to_parquet(path, index=False)
+
+def run_analysis(tmp_path, name, quality_path, incremental):
+    analytics_path = str(tmp_path / name)
+    analysis.analyze_data(incremental=incremental, input_path=quality_path, analytics_data_path=analytics_path,
+                          catalog_path=str(tmp_path / f'{name}_catalog'))
+    return analytics_path
+
+def read_json(analytics_path, filename):
+    with open(os.path.join(analytics_path, filename)) as f:
+        return json.load(f)
+
+def assert_same_json(actual, expected):
+    if isinstance(expected, dict):
+        assert actual.keys() == expected.keys()
+        for key, value in expected.items():
+            assert_same_json(actual[key], value)
+    else:
+        assert actual == pytest.approx(expected, rel=1e-6)
+
+def test_incremental_analysis_matches_full_run(store_path, processed_files, tmp_path):
+    cities = synthetic_cities(3)
+    quality_path = str(tmp_path / 'merged_with_quality_flags.parquet')
+    upsert(cities, '2024-01-01', '2024-02-29')
+    write_quality_dataset(quality_path, cities)
+    incremental_path = run_analysis(tmp_path, 'incremental', quality_path, incremental=True)
+
+    # Revise a week of one city in February and append March
+    upsert(cities[:1], '2024-02-10', '2024-02-16', seed=1)
+    upsert(cities, '2024-03-01', '2024-03-15')
+    write_quality_dataset(quality_path, cities)
+    # January is unchanged, so it must not be read again
+    assert data_processor.changed_months(
+        data_processor.load_watermarks(os.path.join(incremental_path, 'state', 'watermarks.json')),
+        data_processor.load_watermarks()) == {'2024-02', '2024-03'}
+    run_analysis(tmp_path, 'incremental', quality_path, incremental=True)
+    full_path = run_analysis(tmp_path, 'full', quality_path, incremental=False)
+
+    for filename in JSON_OUTPUTS:
+        assert_same_json(read_json(incremental_path, filename), read_json(full_path, filename))
+    for filename in ['cube.parquet', 'heatmap.parquet']:
+        pd.testing.assert_frame_equal(pd.read_parquet(os.path.join(incremental_path, filename)),
+                                      pd.read_parquet(os.path.join(full_path, filename)), check_exact=False)
+
+def test_input_is_resolved_from_the_given_catalog(store_path, processed_files, tmp_path):
+    cities = synthetic_cities(2)
+    quality_path = str(tmp_path / 'merged_with_quality_flags.parquet')
+    upsert(cities, '2024-01-01', '2024-01-31')
+    write_quality_dataset(quality_path, cities)
+    catalog_path = str(tmp_path / 'catalog')
+    catalog.publish({"quality_dataset": catalog.describe_artifact(quality_path)}, catalog_path)
+
+    analysis.analyze_data(analytics_data_path=str(tmp_path / 'analytics'), catalog_path=catalog_path)
+    snapshot = catalog.current_snapshot(catalog_path)
+    assert catalog.get_snapshot(snapshot["snapshot_id"], catalog_path) == snapshot
+    assert {"quality_dataset", "correlations", "cube"} <= snapshot["artifacts"].keys()
+    assert catalog.current_artifact_path("cube", catalog_path) == os.path.join(catalog.PROJECT_ROOT, snapshot["artifacts"]["cube"]["path"])
+    # The cube was built from the dataset published to that catalog, not from data/processed
+    assert pd.read_parquet(tmp_path / 'analytics' / 'cube.parquet')['rows'].sum() == len(pd.read_parquet(quality_path))
+
+@pytest.fixture
+def merged_rows():
+    """Merged rows indexed by date with gaps in every measure, a city without paired rows, and one with a single one."""
+    rng = np.random.default_rng(1)
+    dates = pd.date_range('2024-01-01', periods=90)
+    rows = pd.DataFrame({
+        'date': np.repeat(dates, 3),
+        'city': np.tile(['B', 'A', 'C'], 90),
+        'tmax_f': rng.normal(65, 20, 270),
+        'tmin_f': rng.normal(45, 10, 270),
+        'demand_mwh': rng.normal(1e5, 1e4, 270),
+    })
+    for column in ['tmax_f', 'tmin_f', 'demand_mwh']:
+        rows.loc[rng.choice(270, 25, replace=False), column] = np.nan
+    rows.loc[rows['city'] == 'C', 'demand_mwh'] = np.nan
+    extra = pd.DataFrame({'date': dates[:2], 'city': 'D', 'tmax_f': [70.0, np.nan], 'tmin_f': [50.0, 51.0],
+                          'demand_mwh': [9e4, 9.5e4]})
+    return pd.concat([rows, extra], ignore_index=True).set_index('date').sort_index()
+
+def test_city_aggregates_match_pandas(merged_rows):
+    aggregates = analysis.compute_city_aggregates(merged_rows)
+    cities = list(aggregates["cities"])
+    by_city = merged_rows.groupby('city')
+
+    demand_mean = pd.Series(aggregates["demand_mean"], index=cities)
+    pd.testing.assert_series_equal(demand_mean.sort_index(), by_city['demand_mwh'].mean(), check_names=False)
+
+    for i, city in enumerate(cities):
+        paired = by_city.get_group(city).dropna(subset=['tmax_f', 'demand_mwh'])
+        assert aggregates["pair_counts"][i] == len(paired)
+        if len(paired) > 1:
+            assert aggregates["correlation"][i] == pytest.approx(paired['tmax_f'].corr(paired['demand_mwh']), rel=1e-9)
+
+    weekend = np.where(merged_rows.index.dayofweek >= 5, 'Weekend', 'Weekday')
+    day_type_mean = merged_rows.groupby(weekend)['demand_mwh'].mean()
+    assert list(aggregates["day_type_mean"]) == pytest.approx(day_type_mean[analysis.DAY_TYPES].tolist(), rel=1e-9)
+    assert aggregates["overall_demand_mwh_mean"] == pytest.approx(merged_rows['demand_mwh'].mean(), rel=1e-9)
+    assert aggregates["overall_demand_mwh_std"] == pytest.approx(merged_rows['demand_mwh'].std(), rel=1e-9)
+    assert aggregates["overall_tmax_f_mean"] == pytest.approx(merged_rows['tmax_f'].mean(), rel=1e-9)
+    assert aggregates["overall_tmin_f_mean"] == pytest.approx(merged_rows['tmin_f'].mean(), rel=1e-9)
+
+def test_heatmap_matches_pandas_groupby(merged_rows):
+    df = merged_rows.copy()
+    df['temp_range'] = pd.cut(df['tmax_f'], bins=analysis.TEMP_BINS, labels=analysis.TEMP_LABELS, right=False)
+    df['day_type'] = np.where(df.index.dayofweek >= 5, 'Weekend', 'Weekday')
+    expected = df.groupby(['city', 'temp_range', 'day_type'], observed=True)['demand_mwh'].mean().unstack(fill_value=0)
+
+    heatmap = analysis.build_heatmap(analysis.compute_city_aggregates(merged_rows))
+    pd.testing.assert_frame_equal(heatmap, expected, check_index_type=False)
@@ -0,0 +1,127 @@
+import contextlib
+
+import pandas as pd
+import pytest
+
+import backfill_historical
+import data_processor
+import mock_api_server
+import raw_store
+from conftest import API_KEYS
+from mock_api_server import FaultProfile
+from retry_queue import RetryQueue
+
+DATA_TYPES = ["weather", "energy"]
+
+@pytest.fixture
+def written(store_path, monkeypatch):
+    """Records the (data type, city, date) cells the backfill writes to the temporary raw store."""
+    cells = set()
+
+    def upsert_records(records, data_type):
+        cells.update((data_type, city, date.strftime('%Y-%m-%d')) for city, date in zip(records['city'], records['date']))
+        raw_store.upsert_records(records, data_type)
+    monkeypatch.setattr(backfill_historical, 'upsert_records', upsert_records)
+    monkeypatch.setattr(backfill_historical, 'coverage', raw_store.coverage)
+    return cells
+
+@pytest.fixture
+def retry_queue(tmp_path):
+    with RetryQueue(str(tmp_path / 'retry_queue.sqlite'), base_delay_seconds=3600) as queue:
+        yield queue
+
+def backfill(config, start_date, end_date, retry_queue):
+    dates = backfill_historical.get_backfill_dates(start_date, end_date)
+    backfill_historical.backfill_ranges(config, dates, DATA_TYPES, API_KEYS, retry_queue)
+
+def cells(config, start_date, end_date, data_types=DATA_TYPES):
+    return {(data_type, city["name"], date) for data_type in data_types for city in config["cities"]
+            for date in backfill_historical.get_backfill_dates(start_date, end_date)}
+
+def requests(server):
+    return sum(server.stats.values())
+
+def test_rerun_of_a_complete_window_fetches_nothing(mock_api, written, retry_queue):
+    server, config = mock_api(2)
+    backfill(config, '2024-03-01', '2024-03-31', retry_queue)
+    assert written == cells(config, '2024-03-01', '2024-03-31')
+
+    before = requests(server)
+    backfill(config, '2024-03-01', '2024-03-31', retry_queue)
+    assert requests(server) == before
+
+def test_only_missing_days_are_fetched(mock_api, written, store_path, retry_queue):
+    server, config = mock_api(2)
+    backfill(config, '2024-03-01', '2024-03-31', retry_queue)
+    # Punch a two-day hole into one city's energy data
+    path = raw_store._partition_path('energy', 'City 001', '2024-03', store_path)
+    partition = pd.read_parquet(path)
+    partition[~partition['date'].isin(pd.to_datetime(['2024-03-10', '2024-03-11']))].to_parquet(path, index=False)
+
+    written.clear()
+    before = server.stats.copy()
+    backfill(config, '2024-03-01', '2024-03-31', retry_queue)
+    assert written == {("energy", "City 001", "2024-03-10"), ("energy", "City 001", "2024-03-11")}
+    assert {api for (api, _), count in (server.stats - before).items() if count} == {"eia"}
+
+def test_extended_window_resumes_where_stored_data_ends(mock_api, written, retry_queue):
+    _, config = mock_api(2)
+    backfill(config, '2024-03-01', '2024-03-15', retry_queue)
+    written.clear()
+    backfill(config, '2024-02-01', '2024-03-31', retry_queue)
+    assert written == cells(config, '2024-02-01', '2024-02-29') | cells(config, '2024-03-16', '2024-03-31')
+
+def test_failed_days_wait_in_the_retry_queue(mock_api, written, retry_queue):
+    _, config = mock_api(2, faults=FaultProfile(0, 0, rate_5xx=1.0))
+    backfill(config, '2024-03-01', '2024-03-05', retry_queue)
+    assert written == set()
+    assert {(item["data_type"], item["city"], item["date"]) for item in retry_queue.items()} == cells(config, '2024-03-01', '2024-03-05')
+
+    # Still backing off: a healthy API is not asked again yet
+    server, config = mock_api(2)
+    backfill(config, '2024-03-01', '2024-03-05', retry_queue)
+    assert requests(server) == 0
+
+    retry_queue.base_delay_seconds = 0
+    retry_queue.record_failures(retry_queue.blocked_keys(), "fetch_failed")
+    backfill(config, '2024-03-01', '2024-03-05', retry_queue)
+    assert written == cells(config, '2024-03-01', '2024-03-05')
+    assert retry_queue.items() == []
+
+def test_short_days_back_off_instead_of_refetching(mock_api, written, retry_queue, monkeypatch):
+    eia_payload = mock_api_server.eia_payload
+
+    def without_last_hour(params, max_page_size=None):
+        payload = eia_payload(params, max_page_size)
+        data = [row for row in payload["response"]["data"] if not row["period"].endswith("T23")]
+        payload["response"].update(total=str(len(data)), data=data)
+        return payload
+    monkeypatch.setattr(mock_api_server, "eia_payload", without_last_hour)
+
+    server, config = mock_api(1)
+    backfill(config, '2024-03-01', '2024-03-03', retry_queue)
+    # The 23 hours are stored, but the days stay queued as no_data
+    assert written == cells(config, '2024-03-01', '2024-03-03')
+    assert {(item["date"], item["last_error"]) for item in retry_queue.items()} == \
+        {(date, "no_data") for date in backfill_historical.get_backfill_dates('2024-03-01', '2024-03-03')}
+
+    before = requests(server)
+    backfill(config, '2024-03-01', '2024-03-03', retry_queue)
+    assert requests(server) == before
+
+def test_backfill_analyzes_the_quality_dataset_it_writes(mock_api, written, store_path, retry_queue, monkeypatch, tmp_path):
+    _, config = mock_api(2)
+    config["backfill"] = {"days": 5}
+    quality_path = str(tmp_path / 'merged_with_quality_flags.parquet')
+    analyzed = []
+    monkeypatch.setattr(backfill_historical, 'load_config', lambda: config)
+    monkeypatch.setattr(backfill_historical, 'open_retry_queue', lambda config: contextlib.nullcontext(retry_queue))
+    monkeypatch.setattr(backfill_historical, 'process_data_chunked',
+                        lambda memory_limit_mb: data_processor.process_data_chunked(memory_limit_mb=memory_limit_mb, store_path=store_path))
+    monkeypatch.setattr(backfill_historical, 'QUALITY_DATASET_FILE', quality_path)
+    monkeypatch.setattr(backfill_historical.catalog, 'publish', lambda artifacts: None)
+    monkeypatch.setattr(backfill_historical, 'analyze_data', lambda **kwargs: analyzed.append(kwargs))
+
+    backfill_historical._backfill_historical_data('2024-03-01', '2024-03-05')
+    assert analyzed == [{"input_path": quality_path, "hourly_path": None}]
+    assert len(pd.read_parquet(quality_path)) == 2 * 5
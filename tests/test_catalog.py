@@ -0,0 +1,15 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import catalog
+
+def publish_artifact(catalog_path, name):
+    catalog.publish({name: {"path": f"{name}.parquet"}}, catalog_path)
+
+def test_concurrent_publishes_keep_every_artifact_and_snapshot(tmp_path):
+    catalog_path = str(tmp_path / 'catalog')
+    names = [f"artifact_{i}" for i in range(16)]
+    with ProcessPoolExecutor(4) as pool:
+        list(pool.map(publish_artifact, [catalog_path] * len(names), names))
+
+    assert catalog.current_snapshot(catalog_path)["artifacts"].keys() == set(names)
+    assert len(catalog.load_manifest(catalog_path)["snapshots"]) == len(names)
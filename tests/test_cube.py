@@ -0,0 +1,54 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import analysis
+import cube
+
+@pytest.fixture
+def daily_rows():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2024-01-01', periods=120)
+    rows = pd.DataFrame({
+        'date': np.repeat(dates, 3),
+        'city': np.tile(['A', 'B', 'C'], 120),
+        'tmax_f': rng.normal(65, 15, 360),
+        'tmin_f': rng.normal(45, 10, 360),
+        'demand_mwh': rng.normal(1e5, 1e4, 360),
+        'data_quality_score': rng.uniform(0, 1, 360),
+    })
+    rows.loc[rng.choice(360, 20, replace=False), 'tmax_f'] = np.nan
+    rows.loc[rng.choice(360, 20, replace=False), 'demand_mwh'] = np.nan
+    return rows.set_index('date')
+
+def test_cube_has_one_cell_per_month_city_temp_range_and_day_type(daily_rows):
+    cells = cube.build_cube(daily_rows)
+    assert not cells.duplicated(cube.KEY_COLUMNS).any()
+    assert cells['month'].nunique() == 4
+    assert cells['rows'].sum() == len(daily_rows)
+
+def test_slice_statistics_match_rows(daily_rows):
+    cells = cube.slice_cube(cube.build_cube(daily_rows), '2024-02-10', '2024-03-05', ['A', 'C'])
+    # The slice covers whole months
+    rows = daily_rows[(daily_rows.index >= '2024-02-01') & (daily_rows.index < '2024-04-01')
+                      & daily_rows['city'].isin(['A', 'C'])]
+
+    summary = cube.summarize(cells)
+    assert summary['rows'] == len(rows)
+    for name, column in cube.MEASURES.items():
+        values = rows[column].dropna()
+        assert summary[name]['count'] == len(values)
+        assert summary[name]['mean'] == pytest.approx(values.mean(), rel=1e-9)
+        assert summary[name]['std'] == pytest.approx(values.std(ddof=1), rel=1e-9)
+        assert (summary[name]['min'], summary[name]['max']) == (values.min(), values.max())
+
+    stats = cube.city_statistics(cells)
+    for city, group in rows.groupby('city'):
+        paired = group.dropna(subset=['tmax_f', 'demand_mwh'])
+        assert stats.loc[city, 'paired_rows'] == len(paired)
+        assert stats.loc[city, 'pearson_correlation'] == pytest.approx(paired['tmax_f'].corr(paired['demand_mwh']), rel=1e-9)
+        assert stats.loc[city, 'demand_mean'] == pytest.approx(group['demand_mwh'].mean(), rel=1e-9)
+
+def test_heatmap_matches_analysis_heatmap(daily_rows):
+    expected = analysis.build_heatmap(analysis.compute_city_aggregates(daily_rows))
+    pd.testing.assert_frame_equal(cube.heatmap(cube.build_cube(daily_rows)), expected)
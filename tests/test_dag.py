@@ -0,0 +1,47 @@
+import dag
+from dag import Stage
+
+def write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+def test_unchanged_stage_is_skipped_and_changed_input_reruns(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    source, target = str(tmp_path / 'source.txt'), str(tmp_path / 'target.txt')
+    write(source, 'a')
+    stages = [Stage("copy", lambda: write(target, open(source).read()), inputs=[source], outputs=[target])]
+
+    assert dag.run_stages(stages, state_path=state_path) == ["copy"]
+    assert dag.run_stages(stages, state_path=state_path) == []
+    write(source, 'b')
+    assert dag.run_stages(stages, state_path=state_path) == ["copy"]
+
+def test_incomplete_stage_is_not_recorded(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    target = str(tmp_path / 'fetched.txt')
+    outcomes = [True, False, True]
+
+    def fetch():
+        write(target, 'rows')
+        return outcomes.pop(0)
+    stages = [Stage("fetch", fetch, outputs=[target], params={"date": "2024-03-01"})]
+
+    assert dag.run_stages(stages, state_path=state_path) == ["fetch"]
+    # Forced rerun that fails part-way: the earlier success must no longer count
+    assert dag.run_stages(stages, force=True, state_path=state_path) == ["fetch"]
+    assert "fetch" not in dag.load_state(state_path)["stages"]
+    assert dag.run_stages(stages, state_path=state_path) == ["fetch"]
+    assert dag.run_stages(stages, state_path=state_path) == []
+
+def test_downstream_stage_reruns_after_upstream_output_changes(tmp_path):
+    state_path = str(tmp_path / 'state.json')
+    raw, processed = str(tmp_path / 'raw.txt'), str(tmp_path / 'processed.txt')
+    values = iter(['1', '2'])
+    stages = [
+        Stage("fetch", lambda: write(raw, next(values)), outputs=[raw], params={"run": 1}),
+        Stage("process", lambda: write(processed, open(raw).read() * 2), inputs=[raw], outputs=[processed]),
+    ]
+    assert dag.run_stages(stages, state_path=state_path) == ["fetch", "process"]
+    stages[0].params = {"run": 2}
+    assert dag.run_stages(stages, state_path=state_path) == ["fetch", "process"]
+    assert open(processed).read() == '22'
@@ -0,0 +1,135 @@
+import json
+
+import pandas as pd
+
+import mock_api_server
+from conftest import API_KEYS
+import data_fetcher
+from data_fetcher import FetcherClient, NOAA_DATATYPES
+from fetch_scheduler import FetchScheduler, FetchJob
+
+def test_paginated_responses_match_single_page_responses(mock_api):
+    paged_server, paged_config = mock_api(2, max_page_size=10)
+    _, config = mock_api(2)
+    paged_client, client = FetcherClient(paged_config), FetcherClient(config)
+    cities = config["cities"]
+    try:
+        paged_weather = paged_client.get_weather_data_batch(cities, "2024-03-01", "2024-03-07", API_KEYS["noaa"])
+        weather = client.get_weather_data_batch(cities, "2024-03-01", "2024-03-07", API_KEYS["noaa"])
+        for paged, single in zip(paged_weather, weather):
+            assert len(single) == 7
+            pd.testing.assert_frame_equal(paged, single)
+
+        paged_energy = paged_client.get_energy_data_range(cities[0], "2024-03-01", "2024-03-03", API_KEYS["eia"])
+        energy = client.get_energy_data_range(cities[0], "2024-03-01", "2024-03-03", API_KEYS["eia"])
+        assert len(energy) == 3 * 24
+        pd.testing.assert_frame_equal(paged_energy, energy)
+    finally:
+        paged_client.close()
+        client.close()
+    # Two stations x 7 days x every datatype, 10 results per page; 72 hourly rows, 10 per page
+    assert paged_server.stats[("noaa", "ok")] == -(-2 * 7 * len(NOAA_DATATYPES) // 10)
+    assert paged_server.stats[("eia", "ok")] == 8
+
+def test_stream_yields_whole_days_per_page(mock_api):
+    _, config = mock_api(1, max_page_size=30)
+    city = config["cities"][0]
+    jobs = [FetchJob("energy", city, "2024-03-01", "2024-03-05"), FetchJob("weather", city, "2024-03-01", "2024-03-05")]
+    pages = {"energy": [], "weather": []}
+    with FetchScheduler.from_config(config) as scheduler:
+        for job, records in scheduler.stream(jobs, API_KEYS):
+            assert records is not None
+            pages[job.data_type].append(records)
+
+    assert len(pages["energy"]) > 1
+    energy = pd.concat(pages["energy"], ignore_index=True)
+    assert len(energy) == 5 * 24 and not energy.duplicated(["timestamp_utc"]).any()
+    # No day is split across pages, so every page can be written on its own
+    for page in pages["energy"]:
+        assert (page.groupby("date").size() == 24).all()
+    weather = pd.concat(pages["weather"], ignore_index=True)
+    assert weather["date"].tolist() == list(pd.date_range("2024-03-01", "2024-03-05"))
+
+def cached_entries(client):
+    entries = []
+    for path in client.cache._entry_paths():
+        with open(path) as f:
+            entries.append(json.load(f))
+    return entries
+
+def test_short_responses_for_old_windows_are_not_cached_as_final(mock_api, monkeypatch, tmp_path):
+    _, config = mock_api(1)
+    config["response_cache"] = {"mode": "readwrite", "directory": str(tmp_path / "cache")}
+    city = config["cities"][0]
+
+    eia_payload = mock_api_server.eia_payload
+
+    def half_day(params, max_page_size=None):
+        payload = eia_payload(params, max_page_size)
+        payload["response"].update(total="12", data=payload["response"]["data"][:12])
+        return payload
+
+    client = FetcherClient(config)
+    try:
+        with monkeypatch.context() as patch:
+            patch.setattr(mock_api_server, "eia_payload", half_day)
+            patch.setattr(mock_api_server, "noaa_payload", lambda params, max_page_size=None: {})
+            assert len(client.get_energy_data_range(city, "2024-03-01", "2024-03-01", API_KEYS["eia"])) == 12
+            assert client.get_weather_data_range(city, "2024-03-01", "2024-03-01", API_KEYS["noaa"]).empty
+        assert [entry["immutable"] for entry in cached_entries(client)] == [False, False]
+
+        client.get_energy_data_range(city, "2024-03-02", "2024-03-02", API_KEYS["eia"])
+        client.get_weather_data_range(city, "2024-03-02", "2024-03-02", API_KEYS["noaa"])
+        assert sorted(entry["immutable"] for entry in cached_entries(client)) == [False, False, True, True]
+    finally:
+        client.close()
+
+def reference_weather_records(results, city_configs):
+    """The per-entry if/elif parser the columnar one replaced, one record list per city."""
+    columns = {'TMAX': 'tmax_f', 'TMIN': 'tmin_f', 'PRCP': 'prcp', 'SNOW': 'snow', 'SNWD': 'snwd',
+               'AWND': 'awnd', 'TSUN': 'tsun', 'WDF2': 'wdf2', 'WSF2': 'wsf2'}
+    records_by_city = []
+    for city_config in city_configs:
+        records = {}
+        for entry in results:
+            if entry.get('station') != city_config['noaa_station_id']:
+                continue
+            date = entry.get('date', '')[:10]
+            record = records.setdefault(date, {"date": date, "city": city_config['name'],
+                                               **{column: None for column in columns.values()},
+                                               "timestamp_utc": f"{date}T12:00:00Z"})
+            if entry.get('datatype') in columns:
+                record[columns[entry['datatype']]] = entry.get('value')
+        records_by_city.append([records[date] for date in sorted(records)])
+    return records_by_city
+
+def reference_energy_records(data, city_name):
+    return [{'date': item['period'].split('T')[0], 'city': city_name, 'region': item['respondent'],
+             'demand_mwh': item['value'], 'timestamp_utc': item['period']} for item in data]
+
+def typed(records, columns):
+    df = pd.DataFrame(records, columns=columns)
+    df['date'] = pd.to_datetime(df['date'])
+    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc'], utc=True, format='ISO8601')
+    return df
+
+def test_columnar_parsers_match_reference_parsers():
+    city_configs = [{"name": "A", "noaa_station_id": "S1"}, {"name": "B", "noaa_station_id": "S2"},
+                    {"name": "C", "noaa_station_id": "S3"}]
+    params = {"stationid": ["S1", "S2", "S4"], "startdate": ["2024-03-01"], "enddate": ["2024-03-04"],
+              "datatype": [",".join(NOAA_DATATYPES + ["EVAP"])], "limit": ["1000"]}
+    results = mock_api_server.noaa_payload(params)["results"]
+    # Missing values, a day with only an unknown datatype, and entries out of date order
+    results[3]["value"] = None
+    results.append({"date": "2024-03-06T00:00:00", "datatype": "EVAP", "station": "S2", "value": 1.0})
+    results = results[::-1]
+
+    for frame, records in zip(data_fetcher._parse_weather_frames(results, city_configs),
+                              reference_weather_records(results, city_configs)):
+        pd.testing.assert_frame_equal(frame, typed(records, data_fetcher.WEATHER_COLUMNS), check_dtype=False)
+
+    data = mock_api_server.eia_payload({"facets[respondent][]": ["R1"], "start": ["2024-03-01T00"],
+                                        "end": ["2024-03-02T23"]})["response"]["data"]
+    data[5]["value"] = None
+    pd.testing.assert_frame_equal(data_fetcher._parse_energy_frame(data, "A"),
+                                  typed(reference_energy_records(data, "A"), data_fetcher.ENERGY_COLUMNS), check_dtype=False)
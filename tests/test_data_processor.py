@@ -0,0 +1,74 @@
+import pandas as pd
+
+import data_processor
+import raw_store
+from generate_synthetic import generate_weather, generate_energy, synthetic_cities
+
+def upsert(cities, start_date, end_date, seed=0):
+    raw_store.upsert_records(generate_weather(cities, start_date, end_date, seed), 'weather')
+    raw_store.upsert_records(generate_energy(cities, start_date, end_date, seed=seed), 'energy')
+
+def sorted_rows(df):
+    return df.sort_values(['date', 'city']).reset_index(drop=True)
+
+def test_incremental_matches_full_rebuild_after_upsert(store_path, processed_files):
+    cities = synthetic_cities(3)
+    upsert(cities, '2024-01-01', '2024-02-29')
+    first = data_processor.process_data_incremental()
+    pd.testing.assert_frame_equal(sorted_rows(first), sorted_rows(data_processor.process_data(store_path=store_path)))
+
+    # Revise a week of one city, append new days for all cities and add a city
+    upsert(cities[:1], '2024-02-10', '2024-02-16', seed=1)
+    upsert(cities, '2024-03-01', '2024-03-15')
+    upsert(synthetic_cities(4)[3:], '2024-01-15', '2024-03-15')
+    incremental = data_processor.process_data_incremental()
+
+    full = data_processor.process_data(store_path=store_path)
+    pd.testing.assert_frame_equal(sorted_rows(incremental), sorted_rows(full))
+    pd.testing.assert_frame_equal(sorted_rows(data_processor.load_processed_dataset()), sorted_rows(full))
+
+def test_incremental_without_changes_returns_persisted_dataset(store_path, processed_files):
+    upsert(synthetic_cities(2), '2024-01-01', '2024-01-31')
+    first = data_processor.process_data_incremental()
+    again = data_processor.process_data_incremental()
+    pd.testing.assert_frame_equal(sorted_rows(again), sorted_rows(first))
+
+def test_chunked_processing_matches_process_data(store_path):
+    cities = synthetic_cities(3)
+    upsert(cities, '2024-01-20', '2024-03-10')
+    # A revised week and a city whose weather starts later than its energy data
+    upsert(cities[:1], '2024-02-01', '2024-02-07', seed=1)
+    extra = synthetic_cities(4)[3:]
+    raw_store.upsert_records(generate_energy(extra, '2024-02-15', '2024-03-10'), 'energy')
+    raw_store.upsert_records(generate_weather(extra, '2024-03-01', '2024-03-10'), 'weather')
+
+    # About 40 hourly rows per chunk, so months and days are split across many chunks
+    chunked = data_processor.process_data_chunked(memory_limit_mb=0.02, store_path=store_path)
+    pd.testing.assert_frame_equal(sorted_rows(chunked), sorted_rows(data_processor.process_data(store_path=store_path)))
+
+def test_incremental_hourly_rebuild_matches_full_rebuild(store_path, tmp_path, monkeypatch):
+    paths = {'path': str(tmp_path / 'hourly_dataset.parquet'), 'watermarks_path': str(tmp_path / 'hourly_watermarks.json'),
+             'store_path': store_path}
+    cities = synthetic_cities(3)
+    upsert(cities, '2024-01-01', '2024-02-29')
+    first = data_processor.process_data_hourly_incremental(**paths)
+    pd.testing.assert_frame_equal(first, data_processor.process_data_hourly(store_path=store_path))
+
+    # Revise a week of one city in February and append March
+    upsert(cities[:1], '2024-02-10', '2024-02-16', seed=1)
+    upsert(cities, '2024-03-01', '2024-03-15')
+    rebuilt = []
+    process_data_hourly = data_processor.process_data_hourly
+
+    def record_month(start_date, end_date, store_path):
+        rebuilt.append(start_date.strftime('%Y-%m'))
+        return process_data_hourly(start_date, end_date, store_path)
+    monkeypatch.setattr(data_processor, 'process_data_hourly', record_month)
+    incremental = data_processor.process_data_hourly_incremental(**paths)
+    assert rebuilt == ['2024-02', '2024-03']
+
+    full = process_data_hourly(store_path=store_path)
+    pd.testing.assert_frame_equal(incremental, full)
+    pd.testing.assert_frame_equal(pd.read_parquet(paths['path']), full)
+    # Nothing changed since, so nothing is rebuilt
+    assert data_processor.process_data_hourly_incremental(**paths).equals(full) and rebuilt == ['2024-02', '2024-03']
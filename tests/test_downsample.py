@@ -0,0 +1,21 @@
+import numpy as np
+import pandas as pd
+
+from downsample import downsample_lines
+
+def lines(sizes):
+    rng = np.random.default_rng(0)
+    return pd.concat([pd.DataFrame({'date': pd.date_range('2020-01-01', periods=size), 'city': city, 'demand_mwh': rng.random(size)})
+                      for city, size in sizes.items()], ignore_index=True)
+
+def test_point_budget_is_shared_by_the_lines():
+    df = lines({'A': 1000, 'B': 500, 'C': 250})
+    counts = downsample_lines(df, 'date', 'demand_mwh', 'city', 700).groupby('city').size().to_dict()
+    assert counts == {'A': 400, 'B': 200, 'C': 100}
+
+def test_short_lines_keep_their_ends():
+    df = lines({'A': 10000, 'B': 5})
+    result = downsample_lines(df, 'date', 'demand_mwh', 'city', 100)
+    short = result[result['city'] == 'B']
+    assert len(short) == 3
+    assert short['date'].iloc[[0, -1]].tolist() == df.loc[df['city'] == 'B', 'date'].iloc[[0, -1]].tolist()
@@ -0,0 +1,51 @@
+import pandas as pd
+
+from data_fetcher import NOAA_MAX_RESULTS, NOAA_DATATYPES
+from fetch_planner import plan, fan_out, batch_weather, stations_per_request
+from fetch_scheduler import FetchJob
+
+def city(name, station=None, region=None):
+    config = {"name": name}
+    if station:
+        config["noaa_station_id"] = station
+    if region:
+        config["eia_region_code"] = region
+    return config
+
+def test_plan_groups_jobs_sharing_a_region_and_window():
+    a, b, c = city("A", "S1", "PJM"), city("B", "S2", "PJM"), city("C", "S3", "NYIS")
+    jobs = [FetchJob("energy", a, "2024-03-01", "2024-03-31"), FetchJob("energy", b, "2024-03-01", "2024-03-31"),
+            FetchJob("energy", c, "2024-03-01", "2024-03-31"), FetchJob("energy", a, "2024-04-01", "2024-04-30"),
+            FetchJob("weather", a, "2024-03-01", "2024-03-31"), FetchJob("weather", b, "2024-03-01", "2024-03-31")]
+    groups = plan(jobs)
+    assert [group.jobs for group in groups] == [jobs[:2], [jobs[2]], [jobs[3]], [jobs[4]], [jobs[5]]]
+    assert [group.job for group in groups] == [jobs[0], jobs[2], jobs[3], jobs[4], jobs[5]]
+
+def test_plan_keeps_cities_without_a_source_apart():
+    jobs = [FetchJob("energy", city("A"), "2024-03-01", "2024-03-01"), FetchJob("energy", city("B"), "2024-03-01", "2024-03-01")]
+    assert len(plan(jobs)) == 2
+
+def test_fan_out_relabels_rows_to_each_city():
+    jobs = [FetchJob("energy", city(name, region="PJM"), "2024-03-01", "2024-03-01") for name in ("A", "B")]
+    group, = plan(jobs)
+    records = pd.DataFrame({"city": ["A", "A"], "region": ["PJM", "PJM"], "demand_mwh": [1.0, 2.0]})
+    fanned = list(fan_out(group, records))
+    assert [job.city["name"] for job, _ in fanned] == ["A", "B"]
+    for job, frame in fanned:
+        assert (frame["city"] == job.city["name"]).all()
+        assert frame["demand_mwh"].tolist() == [1.0, 2.0]
+    assert (records["city"] == "A").all()
+    assert [frame for _, frame in fan_out(group, None)] == [None, None]
+
+def test_batch_weather_packs_stations_per_window():
+    cities = [city(f"C{i}", f"S{i}") for i in range(5)]
+    short = plan([FetchJob("weather", c, "2024-03-01", "2024-03-01") for c in cities])
+    long = plan([FetchJob("weather", c, "2023-01-01", "2023-12-31") for c in cities[:2]])
+    batches = batch_weather(short + long, max_stations=2)
+    assert [[group.job.city["name"] for group in batch] for batch in batches] == [
+        ["C0", "C1"], ["C2", "C3"], ["C4"], ["C0"], ["C1"]]
+
+def test_stations_per_request_fits_one_response():
+    assert stations_per_request("2024-03-01", "2024-03-01", 25) == 25
+    assert stations_per_request("2024-03-01", "2024-03-10", 25) == NOAA_MAX_RESULTS // (len(NOAA_DATATYPES) * 10)
+    assert stations_per_request("2023-01-01", "2023-12-31", 25) == 1
@@ -0,0 +1,45 @@
+import pandas as pd
+
+from conftest import API_KEYS
+from fetch_scheduler import FetchScheduler, FetchJob
+
+def share_sources(config, pairs):
+    """Gives each (city index, other index) pair the same NOAA station and EIA region."""
+    cities = config["cities"]
+    for index, other in pairs:
+        cities[index]["noaa_station_id"] = cities[other]["noaa_station_id"]
+        cities[index]["eia_region_code"] = cities[other]["eia_region_code"]
+
+def fetch_all(config, jobs):
+    with FetchScheduler.from_config(config) as scheduler:
+        results = {}
+        for job, records in scheduler.run(jobs, API_KEYS):
+            results.setdefault((job.data_type, job.city["name"]), []).append(records)
+    return {key: pd.concat(frames, ignore_index=True) for key, frames in results.items()}
+
+def test_cities_sharing_a_region_are_fetched_once(mock_api):
+    server, config = mock_api(4)
+    share_sources(config, [(1, 0), (3, 2)])
+    jobs = [FetchJob("energy", city, "2024-03-01", "2024-03-03") for city in config["cities"]]
+    results = fetch_all(config, jobs)
+
+    assert server.stats[("eia", "ok")] == 2
+    for city in config["cities"]:
+        records = results[("energy", city["name"])]
+        assert len(records) == 3 * 24
+        assert (records["city"] == city["name"]).all()
+        assert (records["region"] == city["eia_region_code"]).all()
+
+def test_batched_weather_reaches_the_right_cities(mock_api):
+    server, config = mock_api(5)
+    config["fetch"]["noaa_max_stations_per_request"] = 2
+    share_sources(config, [(4, 0)])
+    jobs = [FetchJob("weather", city, "2024-03-01", "2024-03-05") for city in config["cities"]]
+    results = fetch_all(config, jobs)
+    # Four distinct stations, two per request
+    assert server.stats[("noaa", "ok")] == 2
+
+    with FetchScheduler.from_config(config) as scheduler:
+        for city in config["cities"]:
+            single = scheduler.client.get_weather_data_range(city, "2024-03-01", "2024-03-05", API_KEYS["noaa"])
+            pd.testing.assert_frame_equal(results[("weather", city["name"])], single)
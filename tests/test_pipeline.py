@@ -0,0 +1,30 @@
+import pytest
+
+import pipeline
+import raw_store
+from conftest import API_KEYS
+from mock_api_server import FaultProfile
+from retry_queue import RetryQueue
+
+@pytest.fixture
+def queue_path(tmp_path, store_path, monkeypatch):
+    """Sends the fetch stage's writes to the temporary raw store and a temporary retry queue."""
+    path = str(tmp_path / 'retry_queue.sqlite')
+    monkeypatch.setattr(pipeline, 'upsert_records', raw_store.upsert_records)
+    monkeypatch.setattr(pipeline.RetryQueue, 'from_config', classmethod(lambda cls, config: cls(path, base_delay_seconds=0)))
+    return path
+
+def queued_keys(path):
+    with RetryQueue(path) as retry_queue:
+        return {(item["city"], item["date"], item["data_type"]) for item in retry_queue.items()}
+
+def test_failed_fetches_leave_stage_incomplete_and_are_queued(mock_api, queue_path):
+    _, config = mock_api(2, faults=FaultProfile(0, 0, rate_5xx=1.0))
+    assert pipeline.fetch_stage(config, API_KEYS, '2024-03-01') is False
+    assert queued_keys(queue_path) == {(city["name"], '2024-03-01', data_type)
+                                       for city in config["cities"] for data_type in ("weather", "energy")}
+
+    _, config = mock_api(2)
+    assert pipeline.fetch_stage(config, API_KEYS, '2024-03-01') is True
+    assert queued_keys(queue_path) == set()
+    assert set(raw_store.read_raw('weather')['city']) == {city["name"] for city in config["cities"]}
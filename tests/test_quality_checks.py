@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from quality_checks import perform_quality_checks
+
+EXPECTED_CITIES = ['A', 'B', 'C']
+CHECKS = ['has_missing_data', 'is_temp_outlier', 'is_demand_outlier', 'is_outlier', 'is_stale', 'all_cities_present']
+
+def reference_quality_checks(df, expected_cities):
+    """The per-date set comparison and row-wise flags the check engine replaced."""
+    df['has_missing_data'] = df.isnull().any(axis=1)
+    df['is_temp_outlier'] = ((df['tmax_f'] < -50) | (df['tmax_f'] > 130) |
+                             (df['tmin_f'] < -50) | (df['tmin_f'] > 130))
+    df['is_demand_outlier'] = df['demand_mwh'] < 0
+    df['is_outlier'] = df['is_temp_outlier'] | df['is_demand_outlier']
+    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc']).dt.tz_convert(None)
+    df['is_stale'] = (datetime.utcnow() - df['timestamp_utc']) > timedelta(hours=48)
+    df['all_cities_present'] = df.groupby('date')['city'].transform(lambda x: set(expected_cities).issubset(set(x)))
+    scored = ['has_missing_data', 'is_outlier', 'is_stale', 'all_cities_present']
+    df['data_quality_score'] = (1 - df[scored].sum(axis=1) / len(scored)) * 100
+    return df
+
+def merged_rows():
+    rng = np.random.default_rng(2)
+    dates = pd.date_range('2024-01-01', periods=40)
+    df = pd.DataFrame({
+        'date': np.repeat(dates, 4),
+        # D isn't an expected city, so it never completes a date on its own
+        'city': np.tile(['A', 'B', 'C', 'D'], 40),
+        'tmax_f': rng.normal(60, 40, 160),
+        'tmin_f': rng.normal(40, 40, 160),
+        'demand_mwh': rng.normal(1e4, 2e4, 160),
+    })
+    # Drop C on some dates, blank some values and make some rows recent
+    df = df[~((df['city'] == 'C') & df['date'].isin(dates[::7]))].reset_index(drop=True)
+    for column in ['tmax_f', 'tmin_f', 'demand_mwh']:
+        df.loc[rng.choice(len(df), 10, replace=False), column] = np.nan
+    now = pd.Timestamp.now(tz='UTC')
+    df['timestamp_utc'] = np.where(rng.random(len(df)) < 0.3, now - pd.Timedelta(hours=1), now - pd.Timedelta(days=10))
+    df['timestamp_utc'] = pd.to_datetime(df['timestamp_utc'], utc=True)
+    return df
+
+def test_check_engine_matches_reference_checks():
+    df = merged_rows()
+    expected = reference_quality_checks(df.copy(), EXPECTED_CITIES)
+    checked = perform_quality_checks(df.copy(), expected_cities=EXPECTED_CITIES)
+
+    assert expected[CHECKS].any().all() and not expected[CHECKS].all().any()
+    for name in CHECKS:
+        np.testing.assert_array_equal(checked[name].to_numpy(dtype=bool), expected[name].to_numpy(dtype=bool), err_msg=name)
+    np.testing.assert_allclose(checked['data_quality_score'].to_numpy(dtype=float), expected['data_quality_score'].to_numpy())
@@ -0,0 +1,40 @@
+import pytest
+
+from retry_queue import RetryQueue
+
+KEY = ("City 000", "2024-03-01", "weather")
+
+@pytest.fixture
+def retry_queue(tmp_path):
+    with RetryQueue(str(tmp_path / 'retry_queue.sqlite'), base_delay_seconds=60, max_delay_seconds=600,
+                    max_attempts=3, lease_seconds=30) as queue:
+        yield queue
+
+def test_failures_back_off_exponentially_until_dead(retry_queue):
+    for attempt, delay in enumerate([60, 120], start=1):
+        retry_queue.record_failures([KEY], "fetch_failed", now=1000)
+        item, = retry_queue.items()
+        assert (item["attempts"], item["status"], item["next_attempt_at"]) == (attempt, 'pending', 1000 + delay)
+        assert retry_queue.blocked_keys(now=1000 + delay - 1) == {KEY}
+        assert retry_queue.blocked_keys(now=1000 + delay) == set()
+
+    retry_queue.record_failures([KEY], "no_data", now=1000)
+    item, = retry_queue.items()
+    assert (item["status"], item["last_error"]) == ('dead', "no_data")
+    assert retry_queue.blocked_keys(now=10 ** 9) == {KEY}
+    assert retry_queue.claim(now=10 ** 9) == []
+
+def test_claimed_items_are_leased_to_one_worker(retry_queue):
+    retry_queue.record_failures([KEY], "fetch_failed", now=0)
+    assert retry_queue.claim(worker="a", now=100) == [KEY]
+    assert retry_queue.claim(worker="b", now=110) == []
+    assert retry_queue.blocked_keys(now=110) == {KEY}
+    # The lease of a worker that died expires
+    assert retry_queue.claim(worker="b", now=131) == [KEY]
+
+def test_fetched_keys_leave_the_queue(retry_queue):
+    other = ("City 001", "2024-03-01", "energy")
+    retry_queue.record_failures([KEY, other], "fetch_failed", now=0)
+    retry_queue.remove([KEY, ("City 999", "2024-03-01", "weather")])
+    assert [(item["city"], item["date"], item["data_type"]) for item in retry_queue.items()] == [other]
+    assert retry_queue.stats()["pending"] == 1
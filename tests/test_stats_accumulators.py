@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import stats_accumulators
+
+@pytest.fixture
+def daily_rows():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2024-01-01', periods=60)
+    return pd.DataFrame({
+        'date': np.repeat(dates, 3),
+        'city': np.tile(['A', 'B', 'C'], 60),
+        'tmax_f': rng.normal(60, 10, 180).astype('float32'),
+        'tmin_f': rng.normal(40, 10, 180).astype('float32'),
+        'demand_mwh': rng.normal(1e5, 1e4, 180).astype('float32'),
+    }).set_index('date')
+
+def assert_same_statistics(state, expected):
+    correlations = stats_accumulators.correlations_from_state(state)
+    expected_correlations = stats_accumulators.correlations_from_state(expected)
+    assert correlations.keys() == expected_correlations.keys()
+    for city, values in correlations.items():
+        assert values == pytest.approx(expected_correlations[city], rel=1e-9)
+    summary = stats_accumulators.summary_stats_from_state(state)
+    expected_summary = stats_accumulators.summary_stats_from_state(expected)
+    assert summary.keys() == expected_summary.keys()
+    for name, value in summary.items():
+        assert value == pytest.approx(expected_summary[name], rel=1e-9)
+    assert state.keys() == expected.keys()
+
+def saved_and_loaded(state, tmp_path):
+    path = str(tmp_path / 'accumulators.json')
+    stats_accumulators.save_state(state, path)
+    return stats_accumulators.load_state(path)
+
+def test_update_with_appended_rows_matches_accumulate(daily_rows, tmp_path):
+    earlier = daily_rows[daily_rows.index < '2024-02-15']
+    state = saved_and_loaded(stats_accumulators.accumulate(earlier), tmp_path)
+    updated = stats_accumulators.update_state(state, daily_rows[daily_rows.index >= '2024-02-01'], {'2024-02'})
+    assert_same_statistics(updated, stats_accumulators.accumulate(daily_rows))
+
+def test_update_with_revised_and_filled_rows_matches_accumulate(daily_rows, tmp_path):
+    earlier = daily_rows[daily_rows.index < '2024-02-15']
+    # Accumulated with one row missing, then the gap is filled and an old value revised
+    state = saved_and_loaded(stats_accumulators.accumulate(earlier[np.arange(len(earlier)) != 5]), tmp_path)
+    revised = daily_rows.copy()
+    revised.iloc[10, revised.columns.get_loc('demand_mwh')] += 5000
+    updated = stats_accumulators.update_state(state, revised, {'2024-01', '2024-02'})
+    assert_same_statistics(updated, stats_accumulators.accumulate(revised))
+
+def test_update_leaves_other_months_untouched(daily_rows):
+    state = stats_accumulators.accumulate(daily_rows)
+    # Only February's rows are passed, so January's cells must be kept as they were
+    updated = stats_accumulators.update_state(state, daily_rows[daily_rows.index >= '2024-02-01'], {'2024-02'})
+    assert_same_statistics(updated, state)
+
+def test_update_drops_cities_no_longer_present(daily_rows):
+    state = stats_accumulators.accumulate(daily_rows)
+    remaining = daily_rows[daily_rows['city'] != 'C']
+    updated = stats_accumulators.update_state(state, remaining, {'2024-01', '2024-02', '2024-03'})
+    assert_same_statistics(updated, stats_accumulators.accumulate(remaining))
+
+def test_state_of_older_version_is_ignored(tmp_path):
+    path = tmp_path / 'accumulators.json'
+    path.write_text('{"A": {"rows": 1, "digest": 0}}')
+    assert stats_accumulators.load_state(str(path)) == {}